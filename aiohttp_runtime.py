@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from config import BOT_TOKEN, ALLOWED_UPDATES, AIOHTTP_CONNECTION_POOL_SIZE, AIOHTTP_HANDLER_THREADS
+from deletion_queue import get_deletion_queue
+from raid import recover_lockdowns
+from outbound import AsyncOutboundDispatcher, METHOD_LANES, LANE_LOW, chat_id_of, on_notify_sent
+from member_cache import member_cache
+from bot_permissions import bot_permissions
+
+logger = logging.getLogger(__name__)
+
+# Декораторы AsyncTeleBot, через которые handlers/ регистрируют обработчики
+HANDLER_DECORATORS = {
+    'message_handler', 'edited_message_handler', 'callback_query_handler',
+    'my_chat_member_handler', 'chat_member_handler'
+}
+
+
+def _event_chat_id(event):
+    """Чат сообщения, callback-запроса или изменения участника; None, если чата нет."""
+    chat = getattr(event, 'chat', None)
+    if chat is not None:
+        return chat.id
+    message = getattr(event, 'message', None)
+    return message.chat.id if message is not None else None
+
+
+class AsyncBotBridge:
+    """Синхронный фасад AsyncTeleBot для обработчиков из handlers/.
+
+    Обработчики остаются синхронными: каждая зарегистрированная корутина
+    запускает обработчик в пуле из AIOHTTP_HANDLER_THREADS потоков, так что
+    одновременно обрабатывается не больше AIOHTTP_HANDLER_THREADS обновлений.
+    Запросы к Bot API идут без потоков: они ставятся в AsyncOutboundDispatcher
+    на цикле событий и выполняются через общий keep-alive пул aiohttp, а поток
+    обработчика только ждёт ответа. Обновления одного чата обрабатываются по
+    очереди, как в режиме polling.
+    """
+
+    def __init__(self, async_bot, loop, executor, dispatcher=None):
+        self.async_bot = async_bot
+        self.loop = loop
+        self.executor = executor
+        self.dispatcher = dispatcher or AsyncOutboundDispatcher()
+        self._chat_locks = {}  # chat_id -> [asyncio.Lock, число ожидающих]; только на цикле событий
+
+    def __getattr__(self, name):
+        attr = getattr(self.async_bot, name)
+        if name in HANDLER_DECORATORS:
+            return self._wrap_decorator(attr)
+        if name in METHOD_LANES:
+            def call(*args, **kwargs):
+                return self._submit(name, attr, args, kwargs, chat_id_of(name, args, kwargs)).result()
+            return call
+        if asyncio.iscoroutinefunction(attr):
+            def call(*args, **kwargs):
+                return asyncio.run_coroutine_threadsafe(attr(*args, **kwargs), self.loop).result()
+            return call
+        return attr
+
+    def notify(self, chat_id, text, callback=None, **kwargs):
+        """Отправляет уведомление низкого приоритета; callback(message) вызывается после отправки."""
+        future = self._submit('send_message', self.async_bot.send_message, (chat_id, text), kwargs, chat_id, LANE_LOW)
+        return on_notify_sent(future, chat_id, callback)
+
+    def _submit(self, method, func, args, kwargs, chat_id, lane=None):
+        """Ставит запрос в очередь цикла событий из потока обработчика; возвращает concurrent Future."""
+        return asyncio.run_coroutine_threadsafe(
+            self.dispatcher.submit(method, func, args, kwargs, chat_id, lane), self.loop
+        )
+
+    def _wrap_decorator(self, decorator):
+        def factory(*args, **kwargs):
+            register = decorator(*args, **kwargs)
+
+            def wrapper(handler):
+                async def run(update):
+                    member_cache.remember_event(update)
+                    chat_id = _event_chat_id(update)
+                    if chat_id is None:
+                        await self.loop.run_in_executor(self.executor, handler, update)
+                        return
+                    # Ожидающие обновления чата не занимают потоки пула
+                    entry = self._chat_locks.get(chat_id)
+                    if entry is None:
+                        entry = self._chat_locks[chat_id] = [asyncio.Lock(), 0]
+                    entry[1] += 1
+                    try:
+                        async with entry[0]:
+                            await self.loop.run_in_executor(self.executor, handler, update)
+                    finally:
+                        entry[1] -= 1
+                        if not entry[1]:
+                            del self._chat_locks[chat_id]
+                run.__name__ = handler.__name__
+                register(run)
+                return handler
+            return wrapper
+        return factory
+
+
+async def _run(db, register_handlers):
+    # Все запросы к Bot API идут через одну aiohttp-сессию с пулом соединений этого размера
+    asyncio_helper.REQUEST_LIMIT = AIOHTTP_CONNECTION_POOL_SIZE
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(AIOHTTP_HANDLER_THREADS, thread_name_prefix="handler")
+    loop.set_default_executor(executor)
+    async_bot = AsyncTeleBot(BOT_TOKEN)
+    bot = AsyncBotBridge(async_bot, loop, executor)
+    register_handlers(bot, db)
+    db.start_maintenance()
+    # Вызовы Bot API через мост блокируют поток, поэтому выполняются вне цикла событий
+    await loop.run_in_executor(executor, bot_permissions.load_identity, bot)
+    await loop.run_in_executor(executor, get_deletion_queue(bot, db).recover)
+    await loop.run_in_executor(executor, recover_lockdowns, bot, db)
+    try:
+        logger.info("Бот запущен в режиме aiohttp!")
+        await async_bot.infinity_polling(allowed_updates=ALLOWED_UPDATES)
+    finally:
+        await bot.dispatcher.shutdown()
+        await async_bot.close_session()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_aiohttp(db, register_handlers):
+    """Запускает бота на AsyncTeleBot с общим пулом HTTP-соединений."""
+    asyncio.run(_run(db, register_handlers))
@@ -0,0 +1,60 @@
+"""Сравнение FilterEngine с прямым re.search по строкам из config.
+
+Запуск: python benchmark_filters.py [путь к csv]
+
+Проверяет, что для каждого сообщения датасета (и для склеек по несколько
+сообщений, похожих на длинные посты) движок возвращает то же совпадение, и
+печатает время обоих вариантов.
+"""
+import csv
+import re
+import sys
+import time
+from config import PROFANITY_REGEX, LINK_REGEX
+from filters import engine, ahocorasick
+
+
+def load_texts(path):
+    with open(path, encoding='utf-8') as f:
+        texts = [row[0] for row in csv.reader(f, delimiter=';') if row and row[0].strip()]
+    # Длинные сообщения: по 20 строк датасета через пробел
+    texts += [' '.join(texts[i:i + 20]) for i in range(0, len(texts), 20)]
+    return texts
+
+
+def span(match):
+    return match.span() if match else None
+
+
+def measure(func, texts, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            func(text)
+    return time.perf_counter() - start
+
+
+def main(path='model/data/DATASET.csv', rounds=5):
+    texts = load_texts(path)
+    mismatches = 0
+    for text in texts:
+        if span(re.search(PROFANITY_REGEX, text.lower())) != span(engine.find_profanity(text)):
+            mismatches += 1
+            print(f"Расхождение (мат): {text!r}")
+        if span(re.search(LINK_REGEX, text)) != span(engine.find_link(text)):
+            mismatches += 1
+            print(f"Расхождение (ссылки): {text!r}")
+
+    print(f"Сообщений: {len(texts)}, префильтр: {'Aho-Corasick' if ahocorasick else 'regex'}, расхождений: {mismatches}")
+    for name, baseline, compiled in (
+        ('мат', lambda text: re.search(PROFANITY_REGEX, text.lower()), engine.find_profanity),
+        ('ссылки', lambda text: re.search(LINK_REGEX, text), engine.find_link),
+    ):
+        before = measure(baseline, texts, rounds)
+        after = measure(compiled, texts, rounds)
+        print(f"{name}: re.search {before * 1000:.1f} мс, FilterEngine {after * 1000:.1f} мс, ускорение x{before / after:.1f}")
+    return mismatches
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main(*sys.argv[1:2]) else 0)
@@ -0,0 +1,50 @@
+import math
+
+MASK64 = (1 << 64) - 1
+
+
+class BloomFilter:
+    """Фильтр Блума для целых чисел (id пользователей).
+
+    Ответ "нет" точный, ответ "возможно" бывает ложным с вероятностью около
+    error_rate, пока добавлено не больше capacity элементов. Позиции битов
+    получаются двойным хешированием из двух перемешиваний числа, без
+    криптографических хешей, так что проверка - несколько умножений.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 64)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        value &= MASK64
+        first = (value * 0x9E3779B97F4A7C15) & MASK64
+        second = ((value ^ (value >> 31)) * 0xBF58476D1CE4E5B9 & MASK64) | 1
+        return [((first + i * second) & MASK64) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        # Позиции считаются по одной: для отсутствующих значений проверка обычно
+        # заканчивается на первом же нулевом бите
+        value &= MASK64
+        position = (value * 0x9E3779B97F4A7C15) & MASK64
+        step = ((value ^ (value >> 31)) * 0xBF58476D1CE4E5B9 & MASK64) | 1
+        bits = self.bits
+        size = self.size
+        for _ in range(self.hashes):
+            index = position % size
+            if not bits[index >> 3] & (1 << (index & 7)):
+                return False
+            position = (position + step) & MASK64
+        return True
+
+    def __len__(self):
+        return self.count
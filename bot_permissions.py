@@ -0,0 +1,67 @@
+import logging
+import threading
+import time
+from config import BOT_PERMISSIONS_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class BotPermissions:
+    """Идентичность бота и снимки его прав в группах.
+
+    get_me выполняется один раз при запуске. Права в группе запрашиваются при
+    первом обращении и дальше обновляются из my_chat_member, поэтому проверки
+    прав перед действием не требуют запросов к Bot API.
+    """
+
+    def __init__(self, ttl=BOT_PERMISSIONS_TTL_SECONDS):
+        self.ttl = ttl
+        self.me = None
+        self._chats = {}
+        self._lock = threading.Lock()
+
+    def load_identity(self, bot):
+        """Запрашивает get_me, если идентичность бота ещё не известна."""
+        with self._lock:
+            if self.me is None:
+                self.me = bot.get_me()
+                logger.info(f"Бот @{self.me.username} (id {self.me.id})")
+            return self.me
+
+    def get(self, bot, chat_id):
+        """Снимок прав бота в группе (ChatMember)."""
+        with self._lock:
+            entry = self._chats.get(chat_id)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        member = bot.get_chat_member(chat_id, self.load_identity(bot).id)
+        self.update(chat_id, member)
+        return member
+
+    def update(self, chat_id, member):
+        """Сохраняет права бота из обновления my_chat_member."""
+        with self._lock:
+            self._chats[chat_id] = (time.monotonic() + self.ttl, member)
+
+    def forget(self, chat_id):
+        with self._lock:
+            self._chats.pop(chat_id, None)
+
+    def can_restrict(self, bot, chat_id):
+        return self._has(bot, chat_id, 'can_restrict_members')
+
+    def can_delete(self, bot, chat_id):
+        return self._has(bot, chat_id, 'can_delete_messages')
+
+    def _has(self, bot, chat_id, right):
+        try:
+            member = self.get(bot, chat_id)
+        except Exception as e:
+            # Права неизвестны: действие всё равно выполняется, и решает ответ Bot API.
+            # Иначе из-за временной ошибки нарушение осталось бы в чате
+            logger.error(f"Ошибка получения прав бота в чате {chat_id}, действие будет выполнено без проверки: {e}")
+            return True
+        return member.status == 'creator' or bool(getattr(member, right, False))
+
+
+bot_permissions = BotPermissions()
@@ -6,9 +6,134 @@ load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 BOT_INVITE_URL = os.getenv("BOT_INVITE_URL")
 
+# Режим работы: 'polling' (TeleBot в потоках), 'aiohttp' (AsyncTeleBot с общим пулом соединений,
+# обработчики в потоках), 'webhook' (встроенный HTTP-сервер с очередью обновлений) или 'supervisor' (несколько процессов)
+RUNTIME_MODE = os.getenv('RUNTIME_MODE', 'polling')
+ALLOWED_UPDATES = ["message", "edited_message", "chat_member", "my_chat_member", "callback_query"]
+AIOHTTP_CONNECTION_POOL_SIZE = 100  # Размер keep-alive пула aiohttp
+AIOHTTP_HANDLER_THREADS = 64  # Потоки для синхронных обработчиков; ограничивают число обновлений, обрабатываемых одновременно
+POLLING_TIMEOUT_SECONDS = 20  # Таймаут long polling getUpdates
+
+# Разбор обновлений в режимах polling и webhook: обновления чата всегда попадают в один поток
+UPDATE_SHARDS = 8  # Потоки-обработчики, у каждого своя очередь
+UPDATE_SHARD_QUEUE_SIZE = 200  # Максимум принятых, но ещё не обработанных обновлений в очереди потока
+
+# Режим 'supervisor': один процесс принимает обновления, N процессов main.py в режиме 'worker' их обрабатывают
+SUPERVISOR_INGRESS = os.getenv('SUPERVISOR_INGRESS', 'polling')  # 'polling' или 'webhook'
+SUPERVISOR_WORKERS = int(os.getenv('SUPERVISOR_WORKERS', os.cpu_count() or 2))
+SUPERVISOR_SOCKET = os.getenv('SUPERVISOR_SOCKET', '/tmp/netspamy-supervisor.sock')
+SUPERVISOR_RESTART_DELAY_SECONDS = 5
+SUPERVISOR_PENDING_LIMIT = 1000  # Обновлений, ожидающих перезапуска обработчика
+
+# Webhook. TLS обычно завершается на reverse proxy, который проксирует на WEBHOOK_HOST:WEBHOOK_PORT
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Публичный URL; если не задан, setWebhook не вызывается
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # Обязателен; сверяется с заголовком X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = '/webhook'
+WEBHOOK_ENQUEUE_TIMEOUT_SECONDS = 2  # Сколько ждать места в очереди перед ответом 503
+WEBHOOK_MAX_BODY_BYTES = 1024 * 1024
+
 # Время жизни сообщений бота в основной группе (в секундах)
 MESSAGE_LIFETIME_SECONDS = 30
 
+# Очередь удаления сообщений бота
+DELETION_BATCH_WINDOW_SECONDS = 1  # Удаления, наступающие в этом окне, отправляются одним запросом
+DELETION_BATCH_SIZE = 100  # Лимит deleteMessages на один запрос
+
+# Хранилище состояния: 'sqlite' (локальный bot.db) или 'redis' (общее для нескольких процессов)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+REDIS_KEY_PREFIX = 'netspamy'
+STORAGE_CACHE_TTL_SECONDS = 60  # Время жизни локального кэша настроек и админов
+
+# Кэш пользователей для get_username, заполняется из входящих обновлений
+MEMBER_CACHE_SIZE = 10000
+MEMBER_CACHE_TTL_SECONDS = 3600
+
+# Снимки прав бота в группах обновляются из my_chat_member; это срок на случай пропущенных обновлений
+BOT_PERMISSIONS_TTL_SECONDS = 3600
+
+# Потоки для параллельных вызовов Bot API при модерации нарушений
+MODERATION_WORKERS = 16
+
+# Детектор рейдов: столько вступлений за окно переводит чат в блокировку
+RAID_JOIN_THRESHOLD = 10
+RAID_WINDOW_SECONDS = 60
+RAID_LOCKDOWN_SECONDS = 600  # Продлевается, пока вступления продолжаются
+
+# Антифлуд: лимит по умолчанию (сообщений, секунд); группа задаёт свой командой /floodlimit
+FLOOD_DEFAULT_LIMIT = (10, 10)
+FLOOD_IDLE_SECONDS = 300  # Счётчики пользователей, молчащих дольше, удаляются из памяти
+FLOOD_MUTE_SECONDS = 600
+
+# Поиск одинаковых рассылок по всем чатам (MinHash LSH текста после clean_text).
+# Значения осторожные: одно объявление честно публикуют в нескольких группах
+# сразу, поэтому рассылкой считается только почти дословная копия длинного
+# текста, встреченная во многих чатах. Снижать порог стоит, только если
+# спам проходит, а жалоб на ложные удаления нет
+DUPLICATE_CHAT_THRESHOLD = 5  # Сообщение, встреченное в большем числе чатов за окно, считается рассылкой
+DUPLICATE_WINDOW_SECONDS = 3600
+DUPLICATE_INDEX_SIZE = 50000  # Отпечатков в памяти
+DUPLICATE_MIN_WORDS = 8  # Короткие сообщения ("всем привет, кто продаёт ...") не сравниваются
+DUPLICATE_MIN_SIMILARITY = 0.8  # Оценка похожести по Жаккару, начиная с которой сообщения считаются копиями
+
+# Отпечатки недавних сообщений: при правке проверяются только этапы, входные данные которых изменились
+EDIT_CACHE_MESSAGES_PER_CHAT = 200  # Более старые правки проверяются целиком
+EDIT_CACHE_CHATS = 2000  # Чаты, давно не писавшие, вытесняются первыми
+
+# Кольцевой буфер последних сообщений чата для /purge и проверки старых сообщений
+RECENT_MESSAGES_PER_CHAT = 500
+RECENT_MESSAGE_TEXT_CHARS = 1000  # Длиннее модель всё равно не читает (128 токенов)
+RECENT_MESSAGES_MAX_BYTES = 64 * 1024 * 1024  # Сверх лимита вытесняются давно не писавшие чаты
+PURGE_DEFAULT_COUNT = 50  # Сообщений, удаляемых /purge без аргумента
+RETRO_SCAN_BATCH_SIZE = 32  # Текстов на один прогон модели
+
+# Списки доменов для фильтра ссылок: по домену в строке, перечитываются при изменении файла
+LINK_ALLOWLIST_FILE = os.getenv('LINK_ALLOWLIST_FILE', 'link_allowlist.txt')
+LINK_DENYLIST_FILE = os.getenv('LINK_DENYLIST_FILE', 'link_denylist.txt')  # Запрещены во всех группах с фильтром ссылок
+LINK_LISTS_CHECK_SECONDS = 30  # Как часто проверяется время изменения файлов
+
+# Проверка содержимого файлов по сигнатурам (в дополнение к расширению)
+FILE_SNIFFING = os.getenv('FILE_SNIFFING', '1') == '1'
+FILE_SNIFF_HEAD_BYTES = 8 * 1024  # Скачивается только начало файла
+FILE_SNIFF_TAIL_BYTES = 64 * 1024 + 22  # Конец ZIP, где лежит запись о центральном каталоге
+FILE_SNIFF_MAX_DIRECTORY_BYTES = 1024 * 1024  # Больший каталог ZIP не скачивается
+FILE_SNIFF_MAX_STREAM_BYTES = 2 * 1024 * 1024  # Сколько читать, если сервер не поддерживает Range
+FILE_SNIFF_MAX_FILE_BYTES = 20 * 1024 * 1024  # Больше Bot API не отдаёт
+FILE_SNIFF_TIMEOUT_SECONDS = 5
+FILE_VERDICT_CACHE_SIZE = 50000  # Вердиктов по file_unique_id в памяти
+FILE_VERDICT_TTL_SECONDS = 24 * 60 * 60
+
+# Известные спам-картинки: dHash самой маленькой миниатюры фото, поиск по расстоянию Хэмминга
+SPAM_IMAGE_MAX_DISTANCE = 6  # Различающихся бит из 64, при которых картинки считаются одинаковыми
+
+# Общий бан-лист: фильтр Блума в памяти перед таблицей забаненных
+GLOBAL_BAN_BLOOM_CAPACITY = 100000  # Фильтр пересоздаётся больше, когда записей становится больше
+GLOBAL_BAN_BLOOM_ERROR_RATE = 0.001  # Доля пользователей не из списка, для которых нужен запрос к хранилищу
+GLOBAL_BAN_REFRESH_SECONDS = 300  # Период перестроения фильтра из хранилища (баны из других процессов)
+
+# Лимиты исходящих запросов к Bot API
+OUTBOUND_GLOBAL_RATE = 30  # Запросов в секунду на всего бота
+OUTBOUND_GLOBAL_BURST = 30
+OUTBOUND_CHAT_RATE = 20 / 60  # Сообщений в секунду в один чат (Telegram: 20 в минуту для групп)
+OUTBOUND_CHAT_BURST = 5
+OUTBOUND_WORKERS = 8  # Потоки, выполняющие запросы
+OUTBOUND_MAX_QUEUE = 500  # При переполнении отбрасываются уведомления низкого приоритета, остальные запросы ставятся сверх лимита
+OUTBOUND_MAX_RETRIES = 3  # Повторы после ответа 429
+OUTBOUND_MAX_CHAT_BUCKETS = 10000  # После этого числа простаивающие корзины чатов удаляются
+
+# Фоновая очистка базы данных
+DB_CLEANUP_INTERVAL_SECONDS = 10 * 60  # Период между проходами очистки
+DB_CLEANUP_BATCH_SIZE = 500  # Сколько строк удаляется за одну транзакцию
+DB_VACUUM_INTERVAL_SECONDS = 24 * 60 * 60  # Период incremental vacuum
+WELCOME_MESSAGE_TTL_DAYS = 30  # Срок хранения id приветственных сообщений в личке
+
+# Хранение жалоб
+REPORTS_RETENTION_DAYS = 90  # Жалобы старше этого срока переносятся в архив
+REPORTS_ARCHIVE_DB = "reports_archive.db"  # Архивная база, подключаемая через ATTACH
+REPORTS_COUNT_WINDOW_SECONDS = 24 * 60 * 60  # Окно подсчёта жалоб на пользователя
+
 # Регулярные выражения для матов
 PROFANITY_REGEX = r"(?iux)(?<![а-яё])(?:(?:(?:у|[нз]а|(?:хитро|не)?вз?[ыьъ]|с[ьъ]|(?:и|ра)[зс]ъ?|(?:о[тб]|п[оа]д)[ьъ]?|(?:\S(?=[а-яё]))+?[оаеи-])-?)?(?:[её](?:б(?!о[рй]|рач)|п[уа](?:ц|тс))|и[пб][ае][тцд][ьъ]).*?|(?:(?:н[иеа]|(?:ра|и)[зс]|[зд]?[ао](?:т|дн[оа])?|с(?:м[еи])?|а[пб]ч|в[ъы]?|пр[еи])-?)?ху(?:[яйиеёю]|л+и(?!ган)).*?|бл(?:[эя]|еа?)(?:[дт][ьъ]?)?|\S*?(?:п(?:[иеё]зд|ид[аое]?р|ед(?:р(?!)|[аое]р|ик)|ох)|бля(?:|тс)|[ое]ху[яйиеё]|хуйн).*?|(?:о[тб]?|про|на|вы)?м(?:анд(?:[textu]|[ао]|^.*?|юк(?:ов|[ауи])?|е[нт]ь|ища)|уд(?:[яаиое].+?|е?н(?:[ьюия]|ей))|[ао]л[ао]ф[ьъ](?:[яиюе]|[еёо]й))|елд[ауые].*?|ля[тд]|(?:[нз]а|по)х)(?![а-яё])"
 
@@ -23,5 +148,9 @@ DEFAULT_SETTINGS = {
     'file_filter': True,  # Фильтр опасных файлов
     'report_system': False,  # Система жалоб
     'link_filter': False,  # Фильтр ссылок
-    'captcha_enabled': True  # Капча для новых пользователей
+    'captcha_enabled': True,  # Капча для новых пользователей
+    'flood_filter': True,  # Антифлуд
+    'spam_filter': True,  # Рассылки одного текста по многим чатам
+    'global_bans': False,  # Общий бан-лист групп, включивших эту настройку
+    'retro_scan': False  # Проверка недавних сообщений при включении фильтра
 }
\ No newline at end of file
@@ -1,255 +1,321 @@
-import sqlite3
-import json
 import logging
-from datetime import datetime
-from config import BOT_INVITE_URL, DEFAULT_SETTINGS
+import threading
+import time
+from config import (
+    BOT_INVITE_URL, STORAGE_BACKEND, STORAGE_CACHE_TTL_SECONDS,
+    GLOBAL_BAN_BLOOM_CAPACITY, GLOBAL_BAN_BLOOM_ERROR_RATE, GLOBAL_BAN_REFRESH_SECONDS
+)
+from bloom import BloomFilter
 
 logger = logging.getLogger(__name__)
 
+
+def create_storage(backend=STORAGE_BACKEND, **kwargs):
+    """Создаёт хранилище выбранного типа."""
+    if backend == 'sqlite':
+        from storage.sqlite_storage import SQLiteStorage
+        return SQLiteStorage(**kwargs)
+    if backend == 'redis':
+        from storage.redis_storage import RedisStorage
+        return RedisStorage(**kwargs)
+    raise ValueError(f"Неизвестный тип хранилища: {backend}")
+
+
 class Database:
-    def __init__(self, db_name="bot.db"):
+    """Доступ к состоянию бота поверх подключаемого хранилища.
+
+    Настройки, админы и лог-чаты читаются на каждое сообщение, поэтому
+    кэшируются локально. Записи сбрасывают кэш в этом процессе и рассылают
+    инвалидацию остальным процессам через хранилище.
+    """
+
+    def __init__(self, db_name="bot.db", storage=None, **kwargs):
         """Инициализация соединения с базой данных."""
+        if storage is None:
+            if STORAGE_BACKEND == 'sqlite':
+                kwargs.setdefault('db_name', db_name)
+            storage = create_storage(STORAGE_BACKEND, **kwargs)
+        self.storage = storage
         self.db_name = db_name
-        self.conn = sqlite3.connect(db_name, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self.cursor = self.conn.cursor()
-        self.init_db()
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._global_bans_lock = threading.Lock()
+        self._load_global_bans()
+        self.storage.subscribe_invalidations(self._drop_cached)
         logger.info("Database connection initialized")
 
-    def init_db(self):
-        """Инициализация всех таблиц в базе данных."""
-        try:
-            # Создаем таблицу groups с валидным JSON для DEFAULT_SETTINGS
-            default_settings_json = json.dumps(DEFAULT_SETTINGS)
-            self.cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS groups (
-                    chat_id INTEGER PRIMARY KEY,
-                    settings TEXT DEFAULT '{}',
-                    info_rules TEXT DEFAULT 'Здравствуйте, пока!'
-                )
-                """.format(default_settings_json.replace('"', '\\"'))
-            )
-
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS admins (
-                    chat_id INTEGER,
-                    user_id INTEGER,
-                    PRIMARY KEY (chat_id, user_id)
-                )
-            """)
-
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS warnings (
-                    chat_id INTEGER,
-                    user_id INTEGER,
-                    count INTEGER DEFAULT 0,
-                    PRIMARY KEY (chat_id, user_id)
-                )
-            """)
-
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS reports (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    chat_id INTEGER,
-                    reporter_id INTEGER,
-                    reported_user_id INTEGER,
-                    reason TEXT,
-                    message_id INTEGER,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS welcome_messages (
-                    user_id INTEGER PRIMARY KEY,
-                    message_id INTEGER
-                )
-            """)
-
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS chat_members (
-                    chat_id INTEGER,
-                    user_id INTEGER,
-                    PRIMARY KEY (chat_id, user_id)
-                )
-            """)
-
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS report_chats (
-                    chat_id INTEGER PRIMARY KEY,
-                    log_chat_id INTEGER
-                )
-            """)
-
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS captcha_status (
-                    chat_id INTEGER,
-                    user_id INTEGER,
-                    passed INTEGER DEFAULT 0,
-                    PRIMARY KEY (chat_id, user_id)
-                )
-            """)
-
-            self.conn.commit()
-            logger.info("All tables initialized successfully")
-
-        except sqlite3.Error as e:
-            logger.error(f"Database initialization error: {e}")
-            raise
-
     def __del__(self):
         """Закрытие соединения с базой данных."""
-        if self.conn:
-            self.conn.close()
-            logger.info("Database connection closed")
+        self.close()
+
+    def close(self):
+        storage = getattr(self, 'storage', None)
+        if storage:
+            storage.close()
+            self.storage = None
+
+    def _cached(self, kind, chat_id, loader):
+        key = (kind, chat_id)
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry and entry[1] > now:
+                return entry[0]
+        value = loader(chat_id)
+        with self._cache_lock:
+            self._cache[key] = (value, now + STORAGE_CACHE_TTL_SECONDS)
+        return value
+
+    def _drop_cached(self, kind, chat_id):
+        # Для общего бан-листа в chat_id передаётся id пользователя
+        if kind == 'global_ban':
+            self._global_bans.add(chat_id)
+        elif kind == 'global_unban':
+            self._load_global_bans()
+            kind = 'global_ban'
+        with self._cache_lock:
+            if kind == '*':
+                for key in [key for key in self._cache if key[1] == chat_id]:
+                    del self._cache[key]
+            else:
+                self._cache.pop((kind, chat_id), None)
+
+    def _invalidate(self, kind, chat_id):
+        self._drop_cached(kind, chat_id)
+        self.storage.publish_invalidation(kind, chat_id)
+
+    def _load_global_bans(self, if_stale=False):
+        # Удалить значение из фильтра Блума нельзя, поэтому после разбана он строится заново
+        with self._global_bans_lock:
+            if if_stale and not self._global_bans_stale():
+                return
+            user_ids = self.storage.get_global_ban_ids()
+            bloom = BloomFilter(max(GLOBAL_BAN_BLOOM_CAPACITY, 2 * len(user_ids)), GLOBAL_BAN_BLOOM_ERROR_RATE)
+            for user_id in user_ids:
+                bloom.add(user_id)
+            self._global_bans = bloom
+            self._global_bans_expire = time.monotonic() + GLOBAL_BAN_REFRESH_SECONDS
+
+    def _global_bans_stale(self):
+        return time.monotonic() > self._global_bans_expire or len(self._global_bans) > self._global_bans.capacity
+
+    def start_maintenance(self):
+        """Запуск фоновой очистки хранилища."""
+        self.storage.start_maintenance()
 
     def add_chat_member(self, chat_id, user_id):
         """Добавление участника чата."""
-        try:
-            self.cursor.execute("INSERT OR IGNORE INTO chat_members (chat_id, user_id) VALUES (?, ?)", (chat_id, user_id))
-            self.cursor.execute("INSERT OR IGNORE INTO captcha_status (chat_id, user_id, passed) VALUES (?, ?, 0)", (chat_id, user_id))
-            self.conn.commit()
-        except sqlite3.Error as e:
-            logger.error(f"Error adding chat member: {e}")
+        self.storage.add_chat_member(chat_id, user_id)
 
     def remove_chat_member(self, chat_id, user_id):
         """Удаление участника чата."""
-        try:
-            self.cursor.execute("DELETE FROM chat_members WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
-            self.cursor.execute("DELETE FROM captcha_status WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
-            self.conn.commit()
-        except sqlite3.Error as e:
-            logger.error(f"Error removing chat member: {e}")
+        self.storage.remove_chat_member(chat_id, user_id)
 
     def get_chat_members(self, chat_id):
         """Получение списка участников чата."""
-        try:
-            self.cursor.execute("SELECT user_id FROM chat_members WHERE chat_id = ?", (chat_id,))
-            return [row['user_id'] for row in self.cursor.fetchall()]
-        except sqlite3.Error as e:
-            logger.error(f"Error getting chat members: {e}")
-            return []
+        return self.storage.get_chat_members(chat_id)
 
     def add_group(self, chat_id):
         """Добавление новой группы."""
-        try:
-            self.cursor.execute("INSERT OR IGNORE INTO groups (chat_id, settings) VALUES (?, ?)", (chat_id, json.dumps(DEFAULT_SETTINGS)))
-            self.conn.commit()
-            logger.info(f"Группа {chat_id} добавлена с настройками: {DEFAULT_SETTINGS}")
-        except sqlite3.Error as e:
-            logger.error(f"Error adding group {chat_id}: {e}")
+        self.storage.add_group(chat_id)
+        self._invalidate('settings', chat_id)
+
+    def purge_group(self, chat_id):
+        """Удаление всех данных группы, из которой удалён бот."""
+        log_chat_id = self.storage.get_report_chat(chat_id)
+        self.storage.purge_group(chat_id)
+        self._invalidate('*', chat_id)
+        if log_chat_id:
+            self._invalidate('is_report_chat', log_chat_id)
+        # Чат мог быть лог-чатом других групп, поэтому сбрасываем и их ссылки на него
+        with self._cache_lock:
+            for key in [key for key in self._cache if key[0] == 'report_chat']:
+                del self._cache[key]
 
     def mark_existing_members(self, chat_id, bot):
         """Помечает всех текущих участников группы как прошедших капчу."""
         try:
             chat_members = bot.get_chat_administrators(chat_id)
-            user_ids = [member.user.id for member in chat_members]
-            for user_id in user_ids:
-                self.cursor.execute("""
-                    INSERT OR REPLACE INTO chat_members (chat_id, user_id)
-                    VALUES (?, ?)
-                """, (chat_id, user_id))
-                self.cursor.execute("""
-                    INSERT OR REPLACE INTO captcha_status (chat_id, user_id, passed)
-                    VALUES (?, ?, 1)
-                """, (chat_id, user_id))
-            self.conn.commit()
+            self.storage.mark_members_passed(chat_id, [member.user.id for member in chat_members])
             logger.info(f"Все текущие участники группы {chat_id} помечены как прошедшие капчу")
         except Exception as e:
             logger.error(f"Ошибка при пометке текущих участников группы {chat_id}: {e}")
 
     def get_all_groups(self):
         """Получение списка всех групп."""
-        self.cursor.execute("SELECT chat_id FROM groups")
-        return [row['chat_id'] for row in self.cursor.fetchall()]
+        return self.storage.get_all_groups()
 
     def update_admins(self, chat_id, admin_ids):
         """Обновление списка администраторов."""
-        self.cursor.execute("DELETE FROM admins WHERE chat_id = ?", (chat_id,))
-        for admin_id in admin_ids:
-            self.cursor.execute("INSERT OR IGNORE INTO admins (chat_id, user_id) VALUES (?, ?)", (chat_id, admin_id))
-        self.conn.commit()
+        self.storage.update_admins(chat_id, admin_ids)
+        self._invalidate('admins', chat_id)
 
     def get_admins(self, chat_id):
         """Получение списка администраторов группы."""
-        self.cursor.execute("SELECT user_id FROM admins WHERE chat_id = ?", (chat_id,))
-        return [row['user_id'] for row in self.cursor.fetchall()]
+        return list(self._cached('admins', chat_id, self.storage.get_admins))
 
     def add_warning(self, chat_id, user_id):
         """Добавление предупреждения пользователю."""
-        self.cursor.execute("""
-            INSERT OR REPLACE INTO warnings (chat_id, user_id, count)
-            VALUES (?, ?, COALESCE((SELECT count FROM warnings WHERE chat_id = ? AND user_id = ?), 0) + 1)
-        """, (chat_id, user_id, chat_id, user_id))
-        self.conn.commit()
-        self.cursor.execute("SELECT count FROM warnings WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
-        return self.cursor.fetchone()['count']
+        return self.storage.add_warning(chat_id, user_id)
 
     def reset_warnings(self, chat_id, user_id):
         """Сброс предупреждений пользователя."""
-        self.cursor.execute("DELETE FROM warnings WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
-        self.conn.commit()
+        self.storage.reset_warnings(chat_id, user_id)
 
     def add_report(self, chat_id, reporter_id, reported_user_id, reason, message_id):
         """Добавление репорта."""
-        self.cursor.execute("""
-            INSERT INTO reports (chat_id, reporter_id, reported_user_id, reason, message_id)
-            VALUES (?, ?, ?, ?, ?)
-        """, (chat_id, reporter_id, reported_user_id, reason, message_id))
-        self.conn.commit()
+        self.storage.add_report(chat_id, reporter_id, reported_user_id, reason, message_id)
+
+    def count_user_reports(self, chat_id, user_id, window_seconds, include_archive=False):
+        """Количество жалоб на пользователя в группе за последние window_seconds секунд."""
+        return self.storage.count_user_reports(chat_id, user_id, window_seconds, include_archive)
 
     def get_group_settings(self, chat_id):
         """Получение настроек группы."""
-        self.cursor.execute("SELECT settings FROM groups WHERE chat_id = ?", (chat_id,))
-        row = self.cursor.fetchone()
-        return json.loads(row['settings']) if row else DEFAULT_SETTINGS
+        return dict(self._cached('settings', chat_id, self.storage.get_group_settings))
 
     def update_group_setting(self, chat_id, setting, value):
         """Обновление настройки группы."""
-        settings = self.get_group_settings(chat_id)
-        settings[setting] = value
-        self.cursor.execute("UPDATE groups SET settings = ? WHERE chat_id = ?", (json.dumps(settings), chat_id))
-        self.conn.commit()
+        self.storage.update_group_setting(chat_id, setting, value)
+        self._invalidate('settings', chat_id)
 
     def get_info_rules(self, chat_id):
         """Получение правил группы."""
-        self.cursor.execute("SELECT info_rules FROM groups WHERE chat_id = ?", (chat_id,))
-        row = self.cursor.fetchone()
-        return row['info_rules'] if row else "Здравствуйте, пока!"
+        return self.storage.get_info_rules(chat_id)
 
     def update_info_rules(self, chat_id, new_rules):
         """Обновление правил группы."""
-        self.cursor.execute("UPDATE groups SET info_rules = ? WHERE chat_id = ?", (new_rules, chat_id))
-        self.conn.commit()
+        self.storage.update_info_rules(chat_id, new_rules)
+
+    def add_banned_words(self, chat_id, words):
+        """Добавление запрещённых слов группы."""
+        if words:
+            self.storage.add_banned_words(chat_id, words)
+            self._invalidate('banned_words', chat_id)
+
+    def remove_banned_words(self, chat_id, words):
+        """Удаление запрещённых слов группы."""
+        if words:
+            self.storage.remove_banned_words(chat_id, words)
+            self._invalidate('banned_words', chat_id)
+
+    def get_banned_words(self, chat_id):
+        """Запрещённые слова группы. Кортеж не меняется, пока список не изменят."""
+        return self._cached('banned_words', chat_id, lambda chat_id: tuple(self.storage.get_banned_words(chat_id)))
+
+    def set_link_domains(self, chat_id, domains, allowed):
+        """Добавление доменов в список разрешённых или запрещённых группы."""
+        if domains:
+            self.storage.set_link_domains(chat_id, domains, allowed)
+            self._invalidate('link_domains', chat_id)
+
+    def remove_link_domains(self, chat_id, domains):
+        """Удаление доменов из списков группы."""
+        if domains:
+            self.storage.remove_link_domains(chat_id, domains)
+            self._invalidate('link_domains', chat_id)
+
+    def get_link_domains(self, chat_id):
+        """Списки доменов группы: кортеж пар (домен, разрешён), не меняется, пока списки не изменят."""
+        return self._cached('link_domains', chat_id, lambda chat_id: tuple(self.storage.get_link_domains(chat_id).items()))
+
+    def add_global_ban(self, user_id, chat_id, reason):
+        """Добавление пользователя в общий бан-лист."""
+        self.storage.add_global_ban(user_id, chat_id, reason)
+        self._invalidate('global_ban', user_id)
+        logger.info(f"Пользователь {user_id} добавлен в общий бан-лист из группы {chat_id}: {reason}")
+
+    def remove_global_ban(self, user_id):
+        """Удаление пользователя из общего бан-листа."""
+        self.storage.remove_global_ban(user_id)
+        self._invalidate('global_unban', user_id)
+
+    def is_globally_banned(self, user_id):
+        """Есть ли пользователь в общем бан-листе.
+
+        Почти для всех пользователей ответ даёт фильтр Блума в памяти; хранилище
+        запрашивается, только если фильтр ответил "возможно".
+        """
+        if self._global_bans_stale():
+            self._load_global_bans(if_stale=True)
+        if user_id not in self._global_bans:
+            return False
+        return self._cached('global_ban', user_id, self.storage.is_globally_banned)
+
+    def add_spam_image(self, image_hash, chat_id, user_id):
+        """Добавление хеша известной спам-картинки."""
+        self.storage.add_spam_image(image_hash, chat_id, user_id)
+        self._invalidate('spam_images', 0)
+
+    def remove_spam_image(self, image_hash):
+        """Удаление хеша спам-картинки."""
+        self.storage.remove_spam_image(image_hash)
+        self._invalidate('spam_images', 0)
+
+    def get_spam_images(self):
+        """Хеши спам-картинок, общие для всех групп. Кортеж не меняется, пока список не изменят."""
+        return self._cached('spam_images', 0, lambda _: tuple(self.storage.get_spam_images()))
+
+    def get_duplicate_candidates(self, band_keys, since):
+        """Рассылки, встречавшиеся после since в одной из полос подписи."""
+        return self.storage.get_duplicate_candidates(band_keys, since)
+
+    def record_duplicate(self, campaign_id, signature, band_keys, chat_id, now, window):
+        """Отметка рассылки в чате; число чатов, где она встречалась за окно."""
+        return self.storage.record_duplicate(campaign_id, signature, band_keys, chat_id, now, window)
 
     def save_welcome_message(self, user_id, message_id):
         """Сохранение приветственного сообщения."""
-        self.cursor.execute("""
-            INSERT OR REPLACE INTO welcome_messages (user_id, message_id)
-            VALUES (?, ?)
-        """, (user_id, message_id))
-        self.conn.commit()
+        self.storage.save_welcome_message(user_id, message_id)
 
     def get_welcome_message(self, user_id):
         """Получение приветственного сообщения."""
-        self.cursor.execute("SELECT message_id FROM welcome_messages WHERE user_id = ?", (user_id,))
-        row = self.cursor.fetchone()
-        return row['message_id'] if row else None
+        return self.storage.get_welcome_message(user_id)
 
     def set_report_chat(self, chat_id, log_chat_id):
         """Установка чата для репортов."""
-        self.cursor.execute("""
-            INSERT OR REPLACE INTO report_chats (chat_id, log_chat_id)
-            VALUES (?, ?)
-        """, (chat_id, log_chat_id))
-        self.conn.commit()
+        old_log_chat_id = self.get_report_chat(chat_id)
+        self.storage.set_report_chat(chat_id, log_chat_id)
+        self._invalidate('report_chat', chat_id)
+        self._invalidate('is_report_chat', log_chat_id)
+        if old_log_chat_id:
+            self._invalidate('is_report_chat', old_log_chat_id)
 
     def get_report_chat(self, chat_id):
         """Получение чата для репортов."""
-        self.cursor.execute("SELECT log_chat_id FROM report_chats WHERE chat_id = ?", (chat_id,))
-        row = self.cursor.fetchone()
-        return row['log_chat_id'] if row else None
+        return self._cached('report_chat', chat_id, self.storage.get_report_chat)
+
+    def is_report_chat(self, chat_id):
+        """Проверка, используется ли чат как группа для репортов."""
+        return self._cached('is_report_chat', chat_id, self.storage.is_report_chat)
+
+    def add_scheduled_deletion(self, chat_id, message_id, due_at):
+        """Сохранение отложенного удаления сообщения."""
+        self.storage.add_scheduled_deletion(chat_id, message_id, due_at)
+
+    def remove_scheduled_deletion(self, chat_id, message_id):
+        """Отмена отложенного удаления сообщения."""
+        return self.storage.remove_scheduled_deletion(chat_id, message_id)
+
+    def pop_due_deletions(self, now, limit):
+        """Извлечение наступивших удалений из очереди."""
+        return self.storage.pop_due_deletions(now, limit)
+
+    def next_deletion_due(self):
+        """Время ближайшего отложенного удаления."""
+        return self.storage.next_deletion_due()
+
+    def save_raid_lockdown(self, chat_id, until, joined):
+        """Сохранение времени окончания блокировки чата во время рейда."""
+        self.storage.save_raid_lockdown(chat_id, until, joined)
+
+    def remove_raid_lockdown(self, chat_id):
+        """Удаление снятой блокировки чата."""
+        self.storage.remove_raid_lockdown(chat_id)
+
+    def get_raid_lockdowns(self):
+        """Сохранённые блокировки чатов."""
+        return self.storage.get_raid_lockdowns()
 
     def get_bot_invite_url(self):
         """Получение URL для приглашения бота."""
@@ -257,21 +323,8 @@ class Database:
 
     def set_captcha_passed(self, chat_id, user_id):
         """Установка статуса прохождения капчи."""
-        try:
-            self.cursor.execute("""
-                INSERT OR REPLACE INTO captcha_status (chat_id, user_id, passed)
-                VALUES (?, ?, 1)
-            """, (chat_id, user_id))
-            self.conn.commit()
-        except sqlite3.Error as e:
-            logger.error(f"Error setting captcha status: {e}")
+        self.storage.set_captcha_passed(chat_id, user_id)
 
     def has_passed_captcha(self, chat_id, user_id):
         """Проверка статуса прохождения капчи."""
-        try:
-            self.cursor.execute("SELECT passed FROM captcha_status WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
-            row = self.cursor.fetchone()
-            return row['passed'] == 1 if row else False
-        except sqlite3.Error as e:
-            logger.error(f"Error checking captcha status: {e}")
-            return False
\ No newline at end of file
+        return self.storage.has_passed_captcha(chat_id, user_id)
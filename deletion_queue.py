@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from config import DELETION_BATCH_WINDOW_SECONDS, DELETION_BATCH_SIZE
+from scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class DeletionQueue:
+    """Персистентная очередь удаления сообщений бота.
+
+    Удаления хранятся в базе, поэтому переживают перезапуск процесса.
+    Планировщик держит одну задачу на ближайшее удаление; при срабатывании
+    все наступившие удаления группируются по чатам и отправляются пачками
+    через deleteMessages.
+    """
+
+    def __init__(self, bot, db, scheduler=scheduler):
+        self.bot = bot
+        self.db = db
+        self.scheduler = scheduler
+        self._lock = threading.Lock()
+        self._job_id = None
+        self._job_due = None
+        self.deleted = 0
+        self.requests = 0
+
+    def add(self, chat_id, message_id, delay):
+        """Планирует удаление сообщения через delay секунд."""
+        due_at = time.time() + delay
+        self.db.add_scheduled_deletion(chat_id, message_id, due_at)
+        self._arm(due_at)
+
+    def cancel(self, chat_id, message_id):
+        """Отменяет запланированное удаление."""
+        return self.db.remove_scheduled_deletion(chat_id, message_id)
+
+    def recover(self):
+        """Выполняет просроченные удаления после перезапуска и планирует оставшиеся."""
+        self.flush()
+
+    def flush(self):
+        """Удаляет все сообщения, срок которых наступил, и планирует следующий запуск."""
+        with self._lock:
+            self._job_id = self._job_due = None
+        # Захватываем и удаления из ближайшего окна, чтобы объединить их в один запрос
+        horizon = time.time() + DELETION_BATCH_WINDOW_SECONDS
+        while True:
+            due = self.db.pop_due_deletions(horizon, DELETION_BATCH_SIZE * 10)
+            if not due:
+                break
+            by_chat = defaultdict(list)
+            for chat_id, message_id in due:
+                by_chat[chat_id].append(message_id)
+            for chat_id, message_ids in by_chat.items():
+                self._delete_batch(chat_id, message_ids)
+        next_due = self.db.next_deletion_due()
+        if next_due is not None:
+            self._arm(next_due)
+
+    def _delete_batch(self, chat_id, message_ids):
+        for start in range(0, len(message_ids), DELETION_BATCH_SIZE):
+            chunk = message_ids[start:start + DELETION_BATCH_SIZE]
+            try:
+                self.requests += 1
+                if len(chunk) == 1:
+                    self.bot.delete_message(chat_id, chunk[0])
+                else:
+                    self.bot.delete_messages(chat_id, chunk)
+                self.deleted += len(chunk)
+                logger.info(f"Удалено сообщений бота в чате {chat_id}: {len(chunk)}")
+            except Exception as e:
+                logger.error(f"Ошибка удаления сообщений {chunk} в чате {chat_id}: {e}")
+
+    def _arm(self, due_at):
+        with self._lock:
+            # Уже запланированный запуск не позже нужного покрывает и это удаление
+            if self._job_due is not None and self._job_due <= due_at:
+                return
+            if self._job_id is not None:
+                self.scheduler.cancel(self._job_id)
+            self._job_due = due_at
+            self._job_id = self.scheduler.schedule(max(due_at - time.time(), 0), self.flush)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_deletion_queue(bot, db):
+    """Возвращает общую очередь удаления, создавая её при первом обращении."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = DeletionQueue(bot, db)
+        return _queue
@@ -0,0 +1,81 @@
+import logging
+import queue
+import threading
+from config import UPDATE_SHARDS, UPDATE_SHARD_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_id(update):
+    """Чат, к которому относится обновление, или None, если чата нет."""
+    for field in ('message', 'edited_message', 'channel_post', 'my_chat_member', 'chat_member', 'chat_join_request'):
+        event = getattr(update, field, None)
+        if event is not None:
+            return event.chat.id
+    callback = update.callback_query
+    if callback is not None:
+        return callback.message.chat.id if callback.message else callback.from_user.id
+    return None
+
+
+class ShardedDispatcher:
+    """Разбор обновлений пулом потоков с сохранением порядка внутри чата.
+
+    Каждому потоку соответствует своя очередь; чат всегда попадает в одну и ту
+    же очередь по chat_id, поэтому обновления одного чата обрабатываются
+    строго по порядку, а разные чаты - параллельно.
+    """
+
+    def __init__(self, process, shards=UPDATE_SHARDS, maxsize=UPDATE_SHARD_QUEUE_SIZE):
+        self.process = process
+        self.queues = [queue.Queue(maxsize) for _ in range(shards)]
+        self.processed = [0] * shards
+        self.rejected = 0
+        self._threads = [
+            threading.Thread(target=self._work, args=(i,), name=f"update-shard-{i}", daemon=True)
+            for i in range(shards)
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def shard_of(self, chat_id):
+        # Обновления без чата идут в первую очередь
+        return hash(chat_id) % len(self.queues) if chat_id is not None else 0
+
+    def put(self, update, timeout=None):
+        """Ставит обновление в очередь его чата. Возвращает False, если очередь переполнена."""
+        try:
+            self.queues[self.shard_of(update_chat_id(update))].put(update, timeout=timeout)
+            return True
+        except queue.Full:
+            self.rejected += 1
+            return False
+
+    def metrics(self):
+        return {
+            'depth': [q.qsize() for q in self.queues],
+            'capacity': self.queues[0].maxsize,
+            'processed': list(self.processed),
+            'rejected': self.rejected,
+        }
+
+    def stop(self):
+        """Дожидается обработки уже принятых обновлений и останавливает обработчики."""
+        for q in self.queues:
+            q.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self, shard):
+        updates = self.queues[shard]
+        while True:
+            update = updates.get()
+            if update is None:
+                return
+            try:
+                self.process(update)
+                self.processed[shard] += 1
+            except Exception as e:
+                logger.error(f"Ошибка обработки обновления {update.update_id}: {e}")
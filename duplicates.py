@@ -0,0 +1,177 @@
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    DUPLICATE_CHAT_THRESHOLD, DUPLICATE_WINDOW_SECONDS, DUPLICATE_INDEX_SIZE,
+    DUPLICATE_MIN_WORDS, DUPLICATE_MIN_SIMILARITY
+)
+from model.normalize import NormalizedText
+
+logger = logging.getLogger(__name__)
+
+# Подписи MinHash из BANDS полос по ROWS значений: сообщения с похожестью по Жаккару
+# около 0.8 почти наверняка совпадают хотя бы в одной полосе, случайные - почти никогда
+BANDS = 8
+ROWS = 4
+PRIME = (1 << 61) - 1
+_rng = random.Random(0)
+PERMUTATIONS = [(_rng.randrange(1, PRIME), _rng.randrange(PRIME)) for _ in range(BANDS * ROWS)]
+
+
+def shingles(cleaned):
+    """Слова и пары соседних слов очищенного текста; цифры не различаются."""
+    words = re.sub(r"\d", "0", " ".join(re.findall(r"\w+", cleaned))).split()
+    return words, set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def minhash(features):
+    """Подпись MinHash множества признаков."""
+    hashes = [int.from_bytes(hashlib.blake2b(f.encode('utf-8'), digest_size=8).digest(), 'big') for f in features]
+    return tuple(min((a * h + b) % PRIME for h in hashes) for a, b in PERMUTATIONS)
+
+
+def similarity(left, right):
+    """Оценка похожести по Жаккару по доле совпавших значений подписей."""
+    return sum(x == y for x, y in zip(left, right)) / len(left)
+
+
+class DuplicateIndex:
+    """Индекс подписей недавних сообщений, общий для всех чатов.
+
+    Похожие сообщения (по MinHash похожесть не ниже DUPLICATE_MIN_SIMILARITY)
+    считаются одной рассылкой, для которой хранится, в каких чатах и когда она
+    встречалась. Кандидаты ищутся по полосам подписи (LSH), так что проверка
+    сообщения - несколько обращений к словарю. Индекс ограничен по размеру и по
+    времени: давно не встречавшиеся рассылки вытесняются первыми.
+    """
+
+    def __init__(self, window=DUPLICATE_WINDOW_SECONDS, maxsize=DUPLICATE_INDEX_SIZE):
+        self.window = window
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # подпись -> {chat_id: время}
+        self._bands = {}  # (полоса, значения полосы) -> множество подписей
+        self._lock = threading.Lock()
+
+    def observe(self, chat_id, text, now=None):
+        """Добавляет сообщение (строку или NormalizedText) и возвращает число чатов,
+        в которых оно встречалось за окно.
+
+        Для слишком коротких сообщений возвращает 0: совпадения в них ничего не значат.
+        """
+        if not isinstance(text, NormalizedText):
+            text = NormalizedText(text)
+        words, features = shingles(text.clean)
+        if len(words) < DUPLICATE_MIN_WORDS:
+            return 0
+        signature = minhash(features)
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            match = self._find(signature)
+            if match is None:
+                match = signature
+                self._add(signature)
+            chats = self._entries[match]
+            chats[chat_id] = now
+            self._entries.move_to_end(match)
+            for seen_chat, seen_at in list(chats.items()):
+                if now - seen_at > self.window:
+                    del chats[seen_chat]
+            return len(chats)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _find(self, signature):
+        for band_key in self._band_keys(signature):
+            for candidate in self._bands.get(band_key, ()):
+                if similarity(candidate, signature) >= DUPLICATE_MIN_SIMILARITY:
+                    return candidate
+        return None
+
+    def _add(self, signature):
+        self._entries[signature] = {}
+        for band_key in self._band_keys(signature):
+            self._bands.setdefault(band_key, set()).add(signature)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, signature):
+        del self._entries[signature]
+        for band_key in self._band_keys(signature):
+            bucket = self._bands.get(band_key)
+            if bucket is not None:
+                bucket.discard(signature)
+                if not bucket:
+                    del self._bands[band_key]
+
+    def _expire(self, now):
+        # Записи упорядочены по последнему появлению: устаревшие всегда в начале
+        while self._entries:
+            signature, chats = next(iter(self._entries.items()))
+            if chats and now - max(chats.values()) <= self.window:
+                break
+            self._remove(signature)
+
+    @staticmethod
+    def _band_keys(signature):
+        return [(band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+
+class SharedDuplicateIndex:
+    """Индекс рассылок в хранилище, общий для процессов-обработчиков.
+
+    В режиме supervisor чаты распределены по процессам, и рассылку по многим
+    чатам ни один процесс целиком не видит. Подписи, полосы и чаты рассылок
+    хранятся в базе (в Redis - с TTL окна), время - unix time, общее для
+    процессов. Два процесса, одновременно увидевшие новую почти дословную
+    копию, могут завести две записи; точные копии дают одну подпись и один
+    campaign_id.
+    """
+
+    def __init__(self, db, window=DUPLICATE_WINDOW_SECONDS):
+        self.db = db
+        self.window = window
+
+    def observe(self, chat_id, text, now=None):
+        """То же, что DuplicateIndex.observe, но со счётчиками в хранилище."""
+        if not isinstance(text, NormalizedText):
+            text = NormalizedText(text)
+        words, features = shingles(text.clean)
+        if len(words) < DUPLICATE_MIN_WORDS:
+            return 0
+        signature = minhash(features)
+        now = time.time() if now is None else now
+        band_keys = [
+            f"{band}:{hashlib.blake2b(repr(values).encode(), digest_size=8).hexdigest()}"
+            for band, values in DuplicateIndex._band_keys(signature)
+        ]
+        try:
+            match = next((
+                campaign_id for campaign_id, candidate in self.db.get_duplicate_candidates(band_keys, now - self.window)
+                if similarity(candidate, signature) >= DUPLICATE_MIN_SIMILARITY
+            ), None)
+            if match is None:
+                match = hashlib.blake2b(repr(signature).encode(), digest_size=8).hexdigest()
+            return self.db.record_duplicate(match, signature, band_keys, chat_id, now, self.window)
+        except Exception as e:
+            logger.error(f"Ошибка обращения к общему индексу рассылок: {e}")
+            return 0
+
+
+index = DuplicateIndex()
+
+
+def share_index(db):
+    """Переключает проверку рассылок на индекс в хранилище (для процессов-обработчиков)."""
+    global index
+    index = SharedDuplicateIndex(db)
+
+
+def is_campaign(chat_id, text):
+    """True, если похожее сообщение за окно встречалось больше чем в DUPLICATE_CHAT_THRESHOLD чатах."""
+    return index.observe(chat_id, text) > DUPLICATE_CHAT_THRESHOLD
@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+from config import EDIT_CACHE_MESSAGES_PER_CHAT, EDIT_CACHE_CHATS
+from links import extract_urls
+
+# Этапы проверки и их входные данные: words - текст без невидимых символов (мат и
+# запрещённые слова проверяются и в нём, и в каноническом виде), links - адреса
+# ссылок, clean - очищенный текст (рассылки и модель), media - файл или фото сообщения
+STAGES = ('words', 'links', 'clean', 'media')
+TEXT_STAGES = frozenset(('words', 'links', 'clean'))
+STAGE_BITS = 32
+STAGE_MASK = (1 << STAGE_BITS) - 1
+
+
+def fingerprint(normalized, entities=None, media=None):
+    """Отпечаток сообщения: по 32 бита хеша входных данных каждого этапа в одном числе.
+
+    normalized - NormalizedText текста или подписи (None, если текста нет),
+    media - file_unique_id файла или фото.
+    """
+    if normalized is None:
+        inputs = ('', (), '', media)
+    else:
+        inputs = (normalized.stripped, tuple(extract_urls(normalized.stripped, entities)), normalized.clean, media)
+    value = 0
+    for stage_input in inputs:
+        value = value << STAGE_BITS | (hash(stage_input) & STAGE_MASK)
+    return value
+
+
+def changed_stages(previous, current):
+    """Этапы, входные данные которых различаются в отпечатках; все этапы, если прежнего отпечатка нет."""
+    if previous is None:
+        return frozenset(STAGES)
+    difference = previous ^ current
+    return frozenset(
+        stage for i, stage in enumerate(reversed(STAGES))
+        if difference >> (i * STAGE_BITS) & STAGE_MASK
+    )
+
+
+class RecentFingerprints:
+    """Отпечатки последних сообщений каждого чата для проверки правок.
+
+    На чат хранится не больше per_chat отпечатков (старые вытесняются), чатов -
+    не больше chats, давно не писавшие вытесняются первыми. Отпечаток - одно
+    число, так что весь кэш занимает порядка per_chat * chats * 100 байт.
+    """
+
+    def __init__(self, per_chat=EDIT_CACHE_MESSAGES_PER_CHAT, chats=EDIT_CACHE_CHATS):
+        self.per_chat = per_chat
+        self.chats = chats
+        self._chats = OrderedDict()  # chat_id -> {message_id: отпечаток} в порядке добавления
+        self._lock = threading.Lock()
+
+    def get(self, chat_id, message_id):
+        with self._lock:
+            messages = self._chats.get(chat_id)
+            return messages.get(message_id) if messages is not None else None
+
+    def remember(self, chat_id, message_id, value):
+        with self._lock:
+            messages = self._chats.get(chat_id)
+            if messages is None:
+                messages = self._chats[chat_id] = {}
+                while len(self._chats) > self.chats:
+                    self._chats.popitem(last=False)
+            else:
+                self._chats.move_to_end(chat_id)
+            messages[message_id] = value
+            if len(messages) > self.per_chat:
+                del messages[next(iter(messages))]
+
+    def forget(self, chat_id, message_id):
+        with self._lock:
+            messages = self._chats.get(chat_id)
+            if messages is not None:
+                messages.pop(message_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(messages) for messages in self._chats.values())
+
+
+recent = RecentFingerprints()
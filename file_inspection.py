@@ -0,0 +1,216 @@
+import logging
+import struct
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future
+from telebot import apihelper
+from config import (
+    FILE_SNIFF_HEAD_BYTES, FILE_SNIFF_TAIL_BYTES, FILE_SNIFF_MAX_DIRECTORY_BYTES, FILE_SNIFF_MAX_STREAM_BYTES,
+    FILE_SNIFF_MAX_FILE_BYTES, FILE_SNIFF_TIMEOUT_SECONDS, FILE_VERDICT_CACHE_SIZE, FILE_VERDICT_TTL_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FILE_URL = "https://api.telegram.org/file/bot{0}/{1}"
+
+# Сигнатуры в начале файла
+EXECUTABLE_MAGIC = (
+    b'\x7fELF',
+    b'\xfe\xed\xfa\xce', b'\xfe\xed\xfa\xcf', b'\xce\xfa\xed\xfe', b'\xcf\xfa\xed\xfe',  # Mach-O
+    b'\xca\xfe\xba\xbe',  # Mach-O universal, Java class
+)
+# Windows PE (.exe, .dll, .scr): заголовок MZ, по смещению e_lfanew из него - сигнатура PE.
+# Двух байт MZ мало: с них может начинаться и обычный текст
+DOS_MAGIC = b'MZ'
+DOS_HEADER_SIZE = 0x40
+PE_MAGIC = b'PE\x00\x00'
+SCRIPT_MAGIC = b'#!'  # Скрипт с интерпретатором; в текстовом файле это просто текст
+TEXT_EXTENSIONS = {'.txt'}
+ZIP_MAGIC = (b'PK\x03\x04', b'PK\x05\x06')
+OLE_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'  # .doc/.xls/.ppt, но и .msi
+ARCHIVE_MAGIC = (b'Rar!\x1a\x07', b'7z\xbc\xaf\x27\x1c', b'\x1f\x8b', b'MSCF')  # rar, 7z, gzip, cab
+
+# Расширения, которым законно соответствует формат ZIP или OLE
+ZIP_EXTENSIONS = {'.docx', '.xlsx', '.pptx'}
+OLE_EXTENSIONS = {'.doc', '.xls', '.ppt'}
+MACRO_ENTRIES = ('vbaproject.bin',)
+
+ZIP_END_RECORD = b'PK\x05\x06'
+ZIP_END_RECORD_SIZE = 22
+ZIP_DIRECTORY_ENTRY = b'PK\x01\x02'
+ZIP_DIRECTORY_ENTRY_SIZE = 46
+
+
+def fetch_range(url, start, length, stream_limit=FILE_SNIFF_MAX_STREAM_BYTES):
+    """Скачивает length байт файла начиная со start.
+
+    Запрашивается только нужный диапазон (Range); если сервер его не
+    поддерживает и отдаёт файл целиком, поток читается до нужного места, но не
+    дальше stream_limit байт. Возвращает None, если диапазон так не получить.
+    """
+    request = urllib.request.Request(url, headers={'Range': f"bytes={start}-{start + length - 1}"})
+    with urllib.request.urlopen(request, timeout=FILE_SNIFF_TIMEOUT_SECONDS) as response:
+        if response.status == 206:
+            return response.read(length)
+        if start + length > stream_limit:
+            return None
+        data = response.read(start + length)
+        return data[start:]
+
+
+def zip_entry_names(tail, tail_offset, fetch):
+    """Имена файлов ZIP-архива по центральному каталогу, без распаковки.
+
+    tail - конец файла, начинающийся со смещения tail_offset; если каталог в
+    него не попал, он докачивается через fetch(start, length). Возвращает None,
+    если каталог не найден или слишком велик.
+    """
+    position = tail.rfind(ZIP_END_RECORD)
+    if position < 0 or len(tail) - position < ZIP_END_RECORD_SIZE:
+        return None
+    count, size, offset = struct.unpack_from('<HII', tail, position + 10)
+    if offset == 0xFFFFFFFF or size > FILE_SNIFF_MAX_DIRECTORY_BYTES:
+        return None  # ZIP64 или огромный каталог
+    if offset >= tail_offset:
+        directory = tail[offset - tail_offset:offset - tail_offset + size]
+    else:
+        directory = fetch(offset, size)
+    if not directory:
+        return None
+
+    names = []
+    position = 0
+    for _ in range(count):
+        if directory[position:position + 4] != ZIP_DIRECTORY_ENTRY:
+            break
+        flags, = struct.unpack_from('<H', directory, position + 8)
+        name_length, extra_length, comment_length = struct.unpack_from('<HHH', directory, position + 28)
+        start = position + ZIP_DIRECTORY_ENTRY_SIZE
+        raw_name = directory[start:start + name_length]
+        names.append(raw_name.decode('utf-8' if flags & 0x800 else 'cp437', errors='replace'))
+        position = start + name_length + extra_length + comment_length
+    return names
+
+
+def is_pe(head):
+    """True, если начало файла - заголовок исполняемого файла Windows (MZ и сигнатура PE)."""
+    if not head.startswith(DOS_MAGIC) or len(head) < DOS_HEADER_SIZE:
+        return False
+    offset, = struct.unpack_from('<I', head, 0x3C)
+    # Заголовок PE за пределами скачанного начала не проверить; такой файл не считается исполняемым
+    return DOS_HEADER_SIZE <= offset and head[offset:offset + 4] == PE_MAGIC
+
+
+def content_verdict(head, file_ext, zip_names, dangerous_extensions):
+    """Причина считать файл опасным по содержимому или None."""
+    if head.startswith(EXECUTABLE_MAGIC) or is_pe(head):
+        return "исполняемый файл"
+    if head.startswith(SCRIPT_MAGIC) and file_ext not in TEXT_EXTENSIONS:
+        return "скрипт под видом другого файла"
+    if head.startswith(ARCHIVE_MAGIC):
+        return "архив под видом другого файла"
+    if head.startswith(OLE_MAGIC) and file_ext not in OLE_EXTENSIONS:
+        return "документ OLE или установщик под видом другого файла"
+    if head.startswith(ZIP_MAGIC):
+        if file_ext not in ZIP_EXTENSIONS:
+            return "архив под видом другого файла"
+        for name in zip_names or ():
+            lowered = name.lower()
+            if lowered.endswith(MACRO_ENTRIES):
+                return "документ с макросами"
+            if '.' in lowered and lowered[lowered.rfind('.'):] in dangerous_extensions:
+                return f"вложенный файл {name}"
+    return None
+
+
+class VerdictCache:
+    """Вердикты проверки содержимого по file_unique_id (и расширению), общие для всех чатов.
+
+    Один и тот же файл, разосланный по многим чатам, скачивается один раз:
+    пока он проверяется, остальные запросы ждут тот же результат.
+    """
+
+    def __init__(self, maxsize=FILE_VERDICT_CACHE_SIZE, ttl=FILE_VERDICT_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._verdicts = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        """Вердикт из кэша или результат compute(); ошибки compute не кэшируются."""
+        with self._lock:
+            entry = self._verdicts.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._verdicts.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            pending = self._pending.get(key)
+            if pending is None:
+                self.misses += 1
+                future = self._pending[key] = Future()
+        if pending is not None:
+            return pending.result()
+
+        try:
+            verdict = compute()
+        except Exception as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._pending[key]
+            self._verdicts[key] = (time.monotonic() + self.ttl, verdict)
+            while len(self._verdicts) > self.maxsize:
+                self._verdicts.popitem(last=False)
+        future.set_result(verdict)
+        return verdict
+
+    def __len__(self):
+        return len(self._verdicts)
+
+
+verdicts = VerdictCache()
+
+
+def _inspect(bot, file_info, file_ext, dangerous_extensions):
+    file = bot.get_file(file_info.file_id)
+    url = (apihelper.FILE_URL or DEFAULT_FILE_URL).format(bot.token, file.file_path)
+    size = file_info.file_size or file.file_size or 0
+    head = fetch_range(url, 0, FILE_SNIFF_HEAD_BYTES)
+    if head is None:
+        return None
+    zip_names = None
+    if head.startswith(ZIP_MAGIC) and file_ext in ZIP_EXTENSIONS:
+        if size <= len(head):
+            tail, tail_offset = head, 0
+        else:
+            tail_offset = max(size - FILE_SNIFF_TAIL_BYTES, 0)
+            tail = fetch_range(url, tail_offset, size - tail_offset)
+        if tail is not None:
+            zip_names = zip_entry_names(tail, tail_offset, lambda start, length: fetch_range(url, start, length))
+    return content_verdict(head, file_ext, zip_names, dangerous_extensions)
+
+
+def inspect_file(bot, file_info, file_ext, dangerous_extensions):
+    """Проверяет содержимое файла по сигнатурам. Возвращает причину опасности или None.
+
+    Скачиваются только первые FILE_SNIFF_HEAD_BYTES байт, а для документов
+    Office - ещё и центральный каталог ZIP в конце файла. Если файл проверить не
+    удалось (слишком большой, ошибка сети), возвращает None: решение остаётся
+    за проверкой расширения.
+    """
+    if file_info.file_size and file_info.file_size > FILE_SNIFF_MAX_FILE_BYTES:
+        return None
+    try:
+        return verdicts.get_or_compute(
+            (file_info.file_unique_id, file_ext), lambda: _inspect(bot, file_info, file_ext, dangerous_extensions)
+        )
+    except Exception as e:
+        logger.error(f"Ошибка проверки содержимого файла {file_info.file_unique_id}: {e}")
+        return None
@@ -0,0 +1,186 @@
+import re
+import threading
+from config import PROFANITY_REGEX, LINK_REGEX
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Литеральные фрагменты, без одного из которых PROFANITY_REGEX не совпадает ни в одной ветке
+PROFANITY_FRAGMENTS = (
+    'еб', 'ёб', 'епуц', 'епутс', 'епац', 'епатс', 'ёпуц', 'ёпутс', 'ёпац', 'ёпатс',
+    'ипа', 'ипе', 'иба', 'ибе',
+    'хуя', 'хуй', 'хуи', 'хуе', 'хуё', 'хую', 'хул',
+    'блэ', 'бля', 'бле',
+    'пизд', 'пезд', 'пёзд', 'пидр', 'пидар', 'пидор', 'пидер', 'педар', 'педор', 'педер', 'педик', 'пох',
+    'манд', 'муд', 'малаф', 'малоф', 'молаф', 'молоф',
+    'елда', 'елду', 'елды', 'елде',
+    'лят', 'ляд', 'нах', 'зах',
+)
+
+# Символы, которые без учёта регистра совпадают с буквами фрагментов, но остаются после lower()
+CASE_FOLD = str.maketrans({
+    '\u1c80': 'в', '\u1c81': 'д', '\u1c82': 'о', '\u1c83': 'с',
+    '\u1c84': 'т', '\u1c85': 'т', '\u1c86': 'ъ',
+})
+
+TOKEN_START = re.compile(r"\S*$")
+
+
+class _RegexPrefilter:
+    """Поиск первого фрагмента одним регулярным выражением из литералов."""
+
+    def __init__(self, fragments):
+        self.pattern = re.compile('|'.join(sorted(map(re.escape, fragments), key=len, reverse=True)))
+
+    def first(self, text):
+        match = self.pattern.search(text)
+        return match.start() if match else None
+
+
+class _AhoCorasickPrefilter:
+    """Поиск первого фрагмента автоматом Ахо-Корасик (пакет pyahocorasick)."""
+
+    def __init__(self, fragments):
+        self.automaton = ahocorasick.Automaton()
+        for fragment in fragments:
+            self.automaton.add_word(fragment, len(fragment))
+        self.automaton.make_automaton()
+
+    def first(self, text):
+        return min((end - length + 1 for end, length in self.automaton.iter(text)), default=None)
+
+
+class FilterEngine:
+    """Фильтры мата и ссылок, скомпилированные один раз.
+
+    Полное регулярное выражение мата запускается, только если в тексте есть
+    один из обязательных фрагментов, и начиная со слова, где встретился первый
+    из них: совпадение не может начаться раньше, так как до фрагмента в нём
+    нет пробелов. Результат совпадает с re.search(PROFANITY_REGEX, text.lower()).
+    """
+
+    def __init__(self):
+        self.profanity = re.compile(PROFANITY_REGEX)
+        self.link = re.compile(LINK_REGEX)
+        prefilter = _AhoCorasickPrefilter if ahocorasick else _RegexPrefilter
+        self.prefilter = prefilter(PROFANITY_FRAGMENTS)
+
+    def find_profanity(self, text):
+        """Первое совпадение PROFANITY_REGEX в тексте или None."""
+        return self._search_profanity(text.lower())
+
+    def find_link(self, text):
+        """Первое совпадение LINK_REGEX в тексте или None."""
+        # Обе ветки выражения требуют точки или схемы с "://"
+        if '.' not in text and '://' not in text:
+            return None
+        return self.link.search(text)
+
+    def check_profanity(self, normalized):
+        """Мат в исходном тексте или в его каноническом виде (NormalizedText)."""
+        match = self.find_profanity(normalized.text)
+        if match is None and normalized.canonical != normalized.text.lower():
+            match = self._search_profanity(normalized.canonical)
+        return match
+
+    def _search_profanity(self, lowered):
+        first = self.prefilter.first(lowered.translate(CASE_FOLD))
+        if first is None:
+            return None
+        return self.profanity.search(lowered, TOKEN_START.search(lowered, 0, first).start())
+
+
+def normalize_term(term):
+    """Запрещённое слово в виде для хранения: нижний регистр, одиночные пробелы."""
+    return " ".join(term.lower().split())
+
+
+def _trie_pattern(terms):
+    # Префиксное дерево в виде регулярного выражения: общие начала слов проверяются один раз
+    trie = {}
+    for term in terms:
+        node = trie
+        prefix = term.endswith('*')
+        for char in term.rstrip('*'):
+            node = node.setdefault(char, {})
+        node[None if prefix else ''] = True
+
+    def build(node):
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items(), key=str) if char]
+        if None in node:
+            alternatives.append(r'\w*')
+        elif '' in node:
+            alternatives.append('')
+        return alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+
+    return build(trie)
+
+
+WORD_CHAR = re.compile(r"\w")
+
+
+class WordListMatcher:
+    """Поиск слов и фраз из списка группы целыми словами.
+
+    Слово со звёздочкой на конце ("казино*") совпадает с любым словом, которое
+    с него начинается. Список компилируется один раз: в автомат Ахо-Корасик,
+    если установлен pyahocorasick, иначе в регулярное выражение-префиксное
+    дерево, поэтому время проверки почти не зависит от длины списка.
+    """
+
+    def __init__(self, terms):
+        terms = {normalize_term(term) for term in terms} - {'', '*'}
+        if ahocorasick:
+            self.automaton = ahocorasick.Automaton()
+            # "слово" и "слово*" дают один ключ: префиксная форма покрывает обе
+            words = {}
+            for term in terms:
+                word = term.rstrip('*')
+                words[word] = words.get(word, False) or term.endswith('*')
+            for word, prefix in words.items():
+                self.automaton.add_word(word, (word + '*' if prefix else word, prefix))
+            self.automaton.make_automaton()
+            self.pattern = None
+        else:
+            self.automaton = None
+            self.pattern = re.compile(r"(?<!\w)" + _trie_pattern(terms) + r"(?!\w)") if terms else None
+
+    def find(self, text):
+        """Первое найденное слово из списка или None."""
+        text = " ".join(text.lower().split())
+        if self.automaton is not None:
+            for end, (term, prefix) in self.automaton.iter(text):
+                start = end - len(term.rstrip('*')) + 1
+                if start > 0 and WORD_CHAR.match(text, start - 1):
+                    continue
+                if not prefix and WORD_CHAR.match(text, end + 1):
+                    continue
+                return term
+            return None
+        match = self.pattern.search(text) if self.pattern else None
+        return match.group() if match else None
+
+    def check(self, normalized):
+        """Слово из списка в исходном тексте или в его каноническом виде (NormalizedText)."""
+        return self.find(normalized.text) or self.find(normalized.canonical)
+
+
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+
+def banned_words_matcher(chat_id, words):
+    """Скомпилированный список группы; пересобирается, только когда список изменился."""
+    with _matchers_lock:
+        entry = _matchers.get(chat_id)
+        if entry is not None and (entry[0] is words or entry[0] == words):
+            return entry[1]
+    matcher = WordListMatcher(words)
+    with _matchers_lock:
+        _matchers[chat_id] = (words, matcher)
+    return matcher
+
+
+engine = FilterEngine()
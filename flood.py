@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from telebot import types
+from config import DEFAULT_SETTINGS, FLOOD_DEFAULT_LIMIT, FLOOD_IDLE_SECONDS, FLOOD_MUTE_SECONDS
+from bot_permissions import bot_permissions
+from moderation import executor
+from utils import get_username, delete_message_after_delay, format_duration
+
+logger = logging.getLogger(__name__)
+
+
+class FloodLimiter:
+    """Ограничитель частоты сообщений пары (чат, пользователь).
+
+    На каждую пару хранится корзина токенов в виде списка [токены, время,
+    флуд]: limit сообщений за window секунд с пополнением. Записи, простоявшие
+    дольше FLOOD_IDLE_SECONDS, удаляются - их корзины всё равно полные.
+    """
+
+    def __init__(self, idle=FLOOD_IDLE_SECONDS):
+        self.idle = idle
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + idle
+
+    def hit(self, chat_id, user_id, limit, window, now=None):
+        """Учитывает сообщение. Возвращает None, если лимит не превышен,
+        'start' для первого сообщения сверх лимита и 'active' для следующих."""
+        now = time.monotonic() if now is None else now
+        key = (chat_id, user_id)
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(limit), now, False]
+            tokens = min(limit, bucket[0] + (now - bucket[1]) * limit / window)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                bucket[2] = False
+                return None
+            bucket[0] = tokens
+            if bucket[2]:
+                return 'active'
+            bucket[2] = True
+            return 'start'
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _sweep(self, now):
+        idle = [key for key, bucket in self._buckets.items() if now - bucket[1] > self.idle]
+        for key in idle:
+            del self._buckets[key]
+        self._next_sweep = now + self.idle
+
+
+limiter = FloodLimiter()
+
+
+def parse_flood_limit(value):
+    """Разбирает лимит вида "5/10" (сообщений/секунд). Возвращает (limit, window) или None."""
+    try:
+        limit, window = (int(part) for part in value.split('/'))
+    except (AttributeError, ValueError):
+        return None
+    return (limit, window) if limit > 0 and window > 0 else None
+
+
+def check_flood(bot, db, message, settings):
+    """Проверяет флуд до остальных фильтров. Возвращает True, если сообщение удалено как флуд."""
+    if not settings.get('flood_filter', DEFAULT_SETTINGS['flood_filter']):
+        return False
+    chat_id = message.chat.id
+    user_id = message.from_user.id
+    limit, window = settings.get('flood_limit') or FLOOD_DEFAULT_LIMIT
+    state = limiter.hit(chat_id, user_id, limit, window)
+    if state is None:
+        return False
+
+    if bot_permissions.can_delete(bot, chat_id):
+        executor.submit('delete_message', bot.delete_message, chat_id, message.message_id)
+    if state == 'start' and bot_permissions.can_restrict(bot, chat_id):
+        # Мьют и уведомление - один раз на волну флуда, дальше сообщения только удаляются
+        try:
+            executor.timed(
+                'restrict_chat_member', bot.restrict_chat_member, chat_id, user_id,
+                until_date=datetime.now() + timedelta(seconds=FLOOD_MUTE_SECONDS),
+                permissions=types.ChatPermissions(can_send_messages=False)
+            )
+            sent_message = bot.send_message(
+                chat_id,
+                f"Пользователь {get_username(bot, chat_id, user_id, message.from_user)} замьючен на "
+                f"{format_duration(FLOOD_MUTE_SECONDS)} за флуд.",
+                parse_mode='HTML'
+            )
+            delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
+            logger.info(f"Пользователь {user_id} замьючен в группе {chat_id} за флуд ({limit}/{window} с)")
+        except Exception as e:
+            logger.error(f"Ошибка мьюта за флуд пользователя {user_id} в чате {chat_id}: {e}")
+    return True
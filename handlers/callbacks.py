@@ -1,11 +1,15 @@
 from telebot import types
 import logging
+from config import DEFAULT_SETTINGS
 from utils import get_username, create_main_menu, unrestrict_user
 from database import Database 
+from raid import SHARED_CAPTCHA_USER_ID
+from history import RETRO_SCAN_SETTINGS, start_recent_scan
 
 logger = logging.getLogger(__name__)
 
 waiting_for_rules = {}
+waiting_for_banned_words = {}
 waiting_for_report_chat = {}
 
 def create_admin_menu(bot, user_id, db: Database):
@@ -33,11 +37,15 @@ def create_settings_menu(bot, chat_id, user_id, db: Database):
         ('toxicity_filter', 'Фильтр токсичности', 'Обнаруживает токсичные сообщения с помощью ИИ, выдавая предупреждения.'),
         ('file_filter', 'Фильтр файлов', 'Блокирует отправку потенциально опасных файлов (например, .exe, .bat) и наказывает отправителя.'),
         ('report_system', 'Система жалоб', 'Добавляет команду /report. Вернитесь назад и нажмите на кнопку "Система жалоб", чтобы её настроить.'),
-        ('link_filter', 'Фильтр ссылок', 'Обнаруживает и удаляет сообщения, содержащие ссылки, выдавая предупреждения.'),
-        ('captcha_enabled', 'Капча для новых', 'Требует от новых участников пройти капчу перед отправкой сообщений.')
+        ('link_filter', 'Фильтр ссылок', 'Удаляет сообщения со ссылками, кроме разрешённых доменов (/links), выдавая предупреждения.'),
+        ('captcha_enabled', 'Капча для новых', 'Требует от новых участников пройти капчу перед отправкой сообщений.'),
+        ('flood_filter', 'Антифлуд', 'Удаляет сообщения сверх лимита и мьютит флудера. Лимит задаётся в группе командой /floodlimit.'),
+        ('spam_filter', 'Фильтр рассылок', 'Удаляет сообщения, которые почти без изменений рассылаются сразу во многие группы, выдавая предупреждения.'),
+        ('global_bans', 'Общий бан-лист', 'Баны этой группы попадают в общий список, а пользователи из него банятся при входе и при первом сообщении.'),
+        ('retro_scan', 'Проверка старых сообщений', 'Когда включается фильтр матов, ссылок или токсичности, недавние сообщения группы проверяются им, а нарушения удаляются без предупреждений.')
     ]
     for setting, text, description in buttons:
-        status = '✅' if settings.get(setting, False) else '❌'
+        status = '✅' if settings.get(setting, DEFAULT_SETTINGS.get(setting, False)) else '❌'
         btn_text = f"{text}: {status}"
         markup.row(
             types.InlineKeyboardButton(btn_text, callback_data=f"toggle:{setting}:{chat_id}"),
@@ -48,6 +56,7 @@ def create_settings_menu(bot, chat_id, user_id, db: Database):
         if not log_chat_id:
             markup.add(types.InlineKeyboardButton("⚙️ Настроить систему жалоб", callback_data=f"report_chat_{chat_id}"))
     markup.add(types.InlineKeyboardButton("📜 Информация и правила", callback_data=f"info_rules_{chat_id}"))
+    markup.add(types.InlineKeyboardButton("🚫 Запрещённые слова", callback_data=f"banned_words_{chat_id}"))
     markup.add(types.InlineKeyboardButton("💬 Команды", callback_data=f"commands_{chat_id}"))
     log_chat_id = db.get_report_chat(chat_id)
     if log_chat_id:
@@ -56,6 +65,21 @@ def create_settings_menu(bot, chat_id, user_id, db: Database):
     logger.info(f"Меню настроек для группы {chat_id} создано успешно: {settings}")
     return markup
 
+def create_banned_words_view(group_id, db: Database):
+    """Текст и кнопки меню запрещённых слов группы."""
+    words = db.get_banned_words(group_id)
+    listing = "\n".join(words) if words else "Список пуст."
+    # Сообщение Telegram ограничено 4096 символами
+    if len(listing) > 3500:
+        listing = listing[:3500].rsplit("\n", 1)[0] + "\n…"
+    markup = types.InlineKeyboardMarkup()
+    markup.row(
+        types.InlineKeyboardButton("➕ Добавить", callback_data=f"banned_add_{group_id}"),
+        types.InlineKeyboardButton("➖ Удалить", callback_data=f"banned_remove_{group_id}")
+    )
+    markup.add(types.InlineKeyboardButton("← Назад", callback_data=f"settings_{group_id}"))
+    return f"🚫 Запрещённые слова ({len(words)}):\n\n{listing}", markup
+
 def register_callbacks(bot, db: Database):
     logger.info("Регистрация обработчиков callback-запросов")
 
@@ -105,6 +129,13 @@ def register_callbacks(bot, db: Database):
             _, group_id, user_id = call.data.split('_')
             group_id = int(group_id)
             user_id = int(user_id)
+            shared = user_id == SHARED_CAPTCHA_USER_ID
+            if shared:
+                # Общая кнопка после рейда: капча для нажавшего, если он вступил и ещё не прошёл её
+                user_id = call.from_user.id
+                if user_id not in db.get_chat_members(group_id):
+                    bot.answer_callback_query(call.id, "Эта капча предназначена не для вас!", show_alert=True)
+                    return
             if call.from_user.id != user_id:
                 bot.answer_callback_query(call.id, "Эта капча предназначена не для вас!", show_alert=True)
                 return
@@ -113,8 +144,12 @@ def register_callbacks(bot, db: Database):
                 return
             db.set_captcha_passed(group_id, user_id)
             unrestrict_user(bot, group_id, user_id)
+            if shared:
+                bot.answer_callback_query(call.id, "✅ Капча пройдена, теперь вы можете писать в чат!", show_alert=True)
+                logger.info(f"Пользователь {user_id} прошел капчу после рейда в группе {group_id}")
+                return
             bot.edit_message_text(
-                f"✅ {get_username(bot, group_id, user_id)} успешно прошел капчу и может писать в чат!",
+                f"✅ {get_username(bot, group_id, user_id, call.from_user)} успешно прошел капчу и может писать в чат!",
                 call.message.chat.id,
                 call.message.message_id,
                 parse_mode='HTML'
@@ -169,7 +204,7 @@ def register_callbacks(bot, db: Database):
                 if not settings:
                     bot.answer_callback_query(call.id, "Ошибка: настройки группы не найдены.", show_alert=True)
                     return
-                old_value = settings.get(setting, False)
+                old_value = settings.get(setting, DEFAULT_SETTINGS.get(setting, False))
                 new_value = not old_value
                 db.update_group_setting(group_id, setting, new_value)
                 updated_settings = db.get_group_settings(group_id)
@@ -183,6 +218,8 @@ def register_callbacks(bot, db: Database):
                     reply_markup=create_settings_menu(bot, group_id, user_id, db)
                 )
                 bot.answer_callback_query(call.id, f"Настройка {setting} изменена на {'✅' if new_value else '❌'}.")
+                if new_value and setting in RETRO_SCAN_SETTINGS and updated_settings.get('retro_scan', False):
+                    start_recent_scan(bot, db, group_id, setting)
             else:
                 bot.answer_callback_query(call.id, "Вы не являетесь администратором этой группы!", show_alert=True)
         else:
@@ -209,8 +246,12 @@ def register_callbacks(bot, db: Database):
                 'toxicity_filter': 'Обнаруживает токсичные сообщения с помощью ИИ, выдавая предупреждения.',
                 'file_filter': 'Блокирует отправку потенциально опасных файлов (например, .exe, .bat) и наказывает отправителя.',
                 'report_system': 'Добавляет команду /report. Вернитесь назад и нажмите на кнопку "Система жалоб", чтобы её настроить.',
-                'link_filter': 'Обнаруживает и удаляет сообщения, содержащие ссылки, выдавая предупреждения.',
-                'captcha_enabled': 'Требует от новых участников пройти капчу перед отправкой сообщений.'
+                'link_filter': 'Удаляет сообщения со ссылками, кроме разрешённых доменов (/links), выдавая предупреждения.',
+                'captcha_enabled': 'Требует от новых участников пройти капчу перед отправкой сообщений.',
+                'flood_filter': 'Удаляет сообщения сверх лимита и мьютит флудера. Лимит задаётся в группе командой /floodlimit.',
+                'spam_filter': 'Удаляет сообщения, которые почти без изменений рассылаются сразу во многие группы, выдавая предупреждения.',
+                'global_bans': 'Баны этой группы попадают в общий список, а пользователи из него банятся при входе и при первом сообщении.',
+                'retro_scan': 'Когда включается фильтр матов, ссылок или токсичности, недавние сообщения группы проверяются им, а нарушения удаляются без предупреждений.'
             }
             description = descriptions.get(setting, 'Описание недоступно.')
             markup = types.InlineKeyboardMarkup()
@@ -250,6 +291,36 @@ def register_callbacks(bot, db: Database):
             logger.error(f"Ошибка в info_rules callback: {e}")
             bot.answer_callback_query(call.id, "Произошла ошибка.", show_alert=True)
 
+    @bot.callback_query_handler(func=lambda call: call.data.startswith('banned_'))
+    def handle_banned_words_callback(call):
+        try:
+            _, action, group_id = call.data.split('_')
+            group_id = int(group_id)
+            user_id = call.from_user.id
+            if user_id not in db.get_admins(group_id):
+                bot.answer_callback_query(call.id, "Вы не являетесь администратором этой группы!", show_alert=True)
+                return
+            text, markup = create_banned_words_view(group_id, db)
+            if action == 'words':
+                waiting_for_banned_words.pop(user_id, None)
+            else:
+                text += (
+                    "\n\nОтправьте слова или фразы для добавления, по одной на строку. "
+                    "Звёздочка на конце (казино*) запрещает все слова с этим началом."
+                    if action == 'add' else
+                    "\n\nОтправьте слова или фразы для удаления, по одной на строку."
+                )
+                waiting_for_banned_words[user_id] = {
+                    'group_id': group_id,
+                    'action': action,
+                    'message_id': call.message.message_id,
+                    'chat_id': call.message.chat.id
+                }
+            bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
+        except Exception as e:
+            logger.error(f"Ошибка в banned words callback: {e}")
+            bot.answer_callback_query(call.id, "Произошла ошибка.", show_alert=True)
+
     @bot.callback_query_handler(func=lambda call: call.data.startswith('report_chat_'))
     def handle_report_chat_callback(call):
         try:
@@ -301,7 +372,11 @@ def register_callbacks(bot, db: Database):
             "/mute [время] - Замьютить пользователя (ответ на сообщение)\n"
             "/unmute - Размьютить пользователя (ответ на сообщение или @username)\n"
             "/ban - Забанить пользователя (ответ на сообщение)\n"
-            "/reload - Обновить список администраторов группы",
+            "/reload - Обновить список администраторов группы\n"
+            "/floodlimit [сообщений/секунд] - Показать или изменить лимит антифлуда\n"
+            "/links [allow|deny|remove домены] - Показать или изменить списки доменов группы\n"
+            "/spamimage [remove] - Добавить картинку в список спам-картинок или убрать из него (ответ на фото)\n"
+            "/purge [число] - Удалить последние сообщения пользователя (ответ на сообщение)",
             call.message.chat.id,
             call.message.message_id,
             parse_mode='HTML',
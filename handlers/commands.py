@@ -1,31 +1,19 @@
 from telebot import types
 import logging
 from datetime import datetime, timedelta
-from threading import Timer
-from utils import get_username, parse_mute_duration, format_duration, create_main_menu
+from utils import get_username, parse_mute_duration, format_duration, create_main_menu, delete_message_after_delay
 from database import Database
 from handlers.callbacks import create_admin_menu, create_settings_menu, waiting_for_report_chat
-from config import MESSAGE_LIFETIME_SECONDS
+from config import REPORTS_COUNT_WINDOW_SECONDS, FLOOD_DEFAULT_LIMIT, PURGE_DEFAULT_COUNT, RECENT_MESSAGES_PER_CHAT
+from flood import parse_flood_limit
+from links import parse_domain
+from moderation import share_ban, delete_messages
+from history import recent as recent_messages
+from bot_permissions import bot_permissions
+from image_hash import photo_hash
 
 logger = logging.getLogger(__name__)
 
-def delete_message_after_delay(bot, chat_id, message_id, db):
-    """Удаляет сообщение через заданное время, если чат не является группой для репортов."""
-    try:
-        db.cursor.execute("SELECT chat_id FROM report_chats WHERE log_chat_id = ?", (chat_id,))
-        if db.cursor.fetchone():
-            logger.info(f"Сообщение {message_id} в чате {chat_id} не удаляется, так как это группа для репортов")
-            return
-        def delete():
-            try:
-                bot.delete_message(chat_id, message_id)
-                logger.info(f"Сообщение {message_id} удалено в чате {chat_id}")
-            except Exception as e:
-                logger.error(f"Ошибка удаления сообщения {message_id} в чате {chat_id}: {e}")
-        Timer(MESSAGE_LIFETIME_SECONDS, delete).start()
-    except Exception as e:
-        logger.error(f"Ошибка в планировании удаления сообщения {message_id} в чате {chat_id}: {e}")
-
 def register_commands(bot, db: Database):
     """Регистрация обработчиков команд"""
 
@@ -107,6 +95,10 @@ def register_commands(bot, db: Database):
                 "/unmute - Размьютить пользователя (ответ на сообщение или @username)\n"
                 "/ban - Забанить пользователя (ответ на сообщение)\n"
                 "/reload - Обновить список администраторов группы\n"
+                "/floodlimit [сообщений/секунд] - Показать или изменить лимит антифлуда\n"
+                "/links [allow|deny|remove домены] - Показать или изменить списки доменов группы\n"
+                "/spamimage [remove] - Добавить картинку в список спам-картинок или убрать из него (ответ на фото)\n"
+                "/purge [число] - Удалить последние сообщения пользователя (ответ на сообщение)\n"
                 "/setreportchat - Установить текущий чат как канал для репортов (только во время настройки)",
                 parse_mode='HTML'
             )
@@ -242,6 +234,7 @@ def register_commands(bot, db: Database):
             elif command == '/ban':
                 try:
                     bot.kick_chat_member(chat_id, target_user_id)
+                    share_ban(db, chat_id, target_user_id, f"/ban от администратора {user_id}")
                     sent_message = bot.reply_to(
                         message,
                         f"Пользователь {get_username(bot, chat_id, target_user_id)} забанен.",
@@ -262,11 +255,13 @@ def register_commands(bot, db: Database):
 
                 reason = ' '.join(message.text.split()[1:]) if len(message.text.split()) > 1 else "Нет причины"
                 db.add_report(chat_id, user_id, target_user_id, reason, message_id)
+                reports_count = db.count_user_reports(chat_id, target_user_id, REPORTS_COUNT_WINDOW_SECONDS)
 
                 report_msg = (
-                    f"Жалоба от: {get_username(bot, chat_id, user_id)}\n"
+                    f"Жалоба от: {get_username(bot, chat_id, user_id, message.from_user)}\n"
                     f"На: {get_username(bot, chat_id, target_user_id)}\n"
-                    f"Причина: {reason}"
+                    f"Причина: {reason}\n"
+                    f"Жалоб на пользователя за период ({format_duration(REPORTS_COUNT_WINDOW_SECONDS)}): {reports_count}"
                 )
 
                 log_chat_id = db.get_report_chat(chat_id)
@@ -294,6 +289,162 @@ def register_commands(bot, db: Database):
             sent_message = bot.reply_to(message, "❌ Произошла ошибка.")
             delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
 
+    @bot.message_handler(commands=['floodlimit'])
+    def handle_flood_limit(message):
+        try:
+            if message.chat.type not in ['group', 'supergroup']:
+                bot.reply_to(message, "Эта команда работает только в группах.")
+                return
+
+            chat_id = message.chat.id
+            if message.from_user.id not in db.get_admins(chat_id):
+                sent_message = bot.reply_to(message, "Эта команда только для администраторов.")
+                delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
+                return
+
+            args = message.text.split()
+            if len(args) < 2:
+                limit, window = db.get_group_settings(chat_id).get('flood_limit') or FLOOD_DEFAULT_LIMIT
+                sent_message = bot.reply_to(message, f"Лимит антифлуда: {limit} сообщений за {window} с. Изменить: /floodlimit 5/10")
+            else:
+                parsed = parse_flood_limit(args[1])
+                if not parsed:
+                    sent_message = bot.reply_to(message, "❌ Укажите лимит в формате сообщений/секунд, например /floodlimit 5/10")
+                else:
+                    db.update_group_setting(chat_id, 'flood_limit', list(parsed))
+                    sent_message = bot.reply_to(message, f"✅ Лимит антифлуда: {parsed[0]} сообщений за {parsed[1]} с.")
+                    logger.info(f"Лимит антифлуда в группе {chat_id} изменён на {parsed}")
+            delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
+        except Exception as e:
+            logger.error(f"Ошибка в /floodlimit: {e}")
+            bot.reply_to(message, "❌ Произошла ошибка.")
+
+    @bot.message_handler(commands=['links'])
+    def handle_links(message):
+        try:
+            if message.chat.type not in ['group', 'supergroup']:
+                bot.reply_to(message, "Эта команда работает только в группах.")
+                return
+
+            chat_id = message.chat.id
+            if message.from_user.id not in db.get_admins(chat_id):
+                sent_message = bot.reply_to(message, "Эта команда только для администраторов.")
+                delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
+                return
+
+            args = message.text.split()
+            action = args[1].lower() if len(args) > 1 else None
+            domains = [domain for domain in map(parse_domain, args[2:]) if domain]
+            if action is None:
+                entries = db.get_link_domains(chat_id)
+                allowed = [domain for domain, is_allowed in entries if is_allowed]
+                denied = [domain for domain, is_allowed in entries if not is_allowed]
+                sent_message = bot.reply_to(
+                    message,
+                    f"Разрешённые домены: {', '.join(allowed) or 'нет'}\n"
+                    f"Запрещённые домены: {', '.join(denied) or 'нет'}\n"
+                    f"Изменить: /links allow example.com, /links deny example.com, /links remove example.com"
+                )
+            elif action not in ('allow', 'deny', 'remove') or not domains:
+                sent_message = bot.reply_to(message, "❌ Использование: /links allow|deny|remove домен [домен ...]")
+            else:
+                if action == 'remove':
+                    db.remove_link_domains(chat_id, domains)
+                else:
+                    db.set_link_domains(chat_id, domains, action == 'allow')
+                sent_message = bot.reply_to(message, f"✅ Списки доменов обновлены: {', '.join(domains)}")
+                logger.info(f"Списки доменов группы {chat_id} изменены: {action} {domains}")
+            delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
+        except Exception as e:
+            logger.error(f"Ошибка в /links: {e}")
+            bot.reply_to(message, "❌ Произошла ошибка.")
+
+    @bot.message_handler(commands=['spamimage'])
+    def handle_spam_image(message):
+        try:
+            if message.chat.type not in ['group', 'supergroup']:
+                bot.reply_to(message, "Эта команда работает только в группах.")
+                return
+
+            chat_id = message.chat.id
+            user_id = message.from_user.id
+            if user_id not in db.get_admins(chat_id):
+                sent_message = bot.reply_to(message, "Эта команда только для администраторов.")
+                delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
+                return
+
+            target = message.reply_to_message
+            if not target or not target.photo:
+                sent_message = bot.reply_to(message, "❌ Ответьте этой командой на сообщение с картинкой.")
+                delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
+                return
+
+            image_hash = photo_hash(bot, target.photo)
+            if image_hash is None:
+                sent_message = bot.reply_to(message, "❌ Проверка картинок недоступна: не установлен Pillow.")
+            elif len(message.text.split()) > 1 and message.text.split()[1].lower() == 'remove':
+                db.remove_spam_image(image_hash)
+                sent_message = bot.reply_to(message, "✅ Картинка убрана из списка спам-картинок.")
+                logger.info(f"Спам-картинка {image_hash:016x} удалена администратором {user_id} в группе {chat_id}")
+            else:
+                db.add_spam_image(image_hash, chat_id, user_id)
+                bot.delete_message(chat_id, target.message_id)
+                sent_message = bot.reply_to(message, "✅ Картинка добавлена в список спам-картинок всех групп.")
+                logger.info(f"Спам-картинка {image_hash:016x} добавлена администратором {user_id} в группе {chat_id}")
+            delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
+        except Exception as e:
+            logger.error(f"Ошибка в /spamimage: {e}")
+            bot.reply_to(message, "❌ Произошла ошибка.")
+
+    @bot.message_handler(commands=['purge'])
+    def handle_purge(message):
+        try:
+            if message.chat.type not in ['group', 'supergroup']:
+                bot.reply_to(message, "Эта команда работает только в группах.")
+                return
+
+            chat_id = message.chat.id
+            if message.from_user.id not in db.get_admins(chat_id):
+                sent_message = bot.reply_to(message, "Эта команда только для администраторов.")
+                delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
+                return
+
+            target = message.reply_to_message
+            args = message.text.split()
+            count = int(args[1]) if len(args) > 1 and args[1].isdigit() else None
+            if not target or (len(args) > 1 and not count):
+                sent_message = bot.reply_to(message, "❌ Ответьте на сообщение пользователя: /purge [число сообщений]")
+                delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
+                return
+            if not bot_permissions.can_delete(bot, chat_id):
+                sent_message = bot.reply_to(message, "❌ У бота нет права удалять сообщения.")
+                delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
+                return
+
+            user_id = target.from_user.id
+            limit = min(count or PURGE_DEFAULT_COUNT, RECENT_MESSAGES_PER_CHAT)
+            # Удаляется ровно limit сообщений пользователя; сообщение, на которое ответили,
+            # удаляется всегда, даже если оно старше последних limit. Команда в счёт не входит
+            message_ids = [
+                message_id for message_id in recent_messages.user_messages(chat_id, user_id, limit)
+                if message_id != message.message_id
+            ]
+            if target.message_id not in message_ids:
+                message_ids = message_ids[:limit - 1] + [target.message_id]
+            delete_messages(bot, chat_id, message_ids)
+            recent_messages.discard(chat_id, message_ids)
+            bot.delete_message(chat_id, message.message_id)
+            sent_message = bot.send_message(
+                chat_id,
+                f"🧹 Удалено сообщений {get_username(bot, chat_id, user_id, target.from_user)}: {len(message_ids)}.",
+                parse_mode='HTML'
+            )
+            delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
+            logger.info(f"Удалено {len(message_ids)} сообщений пользователя {user_id} в группе {chat_id} администратором {message.from_user.id}")
+        except Exception as e:
+            logger.error(f"Ошибка в /purge: {e}")
+            bot.reply_to(message, "❌ Произошла ошибка.")
+
     @bot.message_handler(commands=['unmute'])
     def handle_unmute(message):
         try:
@@ -1,13 +1,21 @@
 from telebot import types
-import re
 import logging
-import sqlite3
 from .security import is_dangerous_file, handle_dangerous_file
-from datetime import datetime, timedelta
-from config import PROFANITY_REGEX, MESSAGE_LIFETIME_SECONDS, LINK_REGEX
-from utils import get_username, create_main_menu, unrestrict_user, check_message, delete_message_after_delay
+from config import DEFAULT_SETTINGS, MESSAGE_LIFETIME_SECONDS
+from utils import get_username, create_main_menu, unrestrict_user, check_message, delete_message_after_delay, send_notice
 from database import Database
-from .callbacks import create_admin_menu, create_settings_menu, waiting_for_rules
+from bot_permissions import bot_permissions
+from moderation import warn_user, enforce_global_ban
+from raid import detector as raid_detector, restrict_during_raid
+from flood import check_flood
+from duplicates import is_campaign
+from filters import engine as filter_engine, banned_words_matcher, normalize_term
+from model.normalize import normalize
+from links import find_blocked_link
+from image_hash import find_spam_image
+from edits import recent as recent_fingerprints, fingerprint, changed_stages, TEXT_STAGES
+from history import recent as recent_messages
+from .callbacks import create_admin_menu, create_settings_menu, create_banned_words_view, waiting_for_rules, waiting_for_banned_words
 
 logger = logging.getLogger(__name__)
 
@@ -19,25 +27,90 @@ def register_events(bot, db: Database):
     _bot = bot
     _db = db
     
+    def check_text(message, normalized, entities, settings, stages=TEXT_STAGES):
+        """Фильтры текста сообщения или подписи к файлу в порядке приоритета.
+
+        normalized - результат normalize(), общий для всех фильтров; stages -
+        этапы из edits.STAGES, которые нужно выполнить (при правке - только
+        изменившиеся). При нарушении удаляет сообщение с предупреждением и
+        возвращает True.
+        """
+        chat_id = message.chat.id
+        user_id = message.from_user.id
+        # Рассылку учитываем во всех чатах, даже где фильтр выключен, чтобы видеть её целиком
+        if 'clean' in stages and is_campaign(chat_id, normalized) and settings.get('spam_filter', DEFAULT_SETTINGS['spam_filter']):
+            warning_count = warn_user(bot, db, message, "массовые рассылки запрещены!")
+            logger.info(f"Обнаружена рассылка в сообщении от {user_id} в группе {chat_id}, предупреждение {warning_count}")
+            return True
+
+        banned_words = db.get_banned_words(chat_id) if 'words' in stages else None
+        if banned_words and banned_words_matcher(chat_id, banned_words).check(normalized):
+            warning_count = warn_user(bot, db, message, "это слово запрещено в группе!")
+            logger.info(f"Запрещённое слово в сообщении от {user_id} в группе {chat_id}, предупреждение {warning_count}")
+            return True
+
+        if 'words' in stages and settings.get('profanity_filter', True) and filter_engine.check_profanity(normalized):
+            warning_count = warn_user(bot, db, message, "не используйте нецензурные выражения!")
+            logger.info(f"Обнаружен мат в сообщении от {user_id} в группе {chat_id}, предупреждение {warning_count}")
+            return True
+
+        if 'links' in stages and settings.get('link_filter', True) and find_blocked_link(
+            db, chat_id, normalized.stripped, entities
+        ):
+            warning_count = warn_user(bot, db, message, "отправка ссылок запрещена!")
+            logger.info(f"Обнаружена ссылка в сообщении от {user_id} в группе {chat_id}, предупреждение {warning_count}")
+            return True
+
+        if 'clean' in stages and settings.get('toxicity_filter', True) and check_message(normalized)['is_toxic']:
+            warning_count = warn_user(bot, db, message, "ваше сообщение слишком токсично!")
+            logger.info(f"Обнаружено токсичное сообщение от {user_id} в группе {chat_id}, предупреждение {warning_count}")
+            return True
+        return False
+
+    def check_media(message, settings):
+        """Проверки файла или фото сообщения. При нарушении возвращает True."""
+        chat_id = message.chat.id
+        user_id = message.from_user.id
+        if settings.get('file_filter', True) and not message.photo:
+            if is_dangerous_file(message, bot):
+                handle_dangerous_file(bot, db, chat_id, user_id, message.message_id)
+                logger.info(f"Обнаружен опасный файл от {user_id} в группе {chat_id}")
+                return True
+
+        # Для фото скачивается только самая маленькая миниатюра
+        if message.photo and settings.get('spam_filter', DEFAULT_SETTINGS['spam_filter']) and find_spam_image(bot, db, message.photo) is not None:
+            warning_count = warn_user(bot, db, message, "изображения из спам-рассылок запрещены!")
+            logger.info(f"Обнаружена спам-картинка от {user_id} в группе {chat_id}, предупреждение {warning_count}")
+            return True
+        return False
+
+    def media_id(message):
+        """file_unique_id файла или фото сообщения или None."""
+        if message.photo:
+            return message.photo[-1].file_unique_id
+        file_info = message.document or message.audio or message.video or message.voice
+        return file_info.file_unique_id if file_info else None
+
+    def message_content(message):
+        """Нормализованный текст или подпись сообщения (None, если их нет) и его сущности."""
+        if message.text is not None:
+            return normalize(message.text), message.entities
+        if message.caption:
+            return normalize(message.caption), message.caption_entities
+        return None, None
+
     @bot.my_chat_member_handler()
     def handle_chat_member_update(update):
         try:
             logger.info(f"Получено обновление my_chat_member: {update}")
             chat_id = update.chat.id
+            bot_permissions.update(chat_id, update.new_chat_member)
 
             if update.new_chat_member.status == 'kicked' and update.chat.type in ['group', 'supergroup']:
                 logger.info(f"Бот удален из группы {chat_id}")
-                with sqlite3.connect(db.db_name) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("DELETE FROM groups WHERE chat_id = ?", (chat_id,))
-                    cursor.execute("DELETE FROM admins WHERE chat_id = ?", (chat_id,))
-                    cursor.execute("DELETE FROM warnings WHERE chat_id = ?", (chat_id,))
-                    cursor.execute("DELETE FROM reports WHERE chat_id = ?", (chat_id,))
-                    cursor.execute("DELETE FROM chat_members WHERE chat_id = ?", (chat_id,))
-                    cursor.execute("DELETE FROM report_chats WHERE chat_id = ? OR log_chat_id = ?", (chat_id, chat_id))
-                    cursor.execute("DELETE FROM captcha_status WHERE chat_id = ?", (chat_id,))
-                    conn.commit()
-                    logger.info(f"Данные группы {chat_id} удалены из базы")
+                bot_permissions.forget(chat_id)
+                recent_messages.forget_chat(chat_id)
+                db.purge_group(chat_id)
                 return
 
             if (update.old_chat_member.status == 'kicked' and 
@@ -54,8 +127,7 @@ def register_events(bot, db: Database):
                     logger.error(f"Ошибка обновления админов группы {chat_id}: {e}")
 
                 # Проверка прав бота
-                bot_member = bot.get_chat_member(chat_id, bot.get_me().id)
-                if not (bot_member.can_delete_messages and bot_member.can_restrict_members):
+                if not (bot_permissions.can_delete(bot, chat_id) and bot_permissions.can_restrict(bot, chat_id)):
                     sent_message = bot.send_message(
                         chat_id,
                         "⚠️ У меня недостаточно прав для управления чатом! "
@@ -66,12 +138,11 @@ def register_events(bot, db: Database):
 
                 settings = db.get_group_settings(chat_id)
                 if settings.get('greeting_enabled', True):
-                    sent_message = bot.send_message(
-                        chat_id,
+                    send_notice(
+                        bot, db, chat_id,
                         "✅ Бот успешно добавлен в группу! "
                         "Для настройки перейдите в личные сообщения бота и используйте команду /start."
                     )
-                    delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
                     logger.info(f"Приветственное сообщение отправлено в группу {chat_id}")
 
                 for admin_id in db.get_admins(chat_id):
@@ -118,8 +189,7 @@ def register_events(bot, db: Database):
         """Обработка новых участников"""
         try:
             chat_id = message.chat.id
-            db.cursor.execute("SELECT chat_id FROM report_chats WHERE log_chat_id = ?", (chat_id,))
-            if db.cursor.fetchone():
+            if db.is_report_chat(chat_id):
                 logger.info(f"Событие new_chat_members в чате {chat_id} пропущено, так как это группа для репортов")
                 return
 
@@ -130,10 +200,29 @@ def register_events(bot, db: Database):
                 logger.error(f"Ошибка удаления системного сообщения {message.message_id} в чате {chat_id}: {e}")
 
             settings = db.get_group_settings(chat_id)
+            # Пользователи из общего бан-листа банятся сразу, до приветствия и капчи
+            members = [
+                member for member in message.new_chat_members
+                if not enforce_global_ban(bot, db, chat_id, member.id, settings, user=member)
+            ]
+            if not members:
+                return
+
+            # Вступления учитываются и при выключенных приветствиях: рейд ограничивается в любом случае.
+            # Во время рейда вступления обрабатываются пачкой, без приветствий и капч по одному
+            raid_states = [raid_detector.record_join(chat_id) for _ in members]
+            if any(raid_states):
+                if settings.get('captcha_enabled', True):
+                    restrict_during_raid(bot, db, chat_id, members, 'start' in raid_states)
+                else:
+                    for member in members:
+                        db.add_chat_member(chat_id, member.id)
+                return
+
             if not settings.get('greeting_enabled', True):
                 return
 
-            for member in message.new_chat_members:
+            for member in members:
                 user_id = member.id
                 username = member.username or member.first_name
                 logger.info(f"Новый участник {user_id} ({username}) в группе {chat_id}")
@@ -153,7 +242,7 @@ def register_events(bot, db: Database):
                         ))
                         sent_message = bot.send_message(
                             chat_id,
-                            f"Добро пожаловать, {get_username(bot, chat_id, user_id)}! "
+                            f"Добро пожаловать, {get_username(bot, chat_id, user_id, member)}! "
                             f"Пройдите капчу, нажав на кнопку ниже, чтобы начать писать в чат.\n"
                             f"Ознакомьтесь с правилами и командами через /info.",
                             parse_mode='HTML',
@@ -163,13 +252,12 @@ def register_events(bot, db: Database):
                     except Exception as e:
                         logger.error(f"Ошибка при установке ограничений для {user_id} в чате {chat_id}: {e}")
                 else:
-                    sent_message = bot.send_message(
-                        chat_id,
-                        f"Добро пожаловать, {get_username(bot, chat_id, user_id)}! "
+                    send_notice(
+                        bot, db, chat_id,
+                        f"Добро пожаловать, {get_username(bot, chat_id, user_id, member)}! "
                         f"Ознакомьтесь с правилами и командами через /info.",
                         parse_mode='HTML'
                     )
-                    delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
 
         except Exception as e:
             logger.error(f"Ошибка в handle_new_chat_members: {e}")
@@ -179,31 +267,29 @@ def register_events(bot, db: Database):
         """Обработка выхода участников"""
         try:
             chat_id = message.chat.id
-            db.cursor.execute("SELECT chat_id FROM report_chats WHERE log_chat_id = ?", (chat_id,))
-            if db.cursor.fetchone():
+            if db.is_report_chat(chat_id):
                 logger.info(f"Событие left_chat_member в чате {chat_id} пропущено, так как это группа для репортов")
                 return
 
-            settings = db.get_group_settings(chat_id)
-            if not settings.get('greeting_enabled', True):
-                return
-
             user_id = message.left_chat_member.id
             logger.info(f"Участник {user_id} покинул группу {chat_id}")
             db.remove_chat_member(chat_id, user_id)
 
+            settings = db.get_group_settings(chat_id)
+            if not settings.get('greeting_enabled', True):
+                return
+
             try:
                 bot.delete_message(chat_id, message.message_id)
                 logger.info(f"Системное сообщение {message.message_id} удалено в чате {chat_id}")
             except Exception as e:
                 logger.error(f"Ошибка удаления системного сообщения {message.message_id} в чате {chat_id}: {e}")
 
-            sent_message = bot.send_message(
-                chat_id,
-                f"Пользователь {get_username(bot, chat_id, user_id)} покинул группу.",
+            send_notice(
+                bot, db, chat_id,
+                f"Пользователь {get_username(bot, chat_id, user_id, message.left_chat_member)} покинул группу.",
                 parse_mode='HTML'
             )
-            delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
 
         except Exception as e:
             logger.error(f"Ошибка в handle_left_chat_member: {e}")
@@ -238,11 +324,32 @@ def register_events(bot, db: Database):
                 logger.info(f"Новые правила установлены для группы {group_id} пользователем {user_id}")
                 return
 
+            if user_id in waiting_for_banned_words and message.chat.type == 'private':
+                wait_data = waiting_for_banned_words.pop(user_id)
+                group_id = wait_data['group_id']
+                words = [word for word in map(normalize_term, message.text.splitlines()) if word.strip('*')]
+                if wait_data['action'] == 'add':
+                    db.add_banned_words(group_id, words)
+                else:
+                    db.remove_banned_words(group_id, words)
+                text, markup = create_banned_words_view(group_id, db)
+                bot.edit_message_text(text, wait_data['chat_id'], wait_data['message_id'], reply_markup=markup)
+                bot.delete_message(chat_id=user_id, message_id=message.message_id)
+                logger.info(f"Запрещённые слова группы {group_id} изменены пользователем {user_id}: {wait_data['action']} {len(words)}")
+                return
+
             if message.chat.type not in ['group', 'supergroup']:
                 return
 
             settings = db.get_group_settings(chat_id)
 
+            if enforce_global_ban(bot, db, chat_id, user_id, settings, message.message_id, message.from_user):
+                return
+
+            # Антифлуд проверяется до остальных, более дорогих фильтров
+            if check_flood(bot, db, message, settings):
+                return
+
             # Проверка капчи
             if settings.get('captcha_enabled', True) and not db.has_passed_captcha(chat_id, user_id):
                 bot.delete_message(chat_id, message.message_id)
@@ -253,7 +360,7 @@ def register_events(bot, db: Database):
                 ))
                 sent_message = bot.send_message(
                     chat_id,
-                    f"{get_username(bot, chat_id, user_id)}, пройдите капчу, чтобы отправлять сообщения!",
+                    f"{get_username(bot, chat_id, user_id, message.from_user)}, пройдите капчу, чтобы отправлять сообщения!",
                     parse_mode='HTML',
                     reply_markup=markup
                 )
@@ -261,115 +368,12 @@ def register_events(bot, db: Database):
                 logger.info(f"Сообщение от {user_id} удалено в группе {chat_id}, так как капча не пройдена")
                 return
 
-            # Проверка фильтров в порядке приоритета
-            if settings.get('profanity_filter', True):
-                if re.search(PROFANITY_REGEX, message.text.lower()):
-                    warning_count = db.add_warning(chat_id, user_id)
-                    bot.delete_message(chat_id, message.message_id)
-                    sent_message = bot.send_message(
-                        chat_id,
-                        f"{get_username(bot, chat_id, user_id)}, не используйте нецензурные выражения! Предупреждение {warning_count}/3.",
-                        parse_mode='HTML'
-                    )
-                    delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
-                    logger.info(f"Обнаружен мат в сообщении от {user_id} в группе {chat_id}, предупреждение {warning_count}")
-
-                    if warning_count >= 3:
-                        unmute_time = datetime.now() + timedelta(hours=1)
-                        bot.restrict_chat_member(
-                            chat_id,
-                            user_id,
-                            until_date=unmute_time,
-                            permissions=types.ChatPermissions(can_send_messages=False)
-                        )
-                        markup = types.InlineKeyboardMarkup()
-                        markup.add(types.InlineKeyboardButton(
-                            "Размьютить",
-                            callback_data=f"unmute_{chat_id}_{user_id}"
-                        ))
-                        sent_message = bot.send_message(
-                            chat_id,
-                            f"Пользователь {get_username(bot, chat_id, user_id)} замьючен на 1 час за 3 предупреждения.",
-                            reply_markup=markup,
-                            parse_mode='HTML'
-                        )
-                        delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
-                        db.reset_warnings(chat_id, user_id)
-                        logger.info(f"Пользователь {user_id} замьючен в группе {chat_id} за 3 предупреждения")
-                    return  # Прекращаем дальнейшие проверки
-
-            if settings.get('link_filter', True):
-                if re.search(LINK_REGEX, message.text):
-                    warning_count = db.add_warning(chat_id, user_id)
-                    bot.delete_message(chat_id, message.message_id)
-                    sent_message = bot.send_message(
-                        chat_id,
-                        f"{get_username(bot, chat_id, user_id)}, отправка ссылок запрещена! Предупреждение {warning_count}/3.",
-                        parse_mode='HTML'
-                    )
-                    delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
-                    logger.info(f"Обнаружена ссылка в сообщении от {user_id} в группе {chat_id}, предупреждение {warning_count}")
-
-                    if warning_count >= 3:
-                        unmute_time = datetime.now() + timedelta(hours=1)
-                        bot.restrict_chat_member(
-                            chat_id,
-                            user_id,
-                            until_date=unmute_time,
-                            permissions=types.ChatPermissions(can_send_messages=False)
-                        )
-                        markup = types.InlineKeyboardMarkup()
-                        markup.add(types.InlineKeyboardButton(
-                            "Размьютить",
-                            callback_data=f"unmute_{chat_id}_{user_id}"
-                        ))
-                        sent_message = bot.send_message(
-                            chat_id,
-                            f"Пользователь {get_username(bot, chat_id, user_id)} замьючен на 1 час за 3 предупреждения.",
-                            reply_markup=markup,
-                            parse_mode='HTML'
-                        )
-                        delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
-                        db.reset_warnings(chat_id, user_id)
-                        logger.info(f"Пользователь {user_id} замьючен в группе {chat_id} за 3 предупреждения")
-                    return  # Прекращаем дальнейшие проверки
-
-            if settings.get('toxicity_filter', True):
-                toxicity_result = check_message(message.text)
-                if toxicity_result['is_toxic']:
-                    warning_count = db.add_warning(chat_id, user_id)
-                    bot.delete_message(chat_id, message.message_id)
-                    sent_message = bot.send_message(
-                        chat_id,
-                        f"{get_username(bot, chat_id, user_id)}, ваше сообщение слишком токсично! Предупреждение {warning_count}/3.",
-                        parse_mode='HTML'
-                    )
-                    delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
-                    logger.info(f"Обнаружено токсичное сообщение от {user_id} в группе {chat_id}, предупреждение {warning_count}")
-
-                    if warning_count >= 3:
-                        unmute_time = datetime.now() + timedelta(hours=1)
-                        bot.restrict_chat_member(
-                            chat_id,
-                            user_id,
-                            until_date=unmute_time,
-                            permissions=types.ChatPermissions(can_send_messages=False)
-                        )
-                        markup = types.InlineKeyboardMarkup()
-                        markup.add(types.InlineKeyboardButton(
-                            "Размьютить",
-                            callback_data=f"unmute_{chat_id}_{user_id}"
-                        ))
-                        sent_message = bot.send_message(
-                            chat_id,
-                            f"Пользователь {get_username(bot, chat_id, user_id)} замьючен на 1 час за 3 предупреждения.",
-                            reply_markup=markup,
-                            parse_mode='HTML'
-                        )
-                        delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
-                        db.reset_warnings(chat_id, user_id)
-                        logger.info(f"Пользователь {user_id} замьючен в группе {chat_id} за 3 предупреждения")
-                    return  # Если обнаружено нарушение, прекращаем дальнейшие проверки
+            # Проверка фильтров в порядке приоритета; при нарушении дальнейшие проверки не нужны
+            # Текст нормализуется один раз, все фильтры используют один и тот же результат
+            normalized = normalize(message.text)
+            if not check_text(message, normalized, message.entities, settings):
+                recent_fingerprints.remember(chat_id, message.message_id, fingerprint(normalized, message.entities))
+                recent_messages.add(chat_id, message.message_id, user_id, message.text)
 
         except Exception as e:
             logger.error(f"Ошибка в handle_text_messages: {e}")
@@ -390,6 +394,12 @@ def register_events(bot, db: Database):
 
             settings = db.get_group_settings(chat_id)
 
+            if enforce_global_ban(bot, db, chat_id, user_id, settings, message.message_id, message.from_user):
+                return
+
+            if check_flood(bot, db, message, settings):
+                return
+
             # Проверка капчи для файлов
             if settings.get('captcha_enabled', True) and not db.has_passed_captcha(chat_id, user_id):
                 bot.delete_message(chat_id, message.message_id)
@@ -400,7 +410,7 @@ def register_events(bot, db: Database):
                 ))
                 sent_message = bot.send_message(
                     chat_id,
-                    f"{get_username(bot, chat_id, user_id)}, пройдите капчу, чтобы отправлять файлы!",
+                    f"{get_username(bot, chat_id, user_id, message.from_user)}, пройдите капчу, чтобы отправлять файлы!",
                     parse_mode='HTML',
                     reply_markup=markup
                 )
@@ -408,10 +418,52 @@ def register_events(bot, db: Database):
                 logger.info(f"Файл от {user_id} удален в группе {chat_id}, так как капча не пройдена")
                 return
 
-            if settings.get('file_filter', True):
-                if is_dangerous_file(message):
-                    handle_dangerous_file(bot, db, chat_id, user_id, message.message_id)
-                    logger.info(f"Обнаружен опасный файл от {user_id} в группе {chat_id}")
+            if check_media(message, settings):
+                return
+
+            normalized, entities = message_content(message)
+            if normalized is not None and check_text(message, normalized, entities, settings):
+                return
+            recent_fingerprints.remember(chat_id, message.message_id, fingerprint(normalized, entities, media_id(message)))
+            recent_messages.add(chat_id, message.message_id, user_id, message.caption)
+
+        except Exception as e:
+            logger.error(f"Ошибка в handle_files: {e}")
+
+    @bot.edited_message_handler(content_types=['text', 'document', 'photo', 'audio', 'voice'])
+    def handle_edited_message(message):
+        """Повторная проверка изменённого сообщения или подписи.
+
+        Правка, не изменившая нормализованный текст, ссылки и файл (исправленное
+        форматирование, та же подпись), не проверяется вовсе; иначе выполняются
+        только этапы, входные данные которых изменились, так что модель не
+        запускается повторно на тот же текст.
+        """
+        try:
+            if message.chat.type not in ['group', 'supergroup']:
+                return
+
+            chat_id = message.chat.id
+            user_id = message.from_user.id
+            if user_id in db.get_admins(chat_id):
+                return
+
+            normalized, entities = message_content(message)
+            current = fingerprint(normalized, entities, media_id(message))
+            stages = changed_stages(recent_fingerprints.get(chat_id, message.message_id), current)
+            if not stages:
+                logger.debug(f"Правка сообщения {message.message_id} в группе {chat_id} не изменила проверяемых данных")
+                return
+
+            settings = db.get_group_settings(chat_id)
+            if (('media' in stages and message.content_type != 'text' and check_media(message, settings)) or
+                    (normalized is not None and check_text(message, normalized, entities, settings, stages))):
+                recent_fingerprints.forget(chat_id, message.message_id)
+                recent_messages.discard(chat_id, [message.message_id])
+                logger.info(f"Изменённое сообщение {message.message_id} от {user_id} в группе {chat_id} нарушает правила")
+                return
+            recent_fingerprints.remember(chat_id, message.message_id, current)
+            recent_messages.update_text(chat_id, message.message_id, message.text if message.text is not None else message.caption)
 
         except Exception as e:
-            logger.error(f"Ошибка в handle_files: {e}")
\ No newline at end of file
+            logger.error(f"Ошибка в handle_edited_message: {e}")
\ No newline at end of file
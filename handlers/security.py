@@ -1,6 +1,10 @@
 import logging
 from telebot import types
 from utils import get_username, delete_message_after_delay
+from bot_permissions import bot_permissions
+from moderation import share_ban
+from config import FILE_SNIFFING
+from file_inspection import inspect_file
 
 logger = logging.getLogger(__name__)
 
@@ -23,8 +27,12 @@ ALLOWED_EXTENSIONS = {
     '.pdf', '.txt', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx'  # Документы
 }
 
-def is_dangerous_file(message: types.Message) -> bool:
-    """Проверяет, является ли файл в сообщении потенциально опасным"""
+def is_dangerous_file(message: types.Message, bot=None) -> bool:
+    """Проверяет, является ли файл в сообщении потенциально опасным.
+
+    Если передан bot, файл с разрешённым расширением дополнительно проверяется
+    по содержимому (переименованный .exe, документ с макросами).
+    """
     try:
         file_info = None
         if message.document:
@@ -53,6 +61,11 @@ def is_dangerous_file(message: types.Message) -> bool:
         if file_ext not in ALLOWED_EXTENSIONS:
             logger.info(f"Файл с неизвестным расширением {file_ext} в сообщении {message.message_id}")
             return True  # Неизвестные расширения считаем опасными
+        if bot is not None and FILE_SNIFFING:
+            reason = inspect_file(bot, file_info, file_ext, DANGEROUS_EXTENSIONS)
+            if reason:
+                logger.info(f"Файл {file_name} в сообщении {message.message_id} опасен по содержимому: {reason}")
+                return True
         logger.info(f"Файл с расширением {file_ext} в сообщении {message.message_id} разрешён")
         return False
     except Exception as e:
@@ -62,12 +75,12 @@ def is_dangerous_file(message: types.Message) -> bool:
 def handle_dangerous_file(bot, db, chat_id, user_id, message_id):
     """Обрабатывает опасные файлы - удаляет и банит отправителя"""
     try:
-        # Удаляем сообщение с опасным файлом
-        bot.delete_message(chat_id, message_id)
-        
-        # Проверяем права бота
-        bot_member = bot.get_chat_member(chat_id, bot.get_me().id)
-        if bot_member.can_restrict_members:
+        # Удаляем сообщение с опасным файлом, если у бота есть на это право
+        if bot_permissions.can_delete(bot, chat_id):
+            bot.delete_message(chat_id, message_id)
+
+        # Права бота берутся из снимка, обновляемого my_chat_member
+        if bot_permissions.can_restrict(bot, chat_id):
             bot.kick_chat_member(chat_id, user_id)
             sent_message = bot.send_message(
                 chat_id,
@@ -77,6 +90,7 @@ def handle_dangerous_file(bot, db, chat_id, user_id, message_id):
             logger.info(f"Пользователь {user_id} забанен за отправку опасного файла в чате {chat_id}")
             # Сбрасываем предупреждения, если они были
             db.reset_warnings(chat_id, user_id)
+            share_ban(db, chat_id, user_id, "опасный файл")
             # Планируем удаление сообщения о бане
             delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
         else:
@@ -0,0 +1,218 @@
+import logging
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from config import RECENT_MESSAGES_PER_CHAT, RECENT_MESSAGE_TEXT_CHARS, RECENT_MESSAGES_MAX_BYTES, RETRO_SCAN_BATCH_SIZE
+from bot_permissions import bot_permissions
+from filters import engine as filter_engine
+from links import find_blocked_link
+from model.normalize import normalize
+from moderation import delete_messages
+from utils import check_messages, send_notice
+
+logger = logging.getLogger(__name__)
+
+# Фильтры, при включении которых можно проверить недавние сообщения
+RETRO_SCAN_SETTINGS = ('profanity_filter', 'link_filter', 'toxicity_filter')
+
+
+def _text_size(text):
+    return sys.getsizeof(text) if text is not None else 0
+
+
+class ChatHistory:
+    """Кольцевой буфер последних сообщений одного чата.
+
+    id сообщений и авторов хранятся в массивах array('q') фиксированной длины,
+    тексты - в списке той же длины; новое сообщение занимает ячейку самого
+    старого. У пустых и удалённых ячеек message_id равен 0.
+    """
+
+    __slots__ = ('message_ids', 'user_ids', 'texts', 'position', 'text_bytes')
+
+    def __init__(self, capacity):
+        self.message_ids = array('q', bytes(8 * capacity))
+        self.user_ids = array('q', bytes(8 * capacity))
+        self.texts = [None] * capacity
+        self.position = 0
+        self.text_bytes = 0
+
+    @property
+    def size(self):
+        """Примерный объём памяти буфера в байтах."""
+        return 24 * len(self.texts) + self.text_bytes
+
+    def add(self, message_id, user_id, text):
+        """Добавляет сообщение. Возвращает изменение объёма в байтах."""
+        i = self.position
+        delta = _text_size(text) - _text_size(self.texts[i])
+        self.message_ids[i] = message_id
+        self.user_ids[i] = user_id
+        self.texts[i] = text
+        self.position = (i + 1) % len(self.texts)
+        self.text_bytes += delta
+        return delta
+
+    def set_text(self, message_id, text):
+        """Заменяет текст сообщения, если оно ещё в буфере. Возвращает изменение объёма."""
+        try:
+            i = self.message_ids.index(message_id)
+        except ValueError:
+            return 0
+        delta = _text_size(text) - _text_size(self.texts[i])
+        self.texts[i] = text
+        self.text_bytes += delta
+        return delta
+
+    def discard(self, message_ids):
+        """Освобождает ячейки сообщений. Возвращает изменение объёма."""
+        delta = 0
+        for i, message_id in enumerate(self.message_ids):
+            if message_id and message_id in message_ids:
+                delta -= _text_size(self.texts[i])
+                self.message_ids[i] = 0
+                self.user_ids[i] = 0
+                self.texts[i] = None
+        self.text_bytes += delta
+        return delta
+
+    def newest(self):
+        """Индексы занятых ячеек от новых сообщений к старым."""
+        capacity = len(self.texts)
+        for k in range(1, capacity + 1):
+            i = (self.position - k) % capacity
+            if self.message_ids[i]:
+                yield i
+
+
+class RecentMessages:
+    """Последние сообщения всех чатов для /purge и проверки старых сообщений.
+
+    На чат хранится не больше per_chat сообщений (текст обрезается до
+    text_chars символов). Если общий объём превышает max_bytes, вытесняются
+    чаты, давно не писавшие сообщений.
+    """
+
+    def __init__(self, per_chat=RECENT_MESSAGES_PER_CHAT, max_bytes=RECENT_MESSAGES_MAX_BYTES,
+                 text_chars=RECENT_MESSAGE_TEXT_CHARS):
+        self.per_chat = per_chat
+        self.max_bytes = max_bytes
+        self.text_chars = text_chars
+        self._chats = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, chat_id, message_id, user_id, text=None):
+        text = text[:self.text_chars] if text else None
+        with self._lock:
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = ChatHistory(self.per_chat)
+                self._bytes += chat.size
+            else:
+                self._chats.move_to_end(chat_id)
+            self._bytes += chat.add(message_id, user_id, text)
+            while self._bytes > self.max_bytes and len(self._chats) > 1:
+                _, evicted = self._chats.popitem(last=False)
+                self._bytes -= evicted.size
+
+    def update_text(self, chat_id, message_id, text):
+        """Обновляет текст изменённого сообщения."""
+        text = text[:self.text_chars] if text else None
+        with self._lock:
+            chat = self._chats.get(chat_id)
+            if chat is not None:
+                self._bytes += chat.set_text(message_id, text)
+
+    def user_messages(self, chat_id, user_id, limit):
+        """id последних limit сообщений пользователя, от новых к старым."""
+        with self._lock:
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                return []
+            message_ids = []
+            for i in chat.newest():
+                if chat.user_ids[i] == user_id:
+                    message_ids.append(chat.message_ids[i])
+                    if len(message_ids) >= limit:
+                        break
+            return message_ids
+
+    def texts(self, chat_id):
+        """(message_id, user_id, текст) сообщений чата с текстом, от новых к старым."""
+        with self._lock:
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                return []
+            return [(chat.message_ids[i], chat.user_ids[i], chat.texts[i]) for i in chat.newest() if chat.texts[i]]
+
+    def discard(self, chat_id, message_ids):
+        """Убирает удалённые сообщения из буфера."""
+        with self._lock:
+            chat = self._chats.get(chat_id)
+            if chat is not None:
+                self._bytes += chat.discard(set(message_ids))
+
+    def forget_chat(self, chat_id):
+        with self._lock:
+            chat = self._chats.pop(chat_id, None)
+            if chat is not None:
+                self._bytes -= chat.size
+
+    @property
+    def size(self):
+        """Примерный объём памяти всех буферов в байтах."""
+        return self._bytes
+
+    def __len__(self):
+        return len(self._chats)
+
+
+recent = RecentMessages()
+
+
+def scan_recent(bot, db, chat_id, setting):
+    """Проверяет недавние сообщения чата фильтром setting и удаляет нарушения.
+
+    Предупреждения не выдаются: сообщения были отправлены, когда фильтр был
+    выключен. Модель токсичности прогоняется пачками по RETRO_SCAN_BATCH_SIZE.
+    Возвращает число удалённых сообщений.
+    """
+    admins = set(db.get_admins(chat_id))
+    entries = [entry for entry in recent.texts(chat_id) if entry[1] not in admins]
+    if not entries:
+        return 0
+    normalized = [normalize(text) for _, _, text in entries]
+    if setting == 'toxicity_filter':
+        flags = check_messages(normalized, RETRO_SCAN_BATCH_SIZE)
+    elif setting == 'profanity_filter':
+        flags = [filter_engine.check_profanity(text) for text in normalized]
+    elif setting == 'link_filter':
+        flags = [find_blocked_link(db, chat_id, text.stripped) is not None for text in normalized]
+    else:
+        return 0
+
+    violations = [message_id for (message_id, _, _), flag in zip(entries, flags) if flag]
+    logger.info(f"Проверка {len(entries)} недавних сообщений группы {chat_id} ({setting}): нарушений {len(violations)}")
+    if not violations:
+        return 0
+    if not bot_permissions.can_delete(bot, chat_id):
+        logger.warning(f"Недостаточно прав для удаления старых сообщений в чате {chat_id}")
+        return 0
+    deleted = delete_messages(bot, chat_id, violations)
+    recent.discard(chat_id, violations)
+    if deleted:
+        send_notice(bot, db, chat_id, f"🧹 Удалено недавних сообщений, нарушающих правила: {deleted}.")
+    return deleted
+
+
+def start_recent_scan(bot, db, chat_id, setting):
+    """Запускает scan_recent в фоновом потоке, чтобы не задерживать обработку обновлений."""
+    def run():
+        try:
+            scan_recent(bot, db, chat_id, setting)
+        except Exception as e:
+            logger.error(f"Ошибка проверки недавних сообщений группы {chat_id}: {e}")
+
+    threading.Thread(target=run, name=f"recent-scan-{chat_id}", daemon=True).start()
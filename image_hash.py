@@ -0,0 +1,110 @@
+import io
+import logging
+import threading
+from config import SPAM_IMAGE_MAX_DISTANCE
+from file_inspection import VerdictCache
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+
+def dhash(data):
+    """64-битный разностный хеш (dHash) изображения: похожие картинки отличаются в немногих битах."""
+    with Image.open(io.BytesIO(data)) as image:
+        pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = value << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def hamming(left, right):
+    return bin(left ^ right).count('1')
+
+
+class MultiIndexHash:
+    """Индекс 64-битных хешей для поиска по расстоянию Хэмминга (multi-index hashing).
+
+    Хеш делится на radius + 1 частей, и для каждой части ведётся словарь.
+    Если хеши отличаются не больше чем в radius битах, то хотя бы одна часть
+    у них совпадает (принцип Дирихле), поэтому кандидаты находятся radius + 1
+    обращениями к словарям, а не перебором всего индекса. BK-дерево на
+    64-битных хешах с таким радиусом отсекает слишком мало ветвей.
+    """
+
+    def __init__(self, hashes=(), radius=SPAM_IMAGE_MAX_DISTANCE):
+        self.radius = radius
+        parts = radius + 1
+        widths = [64 // parts + (1 if i < 64 % parts else 0) for i in range(parts)]
+        self._parts = [(sum(widths[:i]), (1 << width) - 1) for i, width in enumerate(widths)]
+        self._tables = [{} for _ in range(parts)]
+        self._size = 0
+        for value in hashes:
+            self.add(value)
+
+    def add(self, value):
+        for table, (shift, mask) in zip(self._tables, self._parts):
+            table.setdefault(value >> shift & mask, []).append(value)
+        self._size += 1
+
+    def nearest(self, value):
+        """Ближайший хеш не дальше radius или None."""
+        best, best_distance = None, self.radius + 1
+        for table, (shift, mask) in zip(self._tables, self._parts):
+            for candidate in table.get(value >> shift & mask, ()):
+                distance = hamming(value, candidate)
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+        return best
+
+    def __len__(self):
+        return self._size
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def spam_image_index(hashes):
+    """Индекс известных спам-картинок; пересобирается, только когда список изменился."""
+    with _indexes_lock:
+        cached = _indexes.get('spam')
+        if cached is not None and (cached[0] is hashes or cached[0] == hashes):
+            return cached[1]
+    index = MultiIndexHash(hashes)
+    with _indexes_lock:
+        _indexes['spam'] = (hashes, index)
+    return index
+
+
+# Хеши по file_unique_id: одна и та же картинка из рассылки скачивается один раз
+photo_hashes = VerdictCache()
+
+
+def photo_hash(bot, photo):
+    """Хеш самой маленькой миниатюры фото (список PhotoSize) или None без Pillow."""
+    if Image is None or not photo:
+        return None
+    thumbnail = min(photo, key=lambda size: size.width * size.height)
+
+    def compute():
+        file = bot.get_file(thumbnail.file_id)
+        return dhash(bot.download_file(file.file_path))
+
+    return photo_hashes.get_or_compute(thumbnail.file_unique_id, compute)
+
+
+def find_spam_image(bot, db, photo):
+    """Известная спам-картинка, похожая на фото, или None."""
+    hashes = db.get_spam_images()
+    if not hashes:
+        return None
+    value = photo_hash(bot, photo)
+    if value is None:
+        return None
+    return spam_image_index(hashes).nearest(value)
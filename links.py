@@ -0,0 +1,204 @@
+import logging
+import os
+import re
+import threading
+import time
+from config import LINK_ALLOWLIST_FILE, LINK_DENYLIST_FILE, LINK_LISTS_CHECK_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Доменные зоны, по которым адрес без схемы считается ссылкой, а не именем файла или
+# сокращением ("main.py", "т.е."); адреса со схемой или www принимаются с любой зоной
+KNOWN_TLDS = frozenset((
+    'com', 'net', 'org', 'info', 'biz', 'io', 'co', 'me', 'ru', 'su', 'ua', 'by', 'kz', 'uz', 'kg', 'am', 'ge',
+    'az', 'tj', 'md', 'eu', 'uk', 'de', 'fr', 'it', 'es', 'pl', 'nl', 'cz', 'us', 'ca', 'au', 'in', 'cn', 'jp',
+    'br', 'tr', 'il', 'ir', 'ae', 'xyz', 'top', 'club', 'online', 'site', 'store', 'shop', 'app', 'dev', 'tech',
+    'pro', 'link', 'click', 'live', 'life', 'space', 'fun', 'icu', 'vip', 'win', 'bid', 'loan', 'work', 'today',
+    'cc', 'tv', 'gg', 'ly', 'to', 'gl', 'ai', 'ws', 'tk', 'ml', 'ga', 'cf', 'gq', 'pw', 'cam', 'bet', 'casino',
+    'рф', 'рус', 'ком', 'онлайн', 'сайт', 'орг', 'бел', 'укр', 'дети', 'москва',
+))
+
+URL_CANDIDATE = re.compile(
+    r"(?i)(?:\b[a-z][a-z0-9+.-]*://|\bwww\.)[^\s<>\"']+"
+    r"|(?<![\w@.-])(?:[\w-]+\.)+(?:xn--[a-z0-9-]+|[^\W\d_]{2,})(?![\w-])(?:[/:?#][^\s<>\"']*)?"
+)
+SCHEME = re.compile(r"(?i)^[a-z][a-z0-9+.-]*://")
+# Точки, которыми подменяют обычную в именах доменов
+DOTS = str.maketrans({'。': '.', '．': '.', '｡': '.'})
+
+def extract_urls(text, entities=None):
+    """Адреса из текста и из скрытых ссылок (сущности text_link) сообщения."""
+    urls = [entity.url for entity in entities or () if entity.type == 'text_link' and entity.url]
+    if '.' in text or '://' in text:
+        for match in URL_CANDIDATE.finditer(text):
+            url = match.group().rstrip('.,;:!?)]}»')
+            if SCHEME.match(url) or url.lower().startswith('www.'):
+                urls.append(url)
+            else:
+                domain = url_domain(url)
+                if domain and domain.rsplit('.', 1)[-1] in _KNOWN_TLDS_ASCII:
+                    urls.append(url)
+    return urls
+
+
+def url_domain(url):
+    """Домен адреса в нижнем регистре и ASCII (punycode) или None, если домена нет."""
+    host = SCHEME.sub('', url.translate(DOTS), 1)
+    host = re.split(r"[/?#\\]", host, 1)[0].rsplit('@', 1)[-1]
+    if host.startswith('['):
+        return None  # IPv6
+    host = host.split(':', 1)[0].strip('.').lower()
+    if '.' not in host:
+        return None
+    try:
+        return host.encode('idna').decode('ascii')
+    except UnicodeError:
+        return host if host.isascii() else None
+
+
+_KNOWN_TLDS_ASCII = frozenset(url_domain(f"x.{tld}").rsplit('.', 1)[-1] for tld in KNOWN_TLDS)
+
+
+class DomainTrie:
+    """Префиксное дерево доменов по меткам справа налево ("com" -> "example" -> "www").
+
+    Запись для домена действует и на все его поддомены; поиск проходит по
+    меткам проверяемого домена и возвращает значение самой длинной подходящей
+    записи, поэтому время поиска зависит только от числа меток, а не от
+    размера списка.
+    """
+
+    def __init__(self, entries=()):
+        self._root = {}
+        self._size = 0
+        for domain, value in entries:
+            self.add(domain, value)
+
+    def add(self, domain, value=True):
+        node = self._root
+        for label in reversed(domain.split('.')):
+            node = node.setdefault(label, {})
+        if None not in node:
+            self._size += 1
+        node[None] = value
+
+    def match(self, domain):
+        """Значение самой длинной записи, суффиксом которой является домен, или None."""
+        node = self._root
+        found = None
+        for label in reversed(domain.split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+    def __len__(self):
+        return self._size
+
+
+def parse_domain(value):
+    """Домен из ввода администратора ("https://Example.com/x" -> "example.com") или None."""
+    value = value.strip().lstrip('*.')
+    return url_domain(value) if value else None
+
+
+class GlobalDomainLists:
+    """Общие для всех групп списки доменов из файлов LINK_ALLOWLIST_FILE и LINK_DENYLIST_FILE.
+
+    Время изменения файлов проверяется не чаще раза в LINK_LISTS_CHECK_SECONDS,
+    изменённый файл перечитывается без перезапуска бота. Отсутствующий файл -
+    пустой список.
+    """
+
+    def __init__(self, allow_path=LINK_ALLOWLIST_FILE, deny_path=LINK_DENYLIST_FILE, interval=LINK_LISTS_CHECK_SECONDS):
+        self.paths = {'allow': allow_path, 'deny': deny_path}
+        self.interval = interval
+        self._tries = {'allow': DomainTrie(), 'deny': DomainTrie()}
+        self._mtimes = {'allow': None, 'deny': None}
+        self._next_check = 0
+        self._lock = threading.Lock()
+
+    def get(self, kind):
+        """Дерево доменов списка 'allow' или 'deny'."""
+        now = time.monotonic()
+        if now >= self._next_check:
+            with self._lock:
+                if now >= self._next_check:
+                    self._next_check = now + self.interval
+                    for name in self.paths:
+                        self._reload(name)
+        return self._tries[kind]
+
+    def _reload(self, name):
+        path = self.paths[name]
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtimes[name]:
+            return
+        trie = DomainTrie()
+        if mtime is not None:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    for line in f:
+                        domain = parse_domain(line.split('#', 1)[0])
+                        if domain:
+                            trie.add(domain)
+            except OSError as e:
+                logger.error(f"Ошибка чтения списка доменов {path}: {e}")
+                return
+        self._tries[name] = trie
+        self._mtimes[name] = mtime
+        logger.info(f"Список доменов {path} загружен: {len(trie)}")
+
+
+global_lists = GlobalDomainLists()
+
+_group_tries = {}
+_group_tries_lock = threading.Lock()
+
+
+def group_trie(chat_id, entries):
+    """Дерево списков группы; пересобирается, только когда списки изменились."""
+    with _group_tries_lock:
+        cached = _group_tries.get(chat_id)
+        if cached is not None and (cached[0] is entries or cached[0] == entries):
+            return cached[1]
+    trie = DomainTrie(entries)
+    with _group_tries_lock:
+        _group_tries[chat_id] = (entries, trie)
+    return trie
+
+
+def domain_verdict(domain, group):
+    """True - домен разрешён, False - запрещён, None - ни в одном списке.
+
+    Общий запрещающий список действует всегда; затем проверяются списки группы
+    (более точная запись важнее), затем общий разрешающий.
+    """
+    if global_lists.get('deny').match(domain):
+        return False
+    verdict = group.match(domain)
+    if verdict is None and global_lists.get('allow').match(domain):
+        verdict = True
+    return verdict
+
+
+def find_blocked_link(db, chat_id, text, entities=None):
+    """Первая ссылка сообщения, которую нужно удалить, или None.
+
+    Удаляются ссылки на запрещённые домены и на домены, не разрешённые группой
+    или общим списком. Домен с подменой букв ("gооgle.com" с кириллицей)
+    приводится к punycode и не совпадает с разрешённым, поэтому тоже удаляется.
+    """
+    urls = extract_urls(text, entities)
+    if not urls:
+        return None
+    group = group_trie(chat_id, db.get_link_domains(chat_id))
+    for url in urls:
+        domain = url_domain(url)
+        if domain is None or domain_verdict(domain, group) is not True:
+            return url
+    return None
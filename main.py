@@ -1,8 +1,17 @@
 import time
 import logging
 from telebot import TeleBot
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, RUNTIME_MODE, ALLOWED_UPDATES, POLLING_TIMEOUT_SECONDS, WEBHOOK_URL, WEBHOOK_SECRET,
+    SUPERVISOR_WORKERS, OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_BURST
+)
 from database import Database
+from scheduler import scheduler
+from deletion_queue import get_deletion_queue
+from raid import recover_lockdowns
+from outbound import RateLimitedBot, OutboundDispatcher
+from member_cache import member_cache
+from bot_permissions import bot_permissions
 from handlers.commands import register_commands
 from handlers.events import register_events
 from handlers.callbacks import register_callbacks
@@ -14,19 +23,127 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 bot = TeleBot(BOT_TOKEN)
+# Обёртка с ограничителем исходящих запросов; создаётся только в режимах, которые отправляют сообщения
+api = None
 db = Database()
 
-if __name__ == '__main__':
+def create_api(workers=1):
+    """Создаёт обёртку бота, через которую обработчики обращаются к Bot API.
+
+    workers - число процессов, делящих общий лимит Telegram поровну. Чат всегда
+    попадает в один процесс, поэтому лимиты чатов делить не нужно.
+    """
+    global api
+    api = RateLimitedBot(bot, OutboundDispatcher(
+        global_rate=OUTBOUND_GLOBAL_RATE / workers,
+        global_burst=max(OUTBOUND_GLOBAL_BURST / workers, 1)
+    ))
+    return api
+
+def register_handlers(bot, db):
+    """Регистрирует все обработчики на переданном боте."""
     logger.info("Инициализация обработчиков команд")
     register_commands(bot, db)
     logger.info("Инициализация обработчиков событий")
     register_events(bot, db)
     logger.info("Инициализация обработчиков callback-запросов")
     register_callbacks(bot, db)
+
+def process_update(update):
+    """Обрабатывает одно обновление в текущем потоке."""
+    member_cache.remember_update(update)
+    bot.process_new_updates([update])
+
+def run_polling():
+    """Запускает бота на long polling с разбором обновлений по очередям чатов."""
+    from dispatch import ShardedDispatcher
+    # Обработчики выполняются в потоках очередей чатов, а не в пуле TeleBot
+    bot.threaded = False
+    api = create_api()
+    register_handlers(api, db)
+    bot_permissions.load_identity(api)
+    db.start_maintenance()
+    get_deletion_queue(api, db).recover()
+    recover_lockdowns(api, db)
+    updates = ShardedDispatcher(process_update)
+    updates.start()
+    offset = None
+    logger.info("Бот запущен!")
     while True:
         try:
-            logger.info("Бот запущен!")
-            bot.polling(none_stop=True, allowed_updates=["message", "chat_member", "my_chat_member", "callback_query"])
+            for update in bot.get_updates(
+                offset=offset, timeout=POLLING_TIMEOUT_SECONDS,
+                allowed_updates=ALLOWED_UPDATES, long_polling_timeout=POLLING_TIMEOUT_SECONDS
+            ):
+                # Очередь чата переполнена - ждём, а не теряем обновление
+                updates.put(update)
+                offset = update.update_id + 1
         except Exception as e:
-            logger.error(f"Ошибка запуска: {e}")
-            time.sleep(5)
\ No newline at end of file
+            logger.error(f"Ошибка получения обновлений: {e}")
+            time.sleep(5)
+
+def run_webhook():
+    """Запускает бота на встроенном webhook-сервере."""
+    from webhook import WebhookServer
+    # Сервер создаётся первым: без WEBHOOK_SECRET запуск прерывается до setWebhook
+    server = WebhookServer(process_update)
+    # Обработчики выполняются в потоках очереди webhook, а не в пуле TeleBot
+    bot.threaded = False
+    api = create_api()
+    register_handlers(api, db)
+    bot_permissions.load_identity(api)
+    db.start_maintenance()
+    get_deletion_queue(api, db).recover()
+    recover_lockdowns(api, db)
+    if WEBHOOK_URL:
+        bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=ALLOWED_UPDATES)
+        logger.info(f"Webhook установлен: {WEBHOOK_URL}")
+    server.serve_forever()
+
+def run_worker():
+    """Обрабатывает обновления, которые супервизор передаёт по Unix-сокету."""
+    from dispatch import ShardedDispatcher
+    from supervisor import connect_worker, worker_for_chat
+    from duplicates import share_index as share_duplicate_index
+    bot.threaded = False
+    api = create_api(SUPERVISOR_WORKERS)
+    register_handlers(api, db)
+    bot_permissions.load_identity(api)
+    conn, index = connect_worker()
+    # Фоновая очистка общей базы нужна только в одном процессе
+    if index == 0:
+        db.start_maintenance()
+    get_deletion_queue(api, db).recover()
+    # Рассылки по чатам разных обработчиков видны только через общее хранилище
+    share_duplicate_index(db)
+    # Блокировки восстанавливает обработчик, которому супервизор передаёт вступления в чат
+    recover_lockdowns(api, db, lambda chat_id: worker_for_chat(chat_id, SUPERVISOR_WORKERS) == index)
+    updates = ShardedDispatcher(process_update)
+    updates.start()
+    logger.info(f"Обработчик {index} запущен")
+    try:
+        while True:
+            updates.put(conn.recv())
+    except EOFError:
+        logger.info(f"Супервизор закрыл соединение, обработчик {index} завершается")
+    finally:
+        updates.stop()
+
+if __name__ == '__main__':
+    try:
+        if RUNTIME_MODE == 'aiohttp':
+            from aiohttp_runtime import run_aiohttp
+            run_aiohttp(db, register_handlers)
+        elif RUNTIME_MODE == 'webhook':
+            run_webhook()
+        elif RUNTIME_MODE == 'supervisor':
+            from supervisor import run_supervisor
+            run_supervisor(bot)
+        elif RUNTIME_MODE == 'worker':
+            run_worker()
+        else:
+            run_polling()
+    finally:
+        scheduler.shutdown()
+        if api is not None:
+            api.dispatcher.shutdown()
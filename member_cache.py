@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+from config import MEMBER_CACHE_SIZE, MEMBER_CACHE_TTL_SECONDS
+
+EVENT_FIELDS = ('message', 'edited_message', 'callback_query', 'chat_member', 'my_chat_member')
+
+
+class MemberCache:
+    """LRU-кэш пользователей с ограниченным временем жизни записей.
+
+    Заполняется пользователями из входящих обновлений, поэтому имя автора
+    сообщения или нового участника обычно известно без запроса getChatMember.
+    """
+
+    def __init__(self, maxsize=MEMBER_CACHE_SIZE, ttl=MEMBER_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def remember(self, user):
+        if user is None:
+            return
+        with self._lock:
+            self._users[user.id] = (time.monotonic() + self.ttl, user)
+            self._users.move_to_end(user.id)
+            while len(self._users) > self.maxsize:
+                self._users.popitem(last=False)
+
+    def remember_event(self, event):
+        """Запоминает пользователей из сообщения, callback-запроса или изменения участника."""
+        self.remember(getattr(event, 'from_user', None))
+        reply = getattr(event, 'reply_to_message', None)
+        if reply is not None:
+            self.remember(reply.from_user)
+        for member in getattr(event, 'new_chat_members', None) or ():
+            self.remember(member)
+        self.remember(getattr(event, 'left_chat_member', None))
+        new_member = getattr(event, 'new_chat_member', None)
+        if new_member is not None:
+            self.remember(new_member.user)
+
+    def remember_update(self, update):
+        for field in EVENT_FIELDS:
+            event = getattr(update, field, None)
+            if event is not None:
+                self.remember_event(event)
+
+
+member_cache = MemberCache()
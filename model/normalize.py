@@ -0,0 +1,76 @@
+import re
+
+# Невидимые символы, которыми разбивают слова: нулевой ширины, мягкий перенос, знаки ударения
+INVISIBLE = dict.fromkeys(map(ord, "\u00ad\u034f\u180e\u200b\u200c\u200d\u200e\u200f\u2060\u2061\u2062\u2063\u2064\ufeff\u0300\u0301"))
+
+# Латинские буквы, похожие на русские; заменяются только в словах, где есть кириллица
+HOMOGLYPHS = str.maketrans({
+    'a': 'а', 'c': 'с', 'e': 'е', 'o': 'о', 'p': 'р', 'x': 'х', 'y': 'у', 'k': 'к',
+    'm': 'м', 'n': 'п', 'u': 'и', 'r': 'г',
+    'A': 'а', 'B': 'в', 'C': 'с', 'E': 'е', 'H': 'н', 'K': 'к', 'M': 'м', 'O': 'о',
+    'P': 'р', 'T': 'т', 'X': 'х', 'Y': 'у',
+    '\u1c80': 'в', '\u1c81': 'д', '\u1c82': 'о', '\u1c83': 'с',
+    '\u1c84': 'т', '\u1c85': 'т', '\u1c86': 'ъ',
+})
+
+# Цифры вместо букв; заменяются, только если слово начинается и кончается буквой ("е6ать", но не "100руб")
+LEET = str.maketrans({'0': 'о', '3': 'з', '4': 'ч', '6': 'б'})
+
+EDGE_PUNCTUATION = "!\"'()*,-.:;?[]«»…—"
+CYRILLIC_WORD = re.compile(r"\S*[а-яА-ЯёЁ\u1c80-\u1c86]\S*")
+REPEATS = re.compile(r"([^\W\d_])\1{2,}")
+
+# Все замены clean_text одним выражением. Упоминание обрывается перед ссылкой,
+# а спецсимволы удаляются после ссылок и упоминаний - как при последовательных заменах
+CLEAN = re.compile(r"(?:http|www)\S+|[@#](?:(?!(?:http|www)\S)\w)+|[^\w\s!?.,]")
+
+
+def clean_text(text):
+    """Очистка текста для модели: нижний регистр, без ссылок, упоминаний, хэштегов и спецсимволов."""
+    return " ".join(CLEAN.sub("", text.lower()).split())
+
+
+def _fold_word(match):
+    word = match.group().translate(HOMOGLYPHS).lower()
+    core = word.strip(EDGE_PUNCTUATION)
+    if core[:1].isalpha() and core[-1:].isalpha():
+        word = word.translate(LEET)
+    return REPEATS.sub(r"\1", word)
+
+
+def canonical_text(text):
+    """Канонический вид текста: нижний регистр, без невидимых символов, с русскими
+    буквами вместо похожих латинских и цифр и без повторов букв ("ХУУУЙ" -> "хуй")."""
+    return NormalizedText(text).canonical
+
+
+class NormalizedText:
+    """Текст сообщения, нормализованный один раз для всех фильтров.
+
+    text - исходный текст, stripped - без невидимых символов (для ссылок),
+    canonical - канонический вид (для мата и запрещённых слов), clean - очищенный
+    канонический вид для модели и отпечатков рассылок, вычисляется при первом обращении.
+    """
+
+    __slots__ = ('text', 'stripped', 'canonical', '_clean')
+
+    def __init__(self, text):
+        self.text = text
+        self.stripped = text.translate(INVISIBLE)
+        # Один проход по словам с кириллицей, остальной текст только приводится к нижнему регистру
+        self.canonical = CYRILLIC_WORD.sub(_fold_word, self.stripped).lower()
+        self._clean = None
+
+    @property
+    def clean(self):
+        if self._clean is None:
+            self._clean = clean_text(self.canonical)
+        return self._clean
+
+    def __str__(self):
+        return self.text
+
+
+def normalize(text):
+    """Нормализует текст сообщения; результат передаётся во все фильтры."""
+    return NormalizedText(text)
@@ -1,15 +1,6 @@
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import torch
-import re
-
-#  Функция очистки текста
-def clean_text(text):
-    text = text.lower()  # Приводим к нижнему регистру
-    text = re.sub(r"http\S+|www\S+|https\S+", "", text)  # Удаляем ссылки
-    text = re.sub(r"@\w+|#\w+", "", text)  # Удаляем упоминания и хэштеги
-    text = re.sub(r"[^\w\s!?.,]", "", text, flags=re.UNICODE)  # Удаляем спецсимволы
-    text = " ".join(text.split())  # Удаляем лишние пробелы
-    return text
+from model.normalize import clean_text, NormalizedText
 
 # Загрузка модели
 model_name = "sberbank-ai/ruBert-large"  # базовая модель
@@ -17,12 +8,45 @@ model = AutoModelForSequenceClassification.from_pretrained("./model/my_model")
 tokenizer = AutoTokenizer.from_pretrained(model_name)
 model.eval()
 
+# Предобработка, на которой обучена модель; train.py записывает её в config.json модели.
+# raw - clean_text исходного текста (модели без этого поля), normalized - NormalizedText.clean
+PREPROCESSING = getattr(model.config, "preprocessing", "raw")
+if PREPROCESSING not in ("raw", "normalized"):
+    raise RuntimeError(f"Неизвестная предобработка модели ./model/my_model: {PREPROCESSING}")
+
+
+def model_input(text):
+    """Текст (строка или NormalizedText) в том виде, на котором обучалась модель."""
+    if PREPROCESSING == "normalized":
+        return (text if isinstance(text, NormalizedText) else NormalizedText(text)).clean
+    return clean_text(text.text if isinstance(text, NormalizedText) else text)
+
 # Предсказание
 def predict_toxicity(text):
-    cleaned_text = clean_text(text)  # Очищаем входной текст
+    cleaned_text = model_input(text)
     tokens = tokenizer(cleaned_text, return_tensors="pt", truncation=True, padding=True, max_length=128)
     with torch.no_grad():
         outputs = model(**tokens)
     logits = outputs.logits
     predicted_class = torch.argmax(logits, dim=1).item()
     return predicted_class
+
+
+def predict_toxicity_batch(texts, batch_size=32):
+    """Классы токсичности для списка текстов (строк или NormalizedText).
+
+    Тексты проходят через модель пачками по batch_size: один прогон пачки
+    дешевле, чем batch_size прогонов по одному тексту. Для близости длин в
+    пачке тексты сортируются по длине, результат возвращается в исходном порядке.
+    """
+    cleaned = [model_input(text) for text in texts]
+    order = sorted(range(len(cleaned)), key=lambda i: len(cleaned[i]))
+    predictions = [0] * len(cleaned)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        tokens = tokenizer([cleaned[i] for i in batch], return_tensors="pt", truncation=True, padding=True, max_length=128)
+        with torch.no_grad():
+            outputs = model(**tokens)
+        for i, predicted_class in zip(batch, torch.argmax(outputs.logits, dim=1).tolist()):
+            predictions[i] = predicted_class
+    return predictions
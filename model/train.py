@@ -3,18 +3,9 @@ from transformers import AutoTokenizer, AutoModelForSequenceClassification, Trai
 from sklearn.model_selection import train_test_split
 import pandas as pd
 from torch.utils.data import Dataset
-import re
 import random
 import nlpaug.augmenter.word as naw
-
-# Очистка текста
-def clean_text(text):
-    text = text.lower()
-    text = re.sub(r"http\S+|www\S+|https\S+", "", text)
-    text = re.sub(r"@\w+|#\w+", "", text)
-    text = re.sub(r"[^\w\s!?.,]", "", text, flags=re.UNICODE)
-    text = " ".join(text.split())
-    return text
+from normalize import NormalizedText  # та же нормализация и очистка, что и в predict.py
 
 # Кастомный Dataset с опциональной аугментацией
 class ToxicDataset(Dataset):
@@ -25,7 +16,8 @@ class ToxicDataset(Dataset):
         self.augment = augment
         self.aug_prob = aug_prob
         self.syn_aug = naw.SynonymAug(aug_src='wordnet')
-        self.texts = [clean_text(t) for t in texts]
+        # Модель видит тот же текст, что и при проверке сообщений: очищенный канонический вид
+        self.texts = [NormalizedText(t).clean for t in texts]
 
     def __getitem__(self, idx):
         text = self.texts[idx]
@@ -94,6 +86,7 @@ trainer = Trainer(
 
 trainer.train()
 
-# Сохраняем
+# Сохраняем; predict.py подаёт модели текст в том виде, что записан в preprocessing
+model.config.preprocessing = "normalized"
 model.save_pretrained("./model/my_model")
 tokenizer.save_pretrained("./model/my_model")
\ No newline at end of file
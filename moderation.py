@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from telebot import types
+from config import MODERATION_WORKERS, DELETION_BATCH_SIZE
+from bot_permissions import bot_permissions
+from utils import get_username, delete_message_after_delay
+
+logger = logging.getLogger(__name__)
+
+MAX_WARNINGS = 3
+WARNING_MUTE = timedelta(hours=1)
+
+
+class ModerationExecutor:
+    """Выполняет независимые вызовы Bot API модерации параллельно.
+
+    Удаление нарушения, предупреждение и мьют не зависят друг от друга, поэтому
+    отправляются одновременно; зависимые шаги (объявление о мьюте только после
+    ограничения) выстраиваются вызывающим кодом. Для каждого действия
+    накапливается статистика задержки.
+    """
+
+    def __init__(self, workers=MODERATION_WORKERS):
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="moderation")
+        self._lock = threading.Lock()
+        self._latency = {}
+
+    def submit(self, action, func, *args, **kwargs):
+        """Запускает вызов в пуле и возвращает Future."""
+        return self.pool.submit(self.timed, action, func, *args, **kwargs)
+
+    def timed(self, action, func, *args, **kwargs):
+        """Выполняет вызов в текущем потоке, записывая его задержку."""
+        start = time.monotonic()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                count, total, worst = self._latency.get(action, (0, 0.0, 0.0))
+                self._latency[action] = (count + 1, total + elapsed, max(worst, elapsed))
+
+    def metrics(self):
+        """Число вызовов, средняя и максимальная задержка по действиям (в мс)."""
+        with self._lock:
+            return {
+                action: {'count': count, 'avg_ms': round(total / count * 1000, 1), 'max_ms': round(worst * 1000, 1)}
+                for action, (count, total, worst) in self._latency.items()
+            }
+
+
+executor = ModerationExecutor()
+
+
+def _result(future, action, chat_id):
+    try:
+        return future.result()
+    except Exception as e:
+        logger.error(f"Ошибка действия {action} в чате {chat_id}: {e}")
+        return None
+
+
+def delete_messages(bot, chat_id, message_ids):
+    """Удаляет сообщения пачками через deleteMessages. Возвращает число отправленных на удаление.
+
+    Уже удалённые сообщения Telegram пропускает без ошибки.
+    """
+    deleted = 0
+    for start in range(0, len(message_ids), DELETION_BATCH_SIZE):
+        chunk = message_ids[start:start + DELETION_BATCH_SIZE]
+        try:
+            executor.timed('delete_messages', bot.delete_messages, chat_id, chunk)
+            deleted += len(chunk)
+        except Exception as e:
+            logger.error(f"Ошибка удаления сообщений {chunk} в чате {chat_id}: {e}")
+    return deleted
+
+
+def warn_user(bot, db, message, warning_text):
+    """Удаляет нарушение, предупреждает автора и мьютит его после MAX_WARNINGS предупреждений.
+
+    warning_text - текст после упоминания, например "не используйте нецензурные выражения!".
+    Возвращает число предупреждений пользователя.
+    """
+    chat_id = message.chat.id
+    user_id = message.from_user.id
+    warning_count = db.add_warning(chat_id, user_id)
+    username = get_username(bot, chat_id, user_id, message.from_user)
+
+    futures = []
+    if bot_permissions.can_delete(bot, chat_id):
+        futures.append(('delete_message', executor.submit('delete_message', bot.delete_message, chat_id, message.message_id)))
+    futures.append(('send_warning', executor.submit(
+        'send_warning', bot.send_message, chat_id,
+        f"{username}, {warning_text} Предупреждение {warning_count}/{MAX_WARNINGS}.",
+        parse_mode='HTML'
+    )))
+
+    if warning_count >= MAX_WARNINGS:
+        # Объявляем о мьюте только после того, как ограничение применено
+        muted = False
+        if bot_permissions.can_restrict(bot, chat_id):
+            try:
+                executor.timed(
+                    'restrict_chat_member', bot.restrict_chat_member, chat_id, user_id,
+                    until_date=datetime.now() + WARNING_MUTE,
+                    permissions=types.ChatPermissions(can_send_messages=False)
+                )
+                muted = True
+            except Exception as e:
+                logger.error(f"Ошибка мьюта пользователя {user_id} в чате {chat_id}: {e}")
+        else:
+            logger.warning(f"Недостаточно прав для мьюта пользователя {user_id} в чате {chat_id}")
+        if muted:
+            markup = types.InlineKeyboardMarkup()
+            markup.add(types.InlineKeyboardButton(
+                "Размьютить",
+                callback_data=f"unmute_{chat_id}_{user_id}"
+            ))
+            futures.append(('send_mute_notice', executor.submit(
+                'send_mute_notice', bot.send_message, chat_id,
+                f"Пользователь {username} замьючен на 1 час за {MAX_WARNINGS} предупреждения.",
+                reply_markup=markup,
+                parse_mode='HTML'
+            )))
+            db.reset_warnings(chat_id, user_id)
+            logger.info(f"Пользователь {user_id} замьючен в группе {chat_id} за {MAX_WARNINGS} предупреждения")
+
+    for action, future in futures:
+        result = _result(future, action, chat_id)
+        if action != 'delete_message' and result is not None:
+            delete_message_after_delay(bot, chat_id, result.message_id, db)
+    return warning_count
+
+
+def share_ban(db, chat_id, user_id, reason):
+    """Добавляет забаненного в общий бан-лист, если группа в нём участвует."""
+    if db.get_group_settings(chat_id).get('global_bans', False):
+        db.add_global_ban(user_id, chat_id, reason)
+
+
+def enforce_global_ban(bot, db, chat_id, user_id, settings, message_id=None, user=None):
+    """Банит пользователя из общего бан-листа и удаляет его сообщение.
+
+    Для пользователей не из списка проверка обходится фильтром Блума без
+    обращения к хранилищу. Возвращает True, если пользователь в списке и
+    группа в нём участвует, - дальнейшая обработка не нужна.
+    """
+    if not db.is_globally_banned(user_id) or not settings.get('global_bans', False):
+        return False
+
+    futures = []
+    if message_id is not None and bot_permissions.can_delete(bot, chat_id):
+        futures.append(('delete_message', executor.submit('delete_message', bot.delete_message, chat_id, message_id)))
+    if bot_permissions.can_restrict(bot, chat_id):
+        try:
+            executor.timed('kick_chat_member', bot.kick_chat_member, chat_id, user_id)
+            futures.append(('send_ban_notice', executor.submit(
+                'send_ban_notice', bot.send_message, chat_id,
+                f"🚫 {get_username(bot, chat_id, user_id, user)} забанен: пользователь в общем бан-листе.",
+                parse_mode='HTML'
+            )))
+            logger.info(f"Пользователь {user_id} из общего бан-листа забанен в группе {chat_id}")
+        except Exception as e:
+            logger.error(f"Ошибка бана пользователя {user_id} из общего бан-листа в чате {chat_id}: {e}")
+    else:
+        logger.warning(f"Недостаточно прав для бана пользователя {user_id} из общего бан-листа в чате {chat_id}")
+
+    for action, future in futures:
+        result = _result(future, action, chat_id)
+        if action != 'delete_message' and result is not None:
+            delete_message_after_delay(bot, chat_id, result.message_id, db)
+    return True
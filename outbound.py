@@ -0,0 +1,378 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from config import (
+    OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_BURST, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST,
+    OUTBOUND_WORKERS, OUTBOUND_MAX_QUEUE, OUTBOUND_MAX_RETRIES, OUTBOUND_MAX_CHAT_BUCKETS
+)
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета: меньше - важнее
+LANE_HIGH = 0  # Удаления и ограничения
+LANE_NORMAL = 1  # Ответы и предупреждения
+LANE_LOW = 2  # Косметические уведомления, отбрасываются при перегрузке
+
+METHOD_LANES = {
+    'delete_message': LANE_HIGH,
+    'delete_messages': LANE_HIGH,
+    'restrict_chat_member': LANE_HIGH,
+    'ban_chat_member': LANE_HIGH,
+    'kick_chat_member': LANE_HIGH,
+    'unban_chat_member': LANE_HIGH,
+    'set_chat_permissions': LANE_HIGH,
+    'send_message': LANE_NORMAL,
+    'reply_to': LANE_NORMAL,
+    'edit_message_text': LANE_NORMAL,
+    'answer_callback_query': LANE_NORMAL,
+}
+
+# Позиция chat_id среди позиционных аргументов метода; у answer_callback_query чата нет,
+# reply_to берёт чат из сообщения
+CHAT_ID_POSITIONS = {
+    'delete_message': 0,
+    'delete_messages': 0,
+    'restrict_chat_member': 0,
+    'ban_chat_member': 0,
+    'kick_chat_member': 0,
+    'unban_chat_member': 0,
+    'set_chat_permissions': 0,
+    'send_message': 0,
+    'edit_message_text': 1,
+}
+
+# Методы, отправляющие сообщения в чат, дополнительно ограничены лимитом чата
+CHAT_LIMITED_METHODS = {'send_message', 'reply_to'}
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+    def delay(self, now):
+        """Через сколько секунд появится токен (0 - уже есть)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, now, seconds):
+        self.paused_until = max(self.paused_until, now + seconds)
+
+
+class _Job:
+    __slots__ = ('method', 'func', 'args', 'kwargs', 'chat_id', 'lane', 'future', 'retries')
+
+    def __init__(self, method, func, args, kwargs, chat_id, lane, future):
+        self.method = method
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.chat_id = chat_id
+        self.lane = lane
+        self.future = future
+        self.retries = 0
+
+
+class _OutboundQueue:
+    """Полосы приоритета и корзины токенов исходящих запросов.
+
+    Общая часть OutboundDispatcher (пул потоков) и AsyncOutboundDispatcher
+    (цикл событий); синхронизацию доступа обеспечивает наследник.
+    """
+
+    def __init__(self, max_queue, global_rate, global_burst):
+        self.max_queue = max_queue
+        self._lanes = [deque(), deque(), deque()]
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats = {}
+        self.sent = 0
+        self.dropped = 0
+        self.rate_limited = 0
+
+    def _push(self, job):
+        """Ставит запрос в его полосу. Возвращает запрос, отброшенный из-за переполнения, или None."""
+        if self._queued() >= self.max_queue:
+            # При перегрузке жертвуем только уведомлениями: новым или самым старым из очереди.
+            # Удаления, ограничения и ответы не теряются и ставятся в очередь сверх лимита
+            victim = job if job.lane == LANE_LOW else (self._lanes[LANE_LOW].popleft() if self._lanes[LANE_LOW] else None)
+            if victim is not None:
+                self.dropped += 1
+                logger.warning(f"Очередь исходящих переполнена, уведомление {victim.method} в чат {victim.chat_id} отброшено")
+                if victim is job:
+                    return job
+            self._lanes[job.lane].append(job)
+            return victim
+        self._lanes[job.lane].append(job)
+        return None
+
+    def _retry_later(self, job, error):
+        """После ответа 429 приостанавливает корзину и возвращает запрос в начало полосы.
+
+        Возвращает False, если запрос повторять не нужно.
+        """
+        # ApiTelegramException синхронного и асинхронного клиентов - разные классы
+        if getattr(error, 'error_code', None) != 429 or job.retries >= OUTBOUND_MAX_RETRIES:
+            return False
+        retry_after = ((getattr(error, 'result_json', None) or {}).get('parameters') or {}).get('retry_after', 1)
+        self.rate_limited += 1
+        job.retries += 1
+        logger.warning(f"429 на {job.method} в чат {job.chat_id}, повтор через {retry_after} с")
+        bucket = self._chat_bucket(job.chat_id) if job.chat_id is not None else self._global
+        bucket.pause(time.monotonic(), retry_after)
+        self._lanes[job.lane].appendleft(job)
+        return True
+
+    def _metrics(self):
+        return {
+            'queued': [len(lane) for lane in self._lanes],
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'rate_limited': self.rate_limited,
+        }
+
+    def _queued(self):
+        return sum(len(lane) for lane in self._lanes)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= OUTBOUND_MAX_CHAT_BUCKETS:
+                # Полные корзины без паузы ничем не отличаются от новых
+                now = time.monotonic()
+                for key in [key for key, b in self._chats.items() if b.delay(now) == 0 and b.tokens >= b.capacity]:
+                    del self._chats[key]
+            bucket = self._chats[chat_id] = TokenBucket(OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST)
+        return bucket
+
+    def _next_job(self, now):
+        """Первый готовый к отправке запрос в порядке приоритета и время ожидания, если такого нет."""
+        wait = None
+        global_delay = self._global.delay(now)
+        for lane in self._lanes:
+            for index, job in enumerate(lane):
+                delay = global_delay
+                bucket = self._chat_bucket(job.chat_id) if job.chat_id is not None else None
+                if bucket and job.method in CHAT_LIMITED_METHODS:
+                    delay = max(delay, bucket.delay(now))
+                elif bucket:
+                    # На остальные методы действует только пауза чата после 429
+                    delay = max(delay, bucket.paused_until - now, 0)
+                if delay == 0:
+                    del lane[index]
+                    self._global.take()
+                    if bucket and job.method in CHAT_LIMITED_METHODS:
+                        bucket.take()
+                    return job, None
+                wait = delay if wait is None else min(wait, delay)
+                # Если мешает только общий лимит, дальше по полосе искать бесполезно
+                if delay == global_delay:
+                    break
+        return None, wait
+
+
+class OutboundDispatcher(_OutboundQueue):
+    """Центральная очередь исходящих запросов к Bot API.
+
+    Запросы разложены по полосам приоритета и выполняются пулом потоков с
+    учётом общей корзины токенов и корзин отдельных чатов. Ответ 429
+    приостанавливает соответствующую корзину на retry_after, а запрос
+    возвращается в начало своей полосы.
+    """
+
+    def __init__(self, workers=OUTBOUND_WORKERS, max_queue=OUTBOUND_MAX_QUEUE,
+                 global_rate=OUTBOUND_GLOBAL_RATE, global_burst=OUTBOUND_GLOBAL_BURST):
+        super().__init__(max_queue, global_rate, global_burst)
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f"outbound-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, method, func, args=(), kwargs=None, chat_id=None, lane=None):
+        """Ставит вызов в очередь и возвращает Future с его результатом."""
+        lane = METHOD_LANES.get(method, LANE_NORMAL) if lane is None else lane
+        job = _Job(method, func, args, kwargs or {}, chat_id, lane, Future())
+        with self._cond:
+            victim = self._push(job)
+            if victim is not None:
+                victim.future.set_result(None)
+            if victim is not job:
+                self._cond.notify()
+        return job.future
+
+    def metrics(self):
+        with self._cond:
+            return self._metrics()
+
+    def shutdown(self, timeout=10):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping and not self._queued():
+                        return
+                    job, wait = self._next_job(time.monotonic())
+                    if job:
+                        break
+                    self._cond.wait(wait)
+            self._execute(job)
+
+    def _execute(self, job):
+        try:
+            result = job.func(*job.args, **job.kwargs)
+            self.sent += 1
+            job.future.set_result(result)
+        except Exception as e:
+            with self._cond:
+                if self._retry_later(job, e):
+                    self._cond.notify()
+                    return
+            job.future.set_exception(e)
+
+
+class AsyncOutboundDispatcher(_OutboundQueue):
+    """Очередь исходящих запросов на цикле событий для методов AsyncTeleBot.
+
+    Полосы и лимиты те же, что у OutboundDispatcher, но потоков нет: submit -
+    корутина, которая ставит запрос в очередь и ждёт результата, а одна задача
+    цикла событий выдаёт токены и запускает готовые запросы отдельными
+    задачами. Число одновременных запросов ограничивает пул соединений aiohttp.
+    Все методы вызываются только из цикла событий.
+    """
+
+    def __init__(self, max_queue=OUTBOUND_MAX_QUEUE,
+                 global_rate=OUTBOUND_GLOBAL_RATE, global_burst=OUTBOUND_GLOBAL_BURST):
+        super().__init__(max_queue, global_rate, global_burst)
+        self._wakeup = asyncio.Event()
+        self._pump = None
+        self._tasks = set()
+
+    async def submit(self, method, func, args=(), kwargs=None, chat_id=None, lane=None):
+        """Ставит вызов корутины func в очередь и возвращает её результат (None, если уведомление отброшено)."""
+        lane = METHOD_LANES.get(method, LANE_NORMAL) if lane is None else lane
+        job = _Job(method, func, args, kwargs or {}, chat_id, lane, asyncio.get_running_loop().create_future())
+        victim = self._push(job)
+        if victim is not None and not victim.future.done():
+            victim.future.set_result(None)
+        if victim is not job:
+            if self._pump is None:
+                self._pump = asyncio.create_task(self._run())
+            self._wakeup.set()
+        return await job.future
+
+    def metrics(self):
+        return self._metrics()
+
+    async def shutdown(self):
+        if self._pump is not None:
+            self._pump.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            job, wait = self._next_job(time.monotonic())
+            if job is not None:
+                task = asyncio.create_task(self._execute(job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                continue
+            # Между _next_job и ожиданием цикл не переключается, поэтому пробуждение не теряется
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, job):
+        try:
+            result = await job.func(*job.args, **job.kwargs)
+        except Exception as e:
+            if self._retry_later(job, e):
+                self._wakeup.set()
+            elif not job.future.done():
+                job.future.set_exception(e)
+            return
+        self.sent += 1
+        if not job.future.done():
+            job.future.set_result(result)
+
+
+def chat_id_of(method, args, kwargs):
+    """Чат вызова или None, если вызов не относится к чату (тогда действует только общий лимит)."""
+    if method == 'reply_to':
+        message = args[0] if args else kwargs.get('message')
+        return message.chat.id if message is not None else None
+    if 'chat_id' in kwargs:
+        return kwargs['chat_id']
+    position = CHAT_ID_POSITIONS.get(method)
+    if position is None or len(args) <= position:
+        return None
+    return args[position]
+
+
+class RateLimitedBot:
+    """Обёртка бота, пропускающая вызовы Bot API через OutboundDispatcher.
+
+    Синхронные вызовы вроде bot.send_message(...) ждут результата, как и
+    раньше. notify() ставит косметическое уведомление в низкую полосу и не
+    ждёт отправки. Остальные атрибуты (декораторы обработчиков, get_* и т.д.)
+    берутся у исходного бота.
+    """
+
+    def __init__(self, bot, dispatcher=None):
+        self.bot = bot
+        self.dispatcher = dispatcher or OutboundDispatcher()
+
+    def __getattr__(self, name):
+        attr = getattr(self.bot, name)
+        if name not in METHOD_LANES:
+            return attr
+
+        def call(*args, **kwargs):
+            chat_id = chat_id_of(name, args, kwargs)
+            return self.dispatcher.submit(name, attr, args, kwargs, chat_id).result()
+        return call
+
+    def notify(self, chat_id, text, callback=None, **kwargs):
+        """Отправляет уведомление низкого приоритета; callback(message) вызывается после отправки."""
+        future = self.dispatcher.submit(
+            'send_message', self.bot.send_message, (chat_id, text), kwargs, chat_id, LANE_LOW
+        )
+        return on_notify_sent(future, chat_id, callback)
+
+
+def on_notify_sent(future, chat_id, callback):
+    """Вызывает callback(message), когда уведомление отправлено; отброшенные уведомления пропускаются."""
+    if callback:
+        def done(f):
+            if f.exception():
+                logger.error(f"Ошибка отправки уведомления в чат {chat_id}: {f.exception()}")
+            elif f.result() is not None:
+                callback(f.result())
+        future.add_done_callback(done)
+    return future
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from array import array
+from telebot import types
+from config import RAID_JOIN_THRESHOLD, RAID_WINDOW_SECONDS, RAID_LOCKDOWN_SECONDS
+from scheduler import scheduler
+from moderation import executor
+from utils import delete_message_after_delay
+
+logger = logging.getLogger(__name__)
+
+# captcha_{chat_id}_0: общая кнопка капчи, действующая для нажавшего её участника
+SHARED_CAPTCHA_USER_ID = 0
+
+
+class RaidDetector:
+    """Детектор наплыва вступлений в чат по скользящему окну.
+
+    Для каждого чата хранится кольцевой буфер из RAID_JOIN_THRESHOLD меток
+    времени последних вступлений. Если самая старая из них попадает в окно,
+    значит за окно вступило не меньше порога участников, и чат переводится в
+    режим блокировки. Каждое вступление обрабатывается за O(1).
+    """
+
+    def __init__(self, threshold=RAID_JOIN_THRESHOLD, window=RAID_WINDOW_SECONDS, lockdown=RAID_LOCKDOWN_SECONDS):
+        self.threshold = threshold
+        self.window = window
+        self.lockdown = lockdown
+        self._joins = {}
+        self._positions = {}
+        self._lockdown_until = {}
+        self._lockdown_joins = {}
+        self._lock = threading.Lock()
+
+    def record_join(self, chat_id, now=None):
+        """Учитывает вступление. Возвращает 'start', если блокировка началась сейчас,
+        'active', если чат уже в блокировке, иначе None."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            ring = self._joins.get(chat_id)
+            if ring is None:
+                ring = self._joins[chat_id] = array('d', [float('-inf')] * self.threshold)
+                self._positions[chat_id] = 0
+            position = self._positions[chat_id]
+            oldest = ring[position]
+            ring[position] = now
+            self._positions[chat_id] = (position + 1) % self.threshold
+
+            if self._lockdown_until.get(chat_id, 0) > now:
+                # Пока вступления продолжаются, блокировка продлевается
+                self._lockdown_until[chat_id] = now + self.lockdown
+                self._lockdown_joins[chat_id] += 1
+                return 'active'
+            if now - oldest <= self.window:
+                self._lockdown_until[chat_id] = now + self.lockdown
+                self._lockdown_joins[chat_id] = 1
+                return 'start'
+            return None
+
+    def lockdown_remaining(self, chat_id, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return max(self._lockdown_until.get(chat_id, 0) - now, 0)
+
+    def lockdown_joins(self, chat_id):
+        with self._lock:
+            return self._lockdown_joins.get(chat_id, 0)
+
+    def restore_lockdown(self, chat_id, remaining, joined, now=None):
+        """Возобновляет блокировку, сохранённую до перезапуска процесса."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._lockdown_until[chat_id] = now + remaining
+            self._lockdown_joins[chat_id] = joined
+
+    def end_lockdown(self, chat_id):
+        """Снимает блокировку; возвращает число участников, вступивших за время блокировки."""
+        with self._lock:
+            self._lockdown_until.pop(chat_id, None)
+            return self._lockdown_joins.pop(chat_id, 0)
+
+
+detector = RaidDetector()
+
+
+def restrict_during_raid(bot, db, chat_id, members, started):
+    """Ограничивает вступивших во время рейда без отдельных приветствий и капч.
+
+    Ограничения отправляются параллельно; при начале блокировки в чат уходит
+    одно общее уведомление, а капча предлагается одной кнопкой после рейда.
+    """
+    futures = []
+    for member in members:
+        db.add_chat_member(chat_id, member.id)
+        futures.append((member.id, executor.submit(
+            'restrict_chat_member', bot.restrict_chat_member, chat_id, member.id,
+            permissions=types.ChatPermissions(can_send_messages=False)
+        )))
+    if started:
+        logger.warning(f"Рейд в чате {chat_id}: включена блокировка на {detector.lockdown} с")
+        try:
+            sent_message = bot.send_message(
+                chat_id,
+                "🚨 Обнаружен массовый наплыв участников. Новые участники временно ограничены, "
+                "капча будет доступна после окончания наплыва."
+            )
+            delete_message_after_delay(bot, chat_id, sent_message.message_id, db)
+        except Exception as e:
+            logger.error(f"Ошибка отправки уведомления о рейде в чат {chat_id}: {e}")
+        _save_lockdown(db, chat_id)
+        scheduler.schedule(detector.lockdown, _finish_lockdown, bot, db, chat_id)
+    for user_id, future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            logger.error(f"Ошибка ограничения {user_id} во время рейда в чате {chat_id}: {e}")
+
+
+def recover_lockdowns(bot, db, owns=None):
+    """Восстанавливает блокировки, сохранённые до перезапуска, и планирует их снятие.
+
+    owns(chat_id) отбирает чаты этого процесса, если обработчиков несколько.
+    Блокировка, истёкшая за время простоя, снимается сразу, и вступившие
+    получают кнопку капчи.
+    """
+    now = time.time()
+    for chat_id, until, joined in db.get_raid_lockdowns():
+        if owns is not None and not owns(chat_id):
+            continue
+        remaining = max(until - now, 0)
+        detector.restore_lockdown(chat_id, remaining, joined)
+        scheduler.schedule(remaining, _finish_lockdown, bot, db, chat_id)
+        logger.info(f"Блокировка чата {chat_id} восстановлена, до снятия {remaining:.0f} с")
+
+
+def _save_lockdown(db, chat_id):
+    # Сохраняется при начале и при каждом продлении по расписанию, а не на каждое вступление
+    until = time.time() + detector.lockdown_remaining(chat_id)
+    try:
+        db.save_raid_lockdown(chat_id, until, detector.lockdown_joins(chat_id))
+    except Exception as e:
+        logger.error(f"Ошибка сохранения блокировки чата {chat_id}: {e}")
+
+
+def _finish_lockdown(bot, db, chat_id):
+    remaining = detector.lockdown_remaining(chat_id)
+    if remaining > 0:
+        _save_lockdown(db, chat_id)
+        scheduler.schedule(remaining, _finish_lockdown, bot, db, chat_id)
+        return
+    joined = detector.end_lockdown(chat_id)
+    try:
+        db.remove_raid_lockdown(chat_id)
+    except Exception as e:
+        logger.error(f"Ошибка удаления блокировки чата {chat_id}: {e}")
+    logger.info(f"Блокировка чата {chat_id} снята, за время рейда вступило {joined}")
+    try:
+        markup = types.InlineKeyboardMarkup()
+        markup.add(types.InlineKeyboardButton(
+            "Пройти капчу",
+            callback_data=f"captcha_{chat_id}_{SHARED_CAPTCHA_USER_ID}"
+        ))
+        sent_message = bot.send_message(
+            chat_id,
+            f"Наплыв участников закончился. Новые участники ({joined}), пройдите капчу, "
+            f"нажав на кнопку ниже, чтобы начать писать в чат.",
+            reply_markup=markup
+        )
+        delete_message_after_delay(bot, chat_id, sent_message.message_id, db, RAID_LOCKDOWN_SECONDS)
+    except Exception as e:
+        logger.error(f"Ошибка отправки капчи после рейда в чат {chat_id}: {e}")
@@ -0,0 +1,120 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """Один поток для всех отложенных задач бота.
+
+    Задачи хранятся в куче по времени срабатывания, поэтому число потоков
+    не растёт вместе с количеством запланированных удалений. Отменённые
+    задачи помечаются и выбрасываются при извлечении из кучи.
+    """
+
+    def __init__(self, name="scheduler"):
+        self.name = name
+        self._heap = []
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.executed = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def start(self):
+        """Запуск потока планировщика (вызывается автоматически при первой задаче)."""
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        logger.info(f"Планировщик {self.name} запущен")
+
+    def schedule(self, delay, func, *args, **kwargs):
+        """Планирует вызов func через delay секунд. Возвращает id задачи для отмены."""
+        if not self._thread or not self._thread.is_alive():
+            self.start()
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError(f"Планировщик {self.name} остановлен")
+            job_id = next(self._ids)
+            entry = [time.monotonic() + delay, job_id, func, args, kwargs]
+            self._jobs[job_id] = entry
+            heapq.heappush(self._heap, entry)
+            # Будим поток, только если новая задача стала ближайшей
+            if self._heap[0] is entry:
+                self._cond.notify()
+        return job_id
+
+    def cancel(self, job_id):
+        """Отменяет задачу. Возвращает False, если она уже выполнена или неизвестна."""
+        with self._cond:
+            entry = self._jobs.pop(job_id, None)
+            if entry is None:
+                return False
+            entry[2] = None
+            self.cancelled += 1
+            return True
+
+    def metrics(self):
+        """Метрики планировщика: число ожидающих задач, выполненных, отменённых и упавших."""
+        with self._cond:
+            next_due = self._heap[0][0] - time.monotonic() if self._jobs else None
+            return {
+                'pending': len(self._jobs),
+                'heap_size': len(self._heap),
+                'executed': self.executed,
+                'cancelled': self.cancelled,
+                'failed': self.failed,
+                'next_due_in': max(next_due, 0) if next_due is not None else None,
+            }
+
+    def shutdown(self, drain=True, timeout=10):
+        """Останавливает планировщик. При drain=True оставшиеся задачи выполняются немедленно."""
+        with self._cond:
+            self._stopping = True
+            if drain:
+                for entry in self._heap:
+                    entry[0] = 0
+            else:
+                self._jobs.clear()
+                self._heap.clear()
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+        logger.info(f"Планировщик {self.name} остановлен: {self.metrics()}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    # Выбрасываем отменённые задачи с вершины кучи
+                    while self._heap and self._heap[0][2] is None:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        if self._stopping:
+                            return
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                _, job_id, func, args, kwargs = heapq.heappop(self._heap)
+                self._jobs.pop(job_id, None)
+            try:
+                func(*args, **kwargs)
+                self.executed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Ошибка выполнения задачи {job_id} планировщика {self.name}: {e}")
+
+
+scheduler = Scheduler()
@@ -0,0 +1,92 @@
+"""Проверка RedisStorage и кэша Database поверх него на двух "процессах".
+
+Запуск: python smoke_redis_storage.py [redis://...]
+
+Без адреса используется fakeredis (pip install fakeredis) - локальная замена
+Redis в памяти; с адресом - настоящий сервер (ключи пишутся с отдельным
+префиксом и удаляются в конце). Два экземпляра Database делят одно хранилище,
+как процессы-обработчики в режиме supervisor: проверяются настройки,
+предупреждения, жалобы и доставка инвалидаций кэша через pub/sub.
+"""
+import sys
+import time
+import redis
+from database import Database
+from storage.redis_storage import RedisStorage
+
+CHAT_ID = -1001
+USER_ID = 42
+PREFIX = 'netspamy-smoke'
+
+
+def make_clients(url):
+    if url:
+        return [redis.Redis.from_url(url) for _ in range(2)]
+    import fakeredis
+    server = fakeredis.FakeServer()
+    return [fakeredis.FakeRedis(server=server) for _ in range(2)]
+
+
+def wait_for(condition, timeout=5):
+    """Ждёт, пока condition() станет истинным: инвалидации приходят асинхронно.
+
+    timeout меньше STORAGE_CACHE_TTL_SECONDS, так что истечение кэша проверку не пройдёт.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def main(url=None):
+    clients = make_clients(url)
+    first, second = (Database(storage=RedisStorage(client=client, prefix=PREFIX)) for client in clients)
+    failures = []
+
+    def check(name, ok):
+        print(f"{'OK ' if ok else 'FAIL'} {name}")
+        if not ok:
+            failures.append(name)
+
+    try:
+        first.add_group(CHAT_ID)
+        check("группа создана с настройками по умолчанию", second.get_group_settings(CHAT_ID).get('profanity_filter') is True)
+
+        # Второй процесс закэшировал настройки; запись в первом должна сбросить его кэш
+        first.update_group_setting(CHAT_ID, 'profanity_filter', False)
+        check("настройка сохранена", first.get_group_settings(CHAT_ID)['profanity_filter'] is False)
+        check(
+            "инвалидация настроек дошла до другого процесса",
+            wait_for(lambda: second.get_group_settings(CHAT_ID)['profanity_filter'] is False)
+        )
+
+        second.get_admins(CHAT_ID)
+        first.update_admins(CHAT_ID, [1, 2])
+        check("инвалидация админов дошла до другого процесса", wait_for(lambda: set(second.get_admins(CHAT_ID)) == {1, 2}))
+
+        counts = [first.add_warning(CHAT_ID, USER_ID), second.add_warning(CHAT_ID, USER_ID)]
+        check("предупреждения считаются атомарно в обоих процессах", counts == [1, 2])
+        first.reset_warnings(CHAT_ID, USER_ID)
+        check("предупреждения сброшены", second.add_warning(CHAT_ID, USER_ID) == 1)
+
+        first.add_report(CHAT_ID, 1, USER_ID, "спам", 100)
+        second.add_report(CHAT_ID, 2, USER_ID, "спам", 101)
+        check("жалобы видны обоим процессам", first.count_user_reports(CHAT_ID, USER_ID, 3600) == 2)
+
+        first.purge_group(CHAT_ID)
+        check("группа удалена", CHAT_ID not in second.get_all_groups())
+    finally:
+        keys = clients[0].keys(f"{PREFIX}:*")
+        if keys:
+            clients[0].delete(*keys)
+        first.close()
+        second.close()
+
+    print(f"Проверок не пройдено: {len(failures)}")
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main(*sys.argv[1:2]) else 0)
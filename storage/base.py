@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+from config import DB_CLEANUP_INTERVAL_SECONDS, DB_CLEANUP_BATCH_SIZE, DB_VACUUM_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class Storage:
+    """Интерфейс хранилища состояния бота.
+
+    Методы повторяют публичные методы Database; реализации обязаны быть
+    потокобезопасными. Изменения, влияющие на кэш Database, рассылаются
+    другим процессам через publish_invalidation/subscribe_invalidations.
+    """
+
+    def __init__(self):
+        self._maintenance_stop = threading.Event()
+        self._maintenance_thread = None
+
+    # Участники и капча
+    def add_chat_member(self, chat_id, user_id):
+        raise NotImplementedError
+
+    def remove_chat_member(self, chat_id, user_id):
+        raise NotImplementedError
+
+    def get_chat_members(self, chat_id):
+        raise NotImplementedError
+
+    def mark_members_passed(self, chat_id, user_ids):
+        raise NotImplementedError
+
+    def set_captcha_passed(self, chat_id, user_id):
+        raise NotImplementedError
+
+    def has_passed_captcha(self, chat_id, user_id):
+        raise NotImplementedError
+
+    # Группы и настройки
+    def add_group(self, chat_id):
+        raise NotImplementedError
+
+    def purge_group(self, chat_id):
+        raise NotImplementedError
+
+    def get_all_groups(self):
+        raise NotImplementedError
+
+    def get_group_settings(self, chat_id):
+        raise NotImplementedError
+
+    def update_group_setting(self, chat_id, setting, value):
+        raise NotImplementedError
+
+    def get_info_rules(self, chat_id):
+        raise NotImplementedError
+
+    def update_info_rules(self, chat_id, new_rules):
+        raise NotImplementedError
+
+    # Запрещённые слова группы
+    def add_banned_words(self, chat_id, words):
+        raise NotImplementedError
+
+    def remove_banned_words(self, chat_id, words):
+        raise NotImplementedError
+
+    def get_banned_words(self, chat_id):
+        raise NotImplementedError
+
+    # Разрешённые и запрещённые домены группы
+    def set_link_domains(self, chat_id, domains, allowed):
+        raise NotImplementedError
+
+    def remove_link_domains(self, chat_id, domains):
+        raise NotImplementedError
+
+    def get_link_domains(self, chat_id):
+        raise NotImplementedError
+
+    # Общий бан-лист
+    def add_global_ban(self, user_id, chat_id, reason):
+        raise NotImplementedError
+
+    def remove_global_ban(self, user_id):
+        raise NotImplementedError
+
+    def is_globally_banned(self, user_id):
+        raise NotImplementedError
+
+    def get_global_ban_ids(self):
+        raise NotImplementedError
+
+    # Известные спам-картинки (64-битные перцептивные хеши)
+    def add_spam_image(self, image_hash, chat_id, user_id):
+        raise NotImplementedError
+
+    def remove_spam_image(self, image_hash):
+        raise NotImplementedError
+
+    def get_spam_images(self):
+        raise NotImplementedError
+
+    # Рассылки одного текста по многим чатам (подписи MinHash и полосы LSH)
+    def get_duplicate_candidates(self, band_keys, since):
+        """Рассылки, встречавшиеся после since в любой из полос: [(campaign_id, подпись), ...]."""
+        raise NotImplementedError
+
+    def record_duplicate(self, campaign_id, signature, band_keys, chat_id, now, window):
+        """Отмечает рассылку в чате; возвращает число чатов, где она встречалась за window секунд."""
+        raise NotImplementedError
+
+    # Администраторы и предупреждения
+    def update_admins(self, chat_id, admin_ids):
+        raise NotImplementedError
+
+    def get_admins(self, chat_id):
+        raise NotImplementedError
+
+    def add_warning(self, chat_id, user_id):
+        raise NotImplementedError
+
+    def reset_warnings(self, chat_id, user_id):
+        raise NotImplementedError
+
+    # Жалобы
+    def add_report(self, chat_id, reporter_id, reported_user_id, reason, message_id):
+        raise NotImplementedError
+
+    def count_user_reports(self, chat_id, user_id, window_seconds, include_archive=False):
+        raise NotImplementedError
+
+    def set_report_chat(self, chat_id, log_chat_id):
+        raise NotImplementedError
+
+    def get_report_chat(self, chat_id):
+        raise NotImplementedError
+
+    def is_report_chat(self, chat_id):
+        raise NotImplementedError
+
+    # Приветственные сообщения в личке
+    def save_welcome_message(self, user_id, message_id):
+        raise NotImplementedError
+
+    def get_welcome_message(self, user_id):
+        raise NotImplementedError
+
+    # Отложенные удаления сообщений бота
+    def add_scheduled_deletion(self, chat_id, message_id, due_at):
+        raise NotImplementedError
+
+    def remove_scheduled_deletion(self, chat_id, message_id):
+        raise NotImplementedError
+
+    def pop_due_deletions(self, now, limit):
+        raise NotImplementedError
+
+    def next_deletion_due(self):
+        raise NotImplementedError
+
+    # Блокировки чатов во время рейда
+    def save_raid_lockdown(self, chat_id, until, joined):
+        raise NotImplementedError
+
+    def remove_raid_lockdown(self, chat_id):
+        raise NotImplementedError
+
+    def get_raid_lockdowns(self):
+        raise NotImplementedError
+
+    # Межпроцессная инвалидация кэша
+    def publish_invalidation(self, kind, chat_id):
+        """Сообщает другим процессам, что закэшированные данные группы устарели."""
+
+    def subscribe_invalidations(self, callback):
+        """Подписка на инвалидации из других процессов: callback(kind, chat_id)."""
+
+    # Обслуживание
+    def cleanup_stale_rows(self, batch_size=DB_CLEANUP_BATCH_SIZE):
+        return 0
+
+    def archive_reports(self, batch_size=DB_CLEANUP_BATCH_SIZE):
+        return 0
+
+    def vacuum(self):
+        pass
+
+    def close(self):
+        self.stop_maintenance()
+
+    def start_maintenance(self, interval=DB_CLEANUP_INTERVAL_SECONDS, vacuum_interval=DB_VACUUM_INTERVAL_SECONDS):
+        """Запускает фоновую очистку хранилища с периодическим vacuum."""
+        if self._maintenance_thread and self._maintenance_thread.is_alive():
+            return
+        self._maintenance_stop.clear()
+        self._maintenance_thread = threading.Thread(
+            target=self._maintenance_loop, args=(interval, vacuum_interval),
+            name="db-maintenance", daemon=True
+        )
+        self._maintenance_thread.start()
+        logger.info("Фоновая очистка базы данных запущена")
+
+    def stop_maintenance(self):
+        """Останавливает фоновую очистку хранилища."""
+        self._maintenance_stop.set()
+
+    def _maintenance_loop(self, interval, vacuum_interval):
+        last_vacuum = time.monotonic()
+        while not self._maintenance_stop.wait(interval):
+            # Удаляем порциями, отпуская блокировку между ними, чтобы не задерживать обработчики
+            while not self._maintenance_stop.is_set():
+                deleted = self.cleanup_stale_rows()
+                archived = self.archive_reports()
+                if deleted or archived:
+                    logger.info(f"Фоновая очистка удалила {deleted} устаревших строк, в архив перенесено {archived} жалоб")
+                if max(deleted, archived) < DB_CLEANUP_BATCH_SIZE:
+                    break
+            if time.monotonic() - last_vacuum >= vacuum_interval:
+                self.vacuum()
+                last_vacuum = time.monotonic()
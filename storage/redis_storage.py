@@ -0,0 +1,396 @@
+import json
+import logging
+import time
+import redis
+from redis.exceptions import WatchError
+from config import (
+    DEFAULT_SETTINGS, DB_CLEANUP_BATCH_SIZE, WELCOME_MESSAGE_TTL_DAYS, REPORTS_RETENTION_DAYS,
+    REDIS_URL, REDIS_KEY_PREFIX
+)
+from storage.base import Storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INFO_RULES = "Здравствуйте, пока!"
+
+
+class RedisStorage(Storage):
+    """Хранилище в Redis-совместимом сервере, общее для нескольких процессов бота.
+
+    Схема ключей (все с префиксом REDIS_KEY_PREFIX):
+      groups                          множество chat_id
+      group:{chat_id}                 хэш settings / info_rules
+      admins:{chat_id}                множество user_id
+      banned_words:{chat_id}          множество запрещённых слов группы
+      link_domains:{chat_id}          хэш домен -> 1 (разрешён) / 0 (запрещён)
+      global_bans                     хэш user_id -> JSON {chat_id, reason, time} общего бан-листа
+      spam_images                     хэш hex-хеш картинки -> JSON {chat_id, user_id, time}
+      members:{chat_id}               множество user_id
+      captcha:{chat_id}               хэш user_id -> 0/1
+      warnings:{chat_id}              хэш user_id -> счётчик
+      reports:{chat_id}:{user_id}     zset жалоб (score - unix time)
+      reports_archive:{...}           zset жалоб старше срока хранения
+      report_users:{chat_id}          множество user_id, на которых есть жалобы
+      report_chat:{chat_id}           log_chat_id
+      log_chat:{log_chat_id}          множество групп, пишущих в лог-чат
+      welcome:{user_id}               message_id с TTL
+      deletions                       zset "chat_id:message_id" (score - время удаления)
+      raid_lockdowns                  хэш chat_id -> JSON {until, joined} блокировок во время рейда
+      dup_band:{band_key}             zset campaign_id рассылок с этой полосой подписи (score - время), TTL окна
+      dup_sig:{campaign_id}           подпись MinHash рассылки (JSON), TTL окна
+      dup_chats:{campaign_id}         zset chat_id, где встречалась рассылка (score - время), TTL окна
+    """
+
+    def __init__(self, url=REDIS_URL, client=None, prefix=REDIS_KEY_PREFIX):
+        super().__init__()
+        if client is None:
+            client = redis.Redis.from_url(url)
+        # client может быть любым совместимым клиентом, например fakeredis.FakeRedis()
+        self.redis = client
+        self.prefix = prefix
+        self._pubsub_thread = None
+        logger.info("Redis storage initialized")
+
+    def _key(self, *parts):
+        return ":".join([self.prefix, *map(str, parts)])
+
+    @staticmethod
+    def _ints(values):
+        return [int(value) for value in values]
+
+    def _ensure_group(self, pipe, chat_id):
+        pipe.sadd(self._key("groups"), chat_id)
+        pipe.hsetnx(self._key("group", chat_id), "settings", json.dumps(DEFAULT_SETTINGS))
+        pipe.hsetnx(self._key("group", chat_id), "info_rules", DEFAULT_INFO_RULES)
+
+    def add_chat_member(self, chat_id, user_id):
+        pipe = self.redis.pipeline()
+        self._ensure_group(pipe, chat_id)
+        pipe.sadd(self._key("members", chat_id), user_id)
+        pipe.hsetnx(self._key("captcha", chat_id), user_id, 0)
+        pipe.execute()
+
+    def remove_chat_member(self, chat_id, user_id):
+        pipe = self.redis.pipeline()
+        pipe.srem(self._key("members", chat_id), user_id)
+        pipe.hdel(self._key("captcha", chat_id), user_id)
+        pipe.execute()
+
+    def get_chat_members(self, chat_id):
+        return self._ints(self.redis.smembers(self._key("members", chat_id)))
+
+    def mark_members_passed(self, chat_id, user_ids):
+        pipe = self.redis.pipeline()
+        self._ensure_group(pipe, chat_id)
+        for user_id in user_ids:
+            pipe.sadd(self._key("members", chat_id), user_id)
+            pipe.hset(self._key("captcha", chat_id), user_id, 1)
+        pipe.execute()
+
+    def set_captcha_passed(self, chat_id, user_id):
+        pipe = self.redis.pipeline()
+        self._ensure_group(pipe, chat_id)
+        pipe.hset(self._key("captcha", chat_id), user_id, 1)
+        pipe.execute()
+
+    def has_passed_captcha(self, chat_id, user_id):
+        return self.redis.hget(self._key("captcha", chat_id), user_id) in (b"1", "1")
+
+    def add_group(self, chat_id):
+        pipe = self.redis.pipeline()
+        self._ensure_group(pipe, chat_id)
+        pipe.execute()
+
+    def purge_group(self, chat_id):
+        """Удаляет все данные группы одной транзакцией MULTI/EXEC."""
+        report_users = self.redis.smembers(self._key("report_users", chat_id))
+        log_chat_id = self.redis.get(self._key("report_chat", chat_id))
+        source_chats = self.redis.smembers(self._key("log_chat", chat_id))
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.srem(self._key("groups"), chat_id)
+        pipe.delete(
+            self._key("group", chat_id), self._key("admins", chat_id), self._key("members", chat_id),
+            self._key("captcha", chat_id), self._key("warnings", chat_id), self._key("report_users", chat_id),
+            self._key("report_chat", chat_id), self._key("log_chat", chat_id), self._key("banned_words", chat_id),
+            self._key("link_domains", chat_id)
+        )
+        pipe.hdel(self._key("raid_lockdowns"), chat_id)
+        for user_id in report_users:
+            user_id = int(user_id)
+            pipe.delete(self._key("reports", chat_id, user_id), self._key("reports_archive", chat_id, user_id))
+            pipe.srem(self._key("report_keys"), f"{chat_id}:{user_id}")
+        if log_chat_id is not None:
+            pipe.srem(self._key("log_chat", int(log_chat_id)), chat_id)
+        # Группы, чьи жалобы шли в удаляемый чат, остаются без лог-чата
+        for source_chat_id in source_chats:
+            pipe.delete(self._key("report_chat", int(source_chat_id)))
+        pipe.execute()
+        members = list(self.redis.zscan_iter(self._key("deletions"), match=f"{chat_id}:*"))
+        if members:
+            self.redis.zrem(self._key("deletions"), *(member for member, _ in members))
+        logger.info(f"Данные группы {chat_id} удалены из Redis")
+
+    def get_all_groups(self):
+        return self._ints(self.redis.smembers(self._key("groups")))
+
+    def get_group_settings(self, chat_id):
+        settings = self.redis.hget(self._key("group", chat_id), "settings")
+        return json.loads(settings) if settings else DEFAULT_SETTINGS
+
+    def update_group_setting(self, chat_id, setting, value):
+        key = self._key("group", chat_id)
+        # Оптимистичная блокировка: настройки хранятся одним JSON и могут меняться из разных процессов
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    if not pipe.hexists(key, "settings"):
+                        pipe.unwatch()
+                        return
+                    settings = json.loads(pipe.hget(key, "settings"))
+                    settings[setting] = value
+                    pipe.multi()
+                    pipe.hset(key, "settings", json.dumps(settings))
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def get_info_rules(self, chat_id):
+        rules = self.redis.hget(self._key("group", chat_id), "info_rules")
+        return rules.decode() if isinstance(rules, bytes) else (rules or DEFAULT_INFO_RULES)
+
+    def update_info_rules(self, chat_id, new_rules):
+        if self.redis.sismember(self._key("groups"), chat_id):
+            self.redis.hset(self._key("group", chat_id), "info_rules", new_rules)
+
+    def add_banned_words(self, chat_id, words):
+        pipe = self.redis.pipeline(transaction=True)
+        self._ensure_group(pipe, chat_id)
+        pipe.sadd(self._key("banned_words", chat_id), *words)
+        pipe.execute()
+
+    def remove_banned_words(self, chat_id, words):
+        self.redis.srem(self._key("banned_words", chat_id), *words)
+
+    def get_banned_words(self, chat_id):
+        return sorted(word.decode() if isinstance(word, bytes) else word
+                      for word in self.redis.smembers(self._key("banned_words", chat_id)))
+
+    def set_link_domains(self, chat_id, domains, allowed):
+        pipe = self.redis.pipeline(transaction=True)
+        self._ensure_group(pipe, chat_id)
+        pipe.hset(self._key("link_domains", chat_id), mapping=dict.fromkeys(domains, int(allowed)))
+        pipe.execute()
+
+    def remove_link_domains(self, chat_id, domains):
+        self.redis.hdel(self._key("link_domains", chat_id), *domains)
+
+    def get_link_domains(self, chat_id):
+        return {(domain.decode() if isinstance(domain, bytes) else domain): int(allowed) == 1
+                for domain, allowed in sorted(self.redis.hgetall(self._key("link_domains", chat_id)).items())}
+
+    def add_global_ban(self, user_id, chat_id, reason):
+        self.redis.hsetnx(
+            self._key("global_bans"), user_id, json.dumps({'chat_id': chat_id, 'reason': reason, 'time': int(time.time())})
+        )
+
+    def remove_global_ban(self, user_id):
+        self.redis.hdel(self._key("global_bans"), user_id)
+
+    def is_globally_banned(self, user_id):
+        return bool(self.redis.hexists(self._key("global_bans"), user_id))
+
+    def get_global_ban_ids(self):
+        return [int(user_id) for user_id in self.redis.hkeys(self._key("global_bans"))]
+
+    def add_spam_image(self, image_hash, chat_id, user_id):
+        self.redis.hsetnx(
+            self._key("spam_images"), format(image_hash, '016x'),
+            json.dumps({'chat_id': chat_id, 'user_id': user_id, 'time': int(time.time())})
+        )
+
+    def remove_spam_image(self, image_hash):
+        self.redis.hdel(self._key("spam_images"), format(image_hash, '016x'))
+
+    def get_spam_images(self):
+        return sorted(int(image_hash, 16) for image_hash in self.redis.hkeys(self._key("spam_images")))
+
+    def get_duplicate_candidates(self, band_keys, since):
+        pipe = self.redis.pipeline(transaction=False)
+        for band_key in band_keys:
+            pipe.zrangebyscore(self._key("dup_band", band_key), since, "+inf")
+        campaign_ids = list(dict.fromkeys(
+            campaign_id.decode() if isinstance(campaign_id, bytes) else campaign_id
+            for members in pipe.execute() for campaign_id in members
+        ))
+        if not campaign_ids:
+            return []
+        signatures = self.redis.mget([self._key("dup_sig", campaign_id) for campaign_id in campaign_ids])
+        return [
+            (campaign_id, tuple(json.loads(signature)))
+            for campaign_id, signature in zip(campaign_ids, signatures) if signature is not None
+        ]
+
+    def record_duplicate(self, campaign_id, signature, band_keys, chat_id, now, window):
+        ttl = int(window) + 1
+        chats_key = self._key("dup_chats", campaign_id)
+        pipe = self.redis.pipeline(transaction=True)
+        # Подпись остаётся от первого сообщения рассылки, продлевается только срок
+        pipe.set(self._key("dup_sig", campaign_id), json.dumps(signature), nx=True)
+        pipe.expire(self._key("dup_sig", campaign_id), ttl)
+        for band_key in band_keys:
+            band = self._key("dup_band", band_key)
+            pipe.zadd(band, {campaign_id: now})
+            pipe.zremrangebyscore(band, "-inf", now - window)
+            pipe.expire(band, ttl)
+        pipe.zadd(chats_key, {chat_id: now})
+        pipe.zremrangebyscore(chats_key, "-inf", now - window)
+        pipe.zcard(chats_key)
+        pipe.expire(chats_key, ttl)
+        return pipe.execute()[-2]
+
+    def update_admins(self, chat_id, admin_ids):
+        pipe = self.redis.pipeline(transaction=True)
+        self._ensure_group(pipe, chat_id)
+        pipe.delete(self._key("admins", chat_id))
+        if admin_ids:
+            pipe.sadd(self._key("admins", chat_id), *admin_ids)
+        pipe.execute()
+
+    def get_admins(self, chat_id):
+        return self._ints(self.redis.smembers(self._key("admins", chat_id)))
+
+    def add_warning(self, chat_id, user_id):
+        pipe = self.redis.pipeline()
+        self._ensure_group(pipe, chat_id)
+        pipe.hincrby(self._key("warnings", chat_id), user_id, 1)
+        return int(pipe.execute()[-1])
+
+    def reset_warnings(self, chat_id, user_id):
+        self.redis.hdel(self._key("warnings", chat_id), user_id)
+
+    def add_report(self, chat_id, reporter_id, reported_user_id, reason, message_id):
+        report_id = self.redis.incr(self._key("reports_seq"))
+        now = time.time()
+        report = json.dumps({
+            'id': report_id, 'reporter_id': reporter_id, 'reason': reason,
+            'message_id': message_id, 'timestamp': now
+        })
+        pipe = self.redis.pipeline()
+        self._ensure_group(pipe, chat_id)
+        pipe.zadd(self._key("reports", chat_id, reported_user_id), {report: now})
+        pipe.sadd(self._key("report_users", chat_id), reported_user_id)
+        pipe.sadd(self._key("report_keys"), f"{chat_id}:{reported_user_id}")
+        pipe.execute()
+
+    def count_user_reports(self, chat_id, user_id, window_seconds, include_archive=False):
+        since = time.time() - window_seconds
+        keys = [self._key("reports", chat_id, user_id)]
+        if include_archive:
+            keys.append(self._key("reports_archive", chat_id, user_id))
+        return sum(self.redis.zcount(key, since, "+inf") for key in keys)
+
+    def archive_reports(self, batch_size=DB_CLEANUP_BATCH_SIZE, retention_days=REPORTS_RETENTION_DAYS):
+        """Переносит жалобы старше срока хранения в архивные zset."""
+        cutoff = time.time() - retention_days * 24 * 60 * 60
+        moved = 0
+        for member in self.redis.srandmember(self._key("report_keys"), batch_size) or []:
+            chat_id, user_id = (member.decode() if isinstance(member, bytes) else member).split(":")
+            key = self._key("reports", chat_id, user_id)
+            expired = self.redis.zrangebyscore(key, "-inf", cutoff, withscores=True)
+            if not expired:
+                continue
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.zadd(self._key("reports_archive", chat_id, user_id), dict(expired))
+            pipe.zremrangebyscore(key, "-inf", cutoff)
+            pipe.execute()
+            moved += len(expired)
+        return moved
+
+    def set_report_chat(self, chat_id, log_chat_id):
+        old_log_chat_id = self.redis.get(self._key("report_chat", chat_id))
+        pipe = self.redis.pipeline(transaction=True)
+        self._ensure_group(pipe, chat_id)
+        if old_log_chat_id is not None:
+            pipe.srem(self._key("log_chat", int(old_log_chat_id)), chat_id)
+        pipe.set(self._key("report_chat", chat_id), log_chat_id)
+        pipe.sadd(self._key("log_chat", log_chat_id), chat_id)
+        pipe.execute()
+
+    def get_report_chat(self, chat_id):
+        log_chat_id = self.redis.get(self._key("report_chat", chat_id))
+        return int(log_chat_id) if log_chat_id is not None else None
+
+    def is_report_chat(self, chat_id):
+        return self.redis.scard(self._key("log_chat", chat_id)) > 0
+
+    def save_welcome_message(self, user_id, message_id):
+        # Срок хранения задаётся TTL ключа, фоновая очистка не нужна
+        self.redis.set(self._key("welcome", user_id), message_id, ex=WELCOME_MESSAGE_TTL_DAYS * 24 * 60 * 60)
+
+    def get_welcome_message(self, user_id):
+        message_id = self.redis.get(self._key("welcome", user_id))
+        return int(message_id) if message_id is not None else None
+
+    def add_scheduled_deletion(self, chat_id, message_id, due_at):
+        self.redis.zadd(self._key("deletions"), {f"{chat_id}:{message_id}": due_at})
+
+    def remove_scheduled_deletion(self, chat_id, message_id):
+        return self.redis.zrem(self._key("deletions"), f"{chat_id}:{message_id}") > 0
+
+    def pop_due_deletions(self, now, limit):
+        key = self._key("deletions")
+        members = self.redis.zrangebyscore(key, "-inf", now, start=0, num=limit)
+        if not members:
+            return []
+        pipe = self.redis.pipeline()
+        for member in members:
+            pipe.zrem(key, member)
+        due = []
+        # Удаление забирает тот процесс, чей ZREM вернул 1
+        for member, removed in zip(members, pipe.execute()):
+            if removed:
+                chat_id, message_id = (member.decode() if isinstance(member, bytes) else member).split(":")
+                due.append((int(chat_id), int(message_id)))
+        return due
+
+    def next_deletion_due(self):
+        first = self.redis.zrange(self._key("deletions"), 0, 0, withscores=True)
+        return first[0][1] if first else None
+
+    def save_raid_lockdown(self, chat_id, until, joined):
+        self.redis.hset(self._key("raid_lockdowns"), chat_id, json.dumps({'until': until, 'joined': joined}))
+
+    def remove_raid_lockdown(self, chat_id):
+        self.redis.hdel(self._key("raid_lockdowns"), chat_id)
+
+    def get_raid_lockdowns(self):
+        lockdowns = []
+        for chat_id, value in self.redis.hgetall(self._key("raid_lockdowns")).items():
+            entry = json.loads(value)
+            lockdowns.append((int(chat_id), entry['until'], entry['joined']))
+        return lockdowns
+
+    def publish_invalidation(self, kind, chat_id):
+        try:
+            self.redis.publish(self._key("invalidate"), f"{kind}:{chat_id}")
+        except Exception as e:
+            logger.error(f"Ошибка публикации инвалидации {kind} для {chat_id}: {e}")
+
+    def subscribe_invalidations(self, callback):
+        def handle(message):
+            data = message['data']
+            kind, chat_id = (data.decode() if isinstance(data, bytes) else data).rsplit(":", 1)
+            callback(kind, int(chat_id))
+
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self._key("invalidate"): handle})
+        self._pubsub_thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+        logger.info("Подписка на инвалидации кэша запущена")
+
+    def close(self):
+        super().close()
+        if self._pubsub_thread:
+            self._pubsub_thread.stop()
+            self._pubsub_thread = None
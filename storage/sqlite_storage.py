@@ -0,0 +1,766 @@
+import sqlite3
+import json
+import logging
+import threading
+import time
+from config import (
+    DEFAULT_SETTINGS, DB_CLEANUP_BATCH_SIZE, WELCOME_MESSAGE_TTL_DAYS, REPORTS_ARCHIVE_DB, REPORTS_RETENTION_DAYS,
+    DUPLICATE_WINDOW_SECONDS
+)
+from storage.base import Storage
+
+logger = logging.getLogger(__name__)
+
+# Версия схемы хранится в PRAGMA user_version
+SCHEMA_VERSION = 2
+
+# Переключатели, появившиеся после версии 1 и включённые по умолчанию. Группам,
+# созданным раньше, они дописываются выключенными: новый фильтр в уже
+# работающей группе включает её администратор
+BACKFILLED_SETTINGS = ('flood_filter', 'spam_filter')
+
+# Таблицы, строки которых принадлежат группе и удаляются вместе с ней
+CASCADE_TABLES = (
+    'admins', 'warnings', 'reports', 'chat_members', 'report_chats', 'captcha_status', 'banned_words', 'link_domains'
+)
+
+TABLES = {
+    'groups': """
+        CREATE TABLE IF NOT EXISTS groups (
+            chat_id INTEGER PRIMARY KEY,
+            settings TEXT DEFAULT '{}',
+            info_rules TEXT DEFAULT 'Здравствуйте, пока!'
+        )
+    """.format(json.dumps(DEFAULT_SETTINGS).replace('"', '\\"')),
+    'admins': """
+        CREATE TABLE IF NOT EXISTS admins (
+            chat_id INTEGER REFERENCES groups (chat_id) ON DELETE CASCADE,
+            user_id INTEGER,
+            PRIMARY KEY (chat_id, user_id)
+        )
+    """,
+    'warnings': """
+        CREATE TABLE IF NOT EXISTS warnings (
+            chat_id INTEGER REFERENCES groups (chat_id) ON DELETE CASCADE,
+            user_id INTEGER,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (chat_id, user_id)
+        )
+    """,
+    'reports': """
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER REFERENCES groups (chat_id) ON DELETE CASCADE,
+            reporter_id INTEGER,
+            reported_user_id INTEGER,
+            reason TEXT,
+            message_id INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    'welcome_messages': """
+        CREATE TABLE IF NOT EXISTS welcome_messages (
+            user_id INTEGER PRIMARY KEY,
+            message_id INTEGER,
+            updated_at TIMESTAMP
+        )
+    """,
+    'chat_members': """
+        CREATE TABLE IF NOT EXISTS chat_members (
+            chat_id INTEGER REFERENCES groups (chat_id) ON DELETE CASCADE,
+            user_id INTEGER,
+            PRIMARY KEY (chat_id, user_id)
+        )
+    """,
+    'report_chats': """
+        CREATE TABLE IF NOT EXISTS report_chats (
+            chat_id INTEGER PRIMARY KEY REFERENCES groups (chat_id) ON DELETE CASCADE,
+            log_chat_id INTEGER
+        )
+    """,
+    'scheduled_deletions': """
+        CREATE TABLE IF NOT EXISTS scheduled_deletions (
+            chat_id INTEGER,
+            message_id INTEGER,
+            due_at REAL,
+            PRIMARY KEY (chat_id, message_id)
+        )
+    """,
+    # until - unix time окончания блокировки, joined - вступившие за время блокировки
+    'raid_lockdowns': """
+        CREATE TABLE IF NOT EXISTS raid_lockdowns (
+            chat_id INTEGER PRIMARY KEY,
+            until REAL,
+            joined INTEGER
+        )
+    """,
+    # Рассылки одного текста по многим чатам; строки старше окна удаляет cleanup_stale_rows
+    'duplicate_campaigns': """
+        CREATE TABLE IF NOT EXISTS duplicate_campaigns (
+            campaign_id TEXT PRIMARY KEY,
+            signature TEXT,
+            seen_at REAL
+        )
+    """,
+    'duplicate_bands': """
+        CREATE TABLE IF NOT EXISTS duplicate_bands (
+            band_key TEXT,
+            campaign_id TEXT,
+            seen_at REAL,
+            PRIMARY KEY (band_key, campaign_id)
+        )
+    """,
+    'duplicate_chats': """
+        CREATE TABLE IF NOT EXISTS duplicate_chats (
+            campaign_id TEXT,
+            chat_id INTEGER,
+            seen_at REAL,
+            PRIMARY KEY (campaign_id, chat_id)
+        )
+    """,
+    'captcha_status': """
+        CREATE TABLE IF NOT EXISTS captcha_status (
+            chat_id INTEGER REFERENCES groups (chat_id) ON DELETE CASCADE,
+            user_id INTEGER,
+            passed INTEGER DEFAULT 0,
+            PRIMARY KEY (chat_id, user_id)
+        )
+    """,
+    'banned_words': """
+        CREATE TABLE IF NOT EXISTS banned_words (
+            chat_id INTEGER REFERENCES groups (chat_id) ON DELETE CASCADE,
+            word TEXT,
+            PRIMARY KEY (chat_id, word)
+        )
+    """,
+    'link_domains': """
+        CREATE TABLE IF NOT EXISTS link_domains (
+            chat_id INTEGER REFERENCES groups (chat_id) ON DELETE CASCADE,
+            domain TEXT,
+            allowed INTEGER,
+            PRIMARY KEY (chat_id, domain)
+        )
+    """,
+    # Не привязан к группе: запись остаётся после удаления бота из группы, где был бан
+    'global_bans': """
+        CREATE TABLE IF NOT EXISTS global_bans (
+            user_id INTEGER PRIMARY KEY,
+            chat_id INTEGER,
+            reason TEXT,
+            banned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    # Хеш хранится в hex: 64-битное беззнаковое число не помещается в INTEGER
+    'spam_images': """
+        CREATE TABLE IF NOT EXISTS spam_images (
+            image_hash TEXT PRIMARY KEY,
+            chat_id INTEGER,
+            added_by INTEGER,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+}
+
+INDEXES = [
+    # Покрывает выборки по группе и подсчёт жалоб на пользователя за период
+    "CREATE INDEX IF NOT EXISTS idx_reports_chat_user_time ON reports (chat_id, reported_user_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_reports_user_time ON reports (reported_user_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_reports_timestamp ON reports (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_scheduled_deletions_due ON scheduled_deletions (due_at)",
+]
+
+# Архив жалоб старше срока хранения; подключается через ATTACH как схема archive
+ARCHIVE_TABLES = [
+    """
+        CREATE TABLE IF NOT EXISTS archive.reports (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER,
+            reporter_id INTEGER,
+            reported_user_id INTEGER,
+            reason TEXT,
+            message_id INTEGER,
+            timestamp TIMESTAMP
+        )
+    """,
+    "CREATE INDEX IF NOT EXISTS archive.idx_reports_chat_user_time ON reports (chat_id, reported_user_id, timestamp)",
+]
+
+# Выборка самых старых жалоб за пределами срока хранения
+EXPIRED_REPORTS = """
+    SELECT id FROM main.reports WHERE timestamp < datetime('now', ?) ORDER BY timestamp, id LIMIT ?
+"""
+
+class SQLiteStorage(Storage):
+    def __init__(self, db_name="bot.db", archive_name=REPORTS_ARCHIVE_DB):
+        """Инициализация соединения с базой данных."""
+        super().__init__()
+        self.db_name = db_name
+        self.archive_name = archive_name
+        # Одно соединение используется всеми потоками бота, поэтому запросы сериализуются
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_name, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        # WAL позволяет нескольким процессам-обработчикам читать базу, пока один пишет
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.cursor = self.conn.cursor()
+        self.init_db()
+        logger.info("Database connection initialized")
+
+    def init_db(self):
+        """Инициализация всех таблиц в базе данных."""
+        try:
+            with self.lock:
+                version = self.cursor.execute("PRAGMA user_version").fetchone()[0]
+                if version < 1:
+                    self._migrate_schema()
+                for ddl in TABLES.values():
+                    self.cursor.execute(ddl)
+                if version < 2:
+                    self._backfill_settings()
+                for ddl in INDEXES:
+                    self.cursor.execute(ddl)
+                if self.archive_name:
+                    self.cursor.execute("ATTACH DATABASE ? AS archive", (self.archive_name,))
+                    for ddl in ARCHIVE_TABLES:
+                        self.cursor.execute(ddl)
+                self.conn.commit()
+            logger.info("All tables initialized successfully")
+
+        except sqlite3.Error as e:
+            logger.error(f"Database initialization error: {e}")
+            raise
+
+    def _migrate_schema(self):
+        """Перестраивает таблицы старой схемы под внешние ключи с каскадным удалением."""
+        self.conn.execute("PRAGMA foreign_keys = OFF")
+        try:
+            existing = {row['name'] for row in self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for table in CASCADE_TABLES:
+                if table not in existing or self.cursor.execute(f"PRAGMA foreign_key_list({table})").fetchall():
+                    continue
+                columns = ", ".join(row['name'] for row in self.cursor.execute(f"PRAGMA table_info({table})"))
+                self.cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+                self.cursor.execute(TABLES[table])
+                self.cursor.execute(f"""
+                    INSERT OR IGNORE INTO {table} ({columns})
+                    SELECT {columns} FROM {table}_old WHERE chat_id IN (SELECT chat_id FROM groups)
+                """)
+                self.cursor.execute(f"DROP TABLE {table}_old")
+                logger.info(f"Таблица {table} перестроена с внешним ключом на groups")
+            if 'welcome_messages' in existing:
+                columns = {row['name'] for row in self.cursor.execute("PRAGMA table_info(welcome_messages)")}
+                if 'updated_at' not in columns:
+                    self.cursor.execute("ALTER TABLE welcome_messages ADD COLUMN updated_at TIMESTAMP")
+                    self.cursor.execute("UPDATE welcome_messages SET updated_at = CURRENT_TIMESTAMP")
+            self.cursor.execute("PRAGMA user_version = 1")
+            self.conn.commit()
+        finally:
+            self.conn.execute("PRAGMA foreign_keys = ON")
+        if self.cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # Режим incremental вступает в силу только после полного VACUUM
+            self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.conn.execute("VACUUM")
+        logger.info("Схема базы данных обновлена до версии 1")
+
+    def _backfill_settings(self):
+        """Дописывает выключенные BACKFILLED_SETTINGS в настройки существующих групп."""
+        updated = 0
+        for row in self.cursor.execute("SELECT chat_id, settings FROM groups").fetchall():
+            settings = json.loads(row['settings'] or '{}')
+            missing = [key for key in BACKFILLED_SETTINGS if key not in settings]
+            if missing:
+                settings.update(dict.fromkeys(missing, False))
+                self.cursor.execute("UPDATE groups SET settings = ? WHERE chat_id = ?", (json.dumps(settings), row['chat_id']))
+                updated += 1
+        self.cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        logger.info(f"Схема базы данных обновлена до версии {SCHEMA_VERSION}, настройки дополнены у {updated} групп")
+
+    def close(self):
+        """Закрытие соединения с базой данных."""
+        super().close()
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+            logger.info("Database connection closed")
+
+    def _ensure_group(self, chat_id):
+        """Создаёт строку группы, на которую ссылаются внешние ключи дочерних таблиц."""
+        self.cursor.execute("INSERT OR IGNORE INTO groups (chat_id, settings) VALUES (?, ?)", (chat_id, json.dumps(DEFAULT_SETTINGS)))
+
+    def add_chat_member(self, chat_id, user_id):
+        """Добавление участника чата."""
+        try:
+            with self.lock:
+                self._ensure_group(chat_id)
+                self.cursor.execute("INSERT OR IGNORE INTO chat_members (chat_id, user_id) VALUES (?, ?)", (chat_id, user_id))
+                self.cursor.execute("INSERT OR IGNORE INTO captcha_status (chat_id, user_id, passed) VALUES (?, ?, 0)", (chat_id, user_id))
+                self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error adding chat member: {e}")
+
+    def remove_chat_member(self, chat_id, user_id):
+        """Удаление участника чата."""
+        try:
+            with self.lock:
+                self.cursor.execute("DELETE FROM chat_members WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+                self.cursor.execute("DELETE FROM captcha_status WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+                self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error removing chat member: {e}")
+
+    def get_chat_members(self, chat_id):
+        """Получение списка участников чата."""
+        try:
+            with self.lock:
+                self.cursor.execute("SELECT user_id FROM chat_members WHERE chat_id = ?", (chat_id,))
+                return [row['user_id'] for row in self.cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Error getting chat members: {e}")
+            return []
+
+    def add_group(self, chat_id):
+        """Добавление новой группы."""
+        try:
+            with self.lock:
+                self._ensure_group(chat_id)
+                self.conn.commit()
+            logger.info(f"Группа {chat_id} добавлена с настройками: {DEFAULT_SETTINGS}")
+        except sqlite3.Error as e:
+            logger.error(f"Error adding group {chat_id}: {e}")
+
+    def purge_group(self, chat_id):
+        """Удаляет все данные группы одной транзакцией (дочерние строки удаляются каскадно)."""
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("DELETE FROM report_chats WHERE log_chat_id = ?", (chat_id,))
+                self.conn.execute("DELETE FROM groups WHERE chat_id = ?", (chat_id,))
+                self.conn.execute("DELETE FROM scheduled_deletions WHERE chat_id = ?", (chat_id,))
+                self.conn.execute("DELETE FROM raid_lockdowns WHERE chat_id = ?", (chat_id,))
+                if self.archive_name:
+                    self.conn.execute("DELETE FROM archive.reports WHERE chat_id = ?", (chat_id,))
+            logger.info(f"Данные группы {chat_id} удалены из базы")
+        except sqlite3.Error as e:
+            logger.error(f"Error purging group {chat_id}: {e}")
+
+    def mark_members_passed(self, chat_id, user_ids):
+        """Помечает участников группы как прошедших капчу."""
+        with self.lock:
+            self._ensure_group(chat_id)
+            for user_id in user_ids:
+                self.cursor.execute("""
+                    INSERT OR REPLACE INTO chat_members (chat_id, user_id)
+                    VALUES (?, ?)
+                """, (chat_id, user_id))
+                self.cursor.execute("""
+                    INSERT OR REPLACE INTO captcha_status (chat_id, user_id, passed)
+                    VALUES (?, ?, 1)
+                """, (chat_id, user_id))
+            self.conn.commit()
+
+    def get_all_groups(self):
+        """Получение списка всех групп."""
+        with self.lock:
+            self.cursor.execute("SELECT chat_id FROM groups")
+            return [row['chat_id'] for row in self.cursor.fetchall()]
+
+    def update_admins(self, chat_id, admin_ids):
+        """Обновление списка администраторов."""
+        with self.lock:
+            self._ensure_group(chat_id)
+            self.cursor.execute("DELETE FROM admins WHERE chat_id = ?", (chat_id,))
+            for admin_id in admin_ids:
+                self.cursor.execute("INSERT OR IGNORE INTO admins (chat_id, user_id) VALUES (?, ?)", (chat_id, admin_id))
+            self.conn.commit()
+
+    def get_admins(self, chat_id):
+        """Получение списка администраторов группы."""
+        with self.lock:
+            self.cursor.execute("SELECT user_id FROM admins WHERE chat_id = ?", (chat_id,))
+            return [row['user_id'] for row in self.cursor.fetchall()]
+
+    def add_warning(self, chat_id, user_id):
+        """Добавление предупреждения пользователю."""
+        with self.lock:
+            self._ensure_group(chat_id)
+            self.cursor.execute("""
+                INSERT OR REPLACE INTO warnings (chat_id, user_id, count)
+                VALUES (?, ?, COALESCE((SELECT count FROM warnings WHERE chat_id = ? AND user_id = ?), 0) + 1)
+            """, (chat_id, user_id, chat_id, user_id))
+            self.conn.commit()
+            self.cursor.execute("SELECT count FROM warnings WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+            return self.cursor.fetchone()['count']
+
+    def reset_warnings(self, chat_id, user_id):
+        """Сброс предупреждений пользователя."""
+        with self.lock:
+            self.cursor.execute("DELETE FROM warnings WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+            self.conn.commit()
+
+    def add_report(self, chat_id, reporter_id, reported_user_id, reason, message_id):
+        """Добавление репорта."""
+        with self.lock:
+            self._ensure_group(chat_id)
+            self.cursor.execute("""
+                INSERT INTO reports (chat_id, reporter_id, reported_user_id, reason, message_id)
+                VALUES (?, ?, ?, ?, ?)
+            """, (chat_id, reporter_id, reported_user_id, reason, message_id))
+            self.conn.commit()
+
+    def count_user_reports(self, chat_id, user_id, window_seconds, include_archive=False):
+        """Количество жалоб на пользователя в группе за последние window_seconds секунд."""
+        since = f"-{int(window_seconds)} seconds"
+        query = """
+            SELECT COUNT(*) FROM {}.reports
+            WHERE chat_id = ? AND reported_user_id = ? AND timestamp >= datetime('now', ?)
+        """
+        schemas = ['main', 'archive'] if include_archive and self.archive_name else ['main']
+        try:
+            with self.lock:
+                return sum(
+                    self.conn.execute(query.format(schema), (chat_id, user_id, since)).fetchone()[0]
+                    for schema in schemas
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка подсчёта жалоб на пользователя {user_id} в группе {chat_id}: {e}")
+            return 0
+
+    def archive_reports(self, batch_size=DB_CLEANUP_BATCH_SIZE, retention_days=REPORTS_RETENTION_DAYS):
+        """Переносит порцию жалоб старше срока хранения в архивную базу. Возвращает число перенесённых строк."""
+        if not self.archive_name:
+            return 0
+        params = (f"-{int(retention_days)} days", batch_size)
+        try:
+            with self.lock, self.conn:
+                moved = self.conn.execute(f"""
+                    INSERT OR REPLACE INTO archive.reports
+                    SELECT id, chat_id, reporter_id, reported_user_id, reason, message_id, timestamp
+                    FROM main.reports WHERE id IN ({EXPIRED_REPORTS})
+                """, params).rowcount
+                self.conn.execute(f"DELETE FROM main.reports WHERE id IN ({EXPIRED_REPORTS})", params)
+            return moved
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка архивации жалоб: {e}")
+            return 0
+
+    def get_group_settings(self, chat_id):
+        """Получение настроек группы."""
+        with self.lock:
+            self.cursor.execute("SELECT settings FROM groups WHERE chat_id = ?", (chat_id,))
+            row = self.cursor.fetchone()
+        return json.loads(row['settings']) if row else DEFAULT_SETTINGS
+
+    def update_group_setting(self, chat_id, setting, value):
+        """Обновление настройки группы."""
+        with self.lock:
+            settings = self.get_group_settings(chat_id)
+            settings[setting] = value
+            self.cursor.execute("UPDATE groups SET settings = ? WHERE chat_id = ?", (json.dumps(settings), chat_id))
+            self.conn.commit()
+
+    def get_info_rules(self, chat_id):
+        """Получение правил группы."""
+        with self.lock:
+            self.cursor.execute("SELECT info_rules FROM groups WHERE chat_id = ?", (chat_id,))
+            row = self.cursor.fetchone()
+        return row['info_rules'] if row else "Здравствуйте, пока!"
+
+    def update_info_rules(self, chat_id, new_rules):
+        """Обновление правил группы."""
+        with self.lock:
+            self.cursor.execute("UPDATE groups SET info_rules = ? WHERE chat_id = ?", (new_rules, chat_id))
+            self.conn.commit()
+
+    def add_banned_words(self, chat_id, words):
+        """Добавление запрещённых слов группы."""
+        with self.lock:
+            self._ensure_group(chat_id)
+            self.cursor.executemany(
+                "INSERT OR IGNORE INTO banned_words (chat_id, word) VALUES (?, ?)", [(chat_id, word) for word in words]
+            )
+            self.conn.commit()
+
+    def remove_banned_words(self, chat_id, words):
+        """Удаление запрещённых слов группы."""
+        with self.lock:
+            self.cursor.executemany(
+                "DELETE FROM banned_words WHERE chat_id = ? AND word = ?", [(chat_id, word) for word in words]
+            )
+            self.conn.commit()
+
+    def get_banned_words(self, chat_id):
+        """Получение запрещённых слов группы."""
+        with self.lock:
+            self.cursor.execute("SELECT word FROM banned_words WHERE chat_id = ? ORDER BY word", (chat_id,))
+            return [row['word'] for row in self.cursor.fetchall()]
+
+    def set_link_domains(self, chat_id, domains, allowed):
+        """Добавление доменов в список разрешённых (allowed=True) или запрещённых группы."""
+        with self.lock:
+            self._ensure_group(chat_id)
+            self.cursor.executemany(
+                "INSERT OR REPLACE INTO link_domains (chat_id, domain, allowed) VALUES (?, ?, ?)",
+                [(chat_id, domain, int(allowed)) for domain in domains]
+            )
+            self.conn.commit()
+
+    def remove_link_domains(self, chat_id, domains):
+        """Удаление доменов из списков группы."""
+        with self.lock:
+            self.cursor.executemany(
+                "DELETE FROM link_domains WHERE chat_id = ? AND domain = ?", [(chat_id, domain) for domain in domains]
+            )
+            self.conn.commit()
+
+    def get_link_domains(self, chat_id):
+        """Домены из списков группы: словарь домен -> разрешён ли."""
+        with self.lock:
+            self.cursor.execute("SELECT domain, allowed FROM link_domains WHERE chat_id = ? ORDER BY domain", (chat_id,))
+            return {row['domain']: bool(row['allowed']) for row in self.cursor.fetchall()}
+
+    def add_global_ban(self, user_id, chat_id, reason):
+        """Добавление пользователя в общий бан-лист (первый бан сохраняется)."""
+        with self.lock:
+            self.cursor.execute(
+                "INSERT OR IGNORE INTO global_bans (user_id, chat_id, reason) VALUES (?, ?, ?)", (user_id, chat_id, reason)
+            )
+            self.conn.commit()
+
+    def remove_global_ban(self, user_id):
+        """Удаление пользователя из общего бан-листа."""
+        with self.lock:
+            self.cursor.execute("DELETE FROM global_bans WHERE user_id = ?", (user_id,))
+            self.conn.commit()
+
+    def is_globally_banned(self, user_id):
+        """Есть ли пользователь в общем бан-листе."""
+        with self.lock:
+            self.cursor.execute("SELECT 1 FROM global_bans WHERE user_id = ?", (user_id,))
+            return self.cursor.fetchone() is not None
+
+    def get_global_ban_ids(self):
+        """Все id из общего бан-листа."""
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT user_id FROM global_bans")]
+
+    def add_spam_image(self, image_hash, chat_id, user_id):
+        """Добавление хеша спам-картинки."""
+        with self.lock:
+            self.cursor.execute(
+                "INSERT OR IGNORE INTO spam_images (image_hash, chat_id, added_by) VALUES (?, ?, ?)",
+                (format(image_hash, '016x'), chat_id, user_id)
+            )
+            self.conn.commit()
+
+    def remove_spam_image(self, image_hash):
+        """Удаление хеша спам-картинки."""
+        with self.lock:
+            self.cursor.execute("DELETE FROM spam_images WHERE image_hash = ?", (format(image_hash, '016x'),))
+            self.conn.commit()
+
+    def get_spam_images(self):
+        """Все хеши спам-картинок."""
+        with self.lock:
+            return [int(row[0], 16) for row in self.conn.execute("SELECT image_hash FROM spam_images ORDER BY image_hash")]
+
+    def get_duplicate_candidates(self, band_keys, since):
+        """Рассылки, встречавшиеся после since в любой из полос: [(campaign_id, подпись), ...]."""
+        placeholders = ", ".join("?" * len(band_keys))
+        with self.lock:
+            rows = self.conn.execute(f"""
+                SELECT DISTINCT c.campaign_id, c.signature FROM duplicate_bands b
+                JOIN duplicate_campaigns c ON c.campaign_id = b.campaign_id
+                WHERE b.band_key IN ({placeholders}) AND b.seen_at >= ?
+            """, (*band_keys, since)).fetchall()
+        return [(row['campaign_id'], tuple(json.loads(row['signature']))) for row in rows]
+
+    def record_duplicate(self, campaign_id, signature, band_keys, chat_id, now, window):
+        """Отмечает рассылку в чате; возвращает число чатов, где она встречалась за window секунд."""
+        with self.lock, self.conn:
+            # Подпись остаётся от первого сообщения рассылки, обновляется только время
+            self.conn.execute("""
+                INSERT INTO duplicate_campaigns (campaign_id, signature, seen_at) VALUES (?, ?, ?)
+                ON CONFLICT (campaign_id) DO UPDATE SET seen_at = excluded.seen_at
+            """, (campaign_id, json.dumps(signature), now))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO duplicate_bands (band_key, campaign_id, seen_at) VALUES (?, ?, ?)",
+                [(band_key, campaign_id, now) for band_key in band_keys]
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO duplicate_chats (campaign_id, chat_id, seen_at) VALUES (?, ?, ?)",
+                (campaign_id, chat_id, now)
+            )
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM duplicate_chats WHERE campaign_id = ? AND seen_at >= ?",
+                (campaign_id, now - window)
+            ).fetchone()[0]
+
+    def save_welcome_message(self, user_id, message_id):
+        """Сохранение приветственного сообщения."""
+        with self.lock:
+            self.cursor.execute("""
+                INSERT OR REPLACE INTO welcome_messages (user_id, message_id, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            """, (user_id, message_id))
+            self.conn.commit()
+
+    def get_welcome_message(self, user_id):
+        """Получение приветственного сообщения."""
+        with self.lock:
+            self.cursor.execute("SELECT message_id FROM welcome_messages WHERE user_id = ?", (user_id,))
+            row = self.cursor.fetchone()
+        return row['message_id'] if row else None
+
+    def set_report_chat(self, chat_id, log_chat_id):
+        """Установка чата для репортов."""
+        with self.lock:
+            self._ensure_group(chat_id)
+            self.cursor.execute("""
+                INSERT OR REPLACE INTO report_chats (chat_id, log_chat_id)
+                VALUES (?, ?)
+            """, (chat_id, log_chat_id))
+            self.conn.commit()
+
+    def get_report_chat(self, chat_id):
+        """Получение чата для репортов."""
+        with self.lock:
+            self.cursor.execute("SELECT log_chat_id FROM report_chats WHERE chat_id = ?", (chat_id,))
+            row = self.cursor.fetchone()
+        return row['log_chat_id'] if row else None
+
+    def is_report_chat(self, chat_id):
+        """Проверка, используется ли чат как группа для репортов."""
+        with self.lock:
+            self.cursor.execute("SELECT 1 FROM report_chats WHERE log_chat_id = ? LIMIT 1", (chat_id,))
+            return self.cursor.fetchone() is not None
+
+    def set_captcha_passed(self, chat_id, user_id):
+        """Установка статуса прохождения капчи."""
+        try:
+            with self.lock:
+                self._ensure_group(chat_id)
+                self.cursor.execute("""
+                    INSERT OR REPLACE INTO captcha_status (chat_id, user_id, passed)
+                    VALUES (?, ?, 1)
+                """, (chat_id, user_id))
+                self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error setting captcha status: {e}")
+
+    def has_passed_captcha(self, chat_id, user_id):
+        """Проверка статуса прохождения капчи."""
+        try:
+            with self.lock:
+                self.cursor.execute("SELECT passed FROM captcha_status WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+                row = self.cursor.fetchone()
+            return row['passed'] == 1 if row else False
+        except sqlite3.Error as e:
+            logger.error(f"Error checking captcha status: {e}")
+            return False
+
+    def add_scheduled_deletion(self, chat_id, message_id, due_at):
+        """Сохраняет отложенное удаление сообщения (due_at - unix time)."""
+        with self.lock:
+            self.cursor.execute("""
+                INSERT OR REPLACE INTO scheduled_deletions (chat_id, message_id, due_at)
+                VALUES (?, ?, ?)
+            """, (chat_id, message_id, due_at))
+            self.conn.commit()
+
+    def remove_scheduled_deletion(self, chat_id, message_id):
+        """Отменяет отложенное удаление сообщения."""
+        with self.lock:
+            self.cursor.execute("DELETE FROM scheduled_deletions WHERE chat_id = ? AND message_id = ?", (chat_id, message_id))
+            self.conn.commit()
+            return self.cursor.rowcount > 0
+
+    def pop_due_deletions(self, now, limit):
+        """Извлекает и удаляет из очереди до limit наступивших удалений: [(chat_id, message_id), ...]."""
+        try:
+            with self.lock, self.conn:
+                return [tuple(row) for row in self.conn.execute("""
+                    DELETE FROM scheduled_deletions WHERE rowid IN (
+                        SELECT rowid FROM scheduled_deletions WHERE due_at <= ? ORDER BY due_at LIMIT ?
+                    ) RETURNING chat_id, message_id
+                """, (now, limit)).fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка выборки отложенных удалений: {e}")
+            return []
+
+    def next_deletion_due(self):
+        """Время ближайшего отложенного удаления или None."""
+        with self.lock:
+            self.cursor.execute("SELECT MIN(due_at) AS due_at FROM scheduled_deletions")
+            return self.cursor.fetchone()['due_at']
+
+    def save_raid_lockdown(self, chat_id, until, joined):
+        """Сохраняет время окончания блокировки чата (unix time) и число вступивших."""
+        with self.lock:
+            self.cursor.execute("""
+                INSERT OR REPLACE INTO raid_lockdowns (chat_id, until, joined)
+                VALUES (?, ?, ?)
+            """, (chat_id, until, joined))
+            self.conn.commit()
+
+    def remove_raid_lockdown(self, chat_id):
+        """Удаляет снятую блокировку чата."""
+        with self.lock:
+            self.cursor.execute("DELETE FROM raid_lockdowns WHERE chat_id = ?", (chat_id,))
+            self.conn.commit()
+
+    def get_raid_lockdowns(self):
+        """Сохранённые блокировки: [(chat_id, until, joined), ...]."""
+        with self.lock:
+            self.cursor.execute("SELECT chat_id, until, joined FROM raid_lockdowns")
+            return [tuple(row) for row in self.cursor.fetchall()]
+
+    def cleanup_stale_rows(self, batch_size=DB_CLEANUP_BATCH_SIZE):
+        """Удаляет одну порцию устаревших строк из каждой таблицы. Возвращает число удалённых строк."""
+        queries = [
+            # Строки групп, удалённых до включения внешних ключей
+            *(f"""
+                DELETE FROM {table} WHERE rowid IN (
+                    SELECT rowid FROM {table} WHERE chat_id NOT IN (SELECT chat_id FROM groups) LIMIT ?
+                )
+            """ for table in CASCADE_TABLES),
+            # Непройденные капчи пользователей, которые уже покинули группу
+            """
+                DELETE FROM captcha_status WHERE rowid IN (
+                    SELECT c.rowid FROM captcha_status c
+                    LEFT JOIN chat_members m ON m.chat_id = c.chat_id AND m.user_id = c.user_id
+                    WHERE c.passed = 0 AND m.user_id IS NULL LIMIT ?
+                )
+            """,
+        ]
+        deleted = 0
+        try:
+            with self.lock:
+                for query in queries:
+                    deleted += self.conn.execute(query, (batch_size,)).rowcount
+                deleted += self.conn.execute("""
+                    DELETE FROM welcome_messages WHERE rowid IN (
+                        SELECT rowid FROM welcome_messages
+                        WHERE updated_at < datetime('now', ?) LIMIT ?
+                    )
+                """, (f"-{WELCOME_MESSAGE_TTL_DAYS} days", batch_size)).rowcount
+                # Рассылки, не встречавшиеся дольше окна
+                for table in ('duplicate_chats', 'duplicate_bands', 'duplicate_campaigns'):
+                    deleted += self.conn.execute(f"""
+                        DELETE FROM {table} WHERE rowid IN (
+                            SELECT rowid FROM {table} WHERE seen_at < ? LIMIT ?
+                        )
+                    """, (time.time() - DUPLICATE_WINDOW_SECONDS, batch_size)).rowcount
+                self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка очистки устаревших строк: {e}")
+        return deleted
+
+    def vacuum(self, pages=0):
+        """Возвращает свободные страницы файла базы (0 - все) и обновляет статистику планировщика."""
+        try:
+            with self.lock:
+                self.conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+                self.conn.execute("PRAGMA optimize")
+            logger.info("Выполнен incremental vacuum базы данных")
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка vacuum базы данных: {e}")
@@ -0,0 +1,219 @@
+import logging
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Listener, Client
+from config import (
+    ALLOWED_UPDATES, POLLING_TIMEOUT_SECONDS, WEBHOOK_URL, WEBHOOK_SECRET, STORAGE_BACKEND,
+    SUPERVISOR_INGRESS, SUPERVISOR_WORKERS, SUPERVISOR_SOCKET,
+    SUPERVISOR_RESTART_DELAY_SECONDS, SUPERVISOR_PENDING_LIMIT
+)
+from dispatch import update_chat_id
+
+logger = logging.getLogger(__name__)
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+def route_chat_id(update):
+    """Чат, по которому выбирается обработчик обновления.
+
+    Переключатели настроек (toggle:{setting}:{group_id}) нажимают в личке с
+    ботом, но при включении фильтра проверяются недавние сообщения группы,
+    а они есть только в памяти обработчика группы. Поэтому такие нажатия
+    передаются обработчику group_id, остальные - обработчику своего чата.
+    """
+    callback = update.callback_query
+    if callback is not None and callback.data and callback.data.startswith('toggle:'):
+        try:
+            return int(callback.data.rsplit(':', 1)[1])
+        except ValueError:
+            pass
+    return update_chat_id(update)
+
+
+def worker_for_chat(chat_id, workers):
+    """Номер обработчика, которому супервизор передаёт обновления чата."""
+    return hash(chat_id) % workers if chat_id is not None else 0
+
+
+class WorkerProcess:
+    """Процесс-обработчик одной доли чатов и его канал связи."""
+
+    def __init__(self, index):
+        self.index = index
+        self.popen = None
+        self.conn = None
+        self.lock = threading.Lock()
+        # Обновления, принятые, пока процесс перезапускается
+        self.pending = deque()
+        self.restarts = 0
+        self.restart_at = None
+        self.sent = 0
+
+
+class Supervisor:
+    """Приём обновлений в одном процессе и разбор в N процессах-обработчиках.
+
+    Обработчики - обычные процессы main.py в режиме 'worker'. Они подключаются
+    к Unix-сокету супервизора и получают обновления своих чатов (по chat_id),
+    поэтому порядок внутри чата сохраняется. Упавший обработчик перезапускается,
+    а обновления его чатов копятся в очереди до переподключения.
+    """
+
+    def __init__(self, workers=SUPERVISOR_WORKERS, address=SUPERVISOR_SOCKET):
+        self.address = address
+        self.authkey = secrets.token_bytes(32)
+        if os.path.exists(address):
+            os.unlink(address)
+        self.listener = Listener(address, family='AF_UNIX', authkey=self.authkey)
+        self.workers = [WorkerProcess(i) for i in range(workers)]
+        self._stopping = False
+
+    def start(self):
+        for worker in self.workers:
+            self._spawn(worker)
+        threading.Thread(target=self._accept_loop, name="supervisor-accept", daemon=True).start()
+        threading.Thread(target=self._monitor_loop, name="supervisor-monitor", daemon=True).start()
+        if STORAGE_BACKEND == 'sqlite':
+            logger.warning("Супервизор с SQLite: кэш настроек в процессах не инвалидируется, используйте STORAGE_BACKEND=redis")
+
+    def forward(self, update):
+        """Передаёт обновление процессу, отвечающему за его чат."""
+        chat_id = route_chat_id(update)
+        worker = self.workers[worker_for_chat(chat_id, len(self.workers))]
+        with worker.lock:
+            # Пока не доставлены отложенные, новые встают за ними, чтобы не нарушить порядок
+            if worker.conn is not None and not worker.pending:
+                try:
+                    worker.conn.send(update)
+                    worker.sent += 1
+                    return
+                except (OSError, EOFError) as e:
+                    logger.error(f"Обработчик {worker.index} недоступен: {e}")
+                    self._disconnect(worker)
+            if len(worker.pending) >= SUPERVISOR_PENDING_LIMIT:
+                dropped = worker.pending.popleft()
+                logger.warning(f"Очередь обработчика {worker.index} переполнена, обновление {dropped.update_id} отброшено")
+            worker.pending.append(update)
+
+    def metrics(self):
+        return [
+            {'index': w.index, 'alive': w.conn is not None, 'sent': w.sent, 'pending': len(w.pending), 'restarts': w.restarts}
+            for w in self.workers
+        ]
+
+    def stop(self):
+        self._stopping = True
+        for worker in self.workers:
+            with worker.lock:
+                self._disconnect(worker)
+            if worker.popen and worker.popen.poll() is None:
+                worker.popen.terminate()
+        for worker in self.workers:
+            if worker.popen:
+                worker.popen.wait()
+        self.listener.close()
+        logger.info(f"Супервизор остановлен: {self.metrics()}")
+
+    def _spawn(self, worker):
+        env = dict(
+            # Число обработчиков нужно каждому из них, чтобы взять свою долю общего лимита отправки
+            os.environ, RUNTIME_MODE='worker', WORKER_INDEX=str(worker.index), SUPERVISOR_WORKERS=str(len(self.workers)),
+            SUPERVISOR_SOCKET=self.address, SUPERVISOR_AUTHKEY=self.authkey.hex()
+        )
+        worker.popen = subprocess.Popen([sys.executable, MAIN_SCRIPT], env=env)
+        logger.info(f"Запущен обработчик {worker.index}, pid {worker.popen.pid}")
+
+    def _disconnect(self, worker):
+        if worker.conn is not None:
+            worker.conn.close()
+            worker.conn = None
+
+    def _accept_loop(self):
+        while not self._stopping:
+            try:
+                conn = self.listener.accept()
+                index = conn.recv()
+            except Exception as e:
+                if not self._stopping:
+                    logger.error(f"Ошибка подключения обработчика: {e}")
+                continue
+            worker = self.workers[index]
+            with worker.lock:
+                self._disconnect(worker)
+                try:
+                    while worker.pending:
+                        conn.send(worker.pending[0])
+                        worker.pending.popleft()
+                        worker.sent += 1
+                    worker.conn = conn
+                    logger.info(f"Обработчик {index} подключён")
+                except (OSError, EOFError) as e:
+                    logger.error(f"Обработчик {index} отключился при передаче очереди: {e}")
+                    conn.close()
+
+    def _monitor_loop(self):
+        while not self._stopping:
+            time.sleep(1)
+            for worker in self.workers:
+                if self._stopping:
+                    return
+                if worker.restart_at is not None:
+                    if time.monotonic() >= worker.restart_at:
+                        worker.restart_at = None
+                        worker.restarts += 1
+                        self._spawn(worker)
+                    continue
+                code = worker.popen.poll()
+                if code is None:
+                    continue
+                logger.error(f"Обработчик {worker.index} завершился с кодом {code}, перезапуск через {SUPERVISOR_RESTART_DELAY_SECONDS} с")
+                with worker.lock:
+                    self._disconnect(worker)
+                worker.restart_at = time.monotonic() + SUPERVISOR_RESTART_DELAY_SECONDS
+
+
+def run_supervisor(bot):
+    """Получает обновления (polling или webhook) и распределяет их по процессам-обработчикам."""
+    supervisor = Supervisor()
+    supervisor.start()
+    try:
+        if SUPERVISOR_INGRESS == 'webhook':
+            from webhook import WebhookServer
+            server = WebhookServer(supervisor.forward)
+            if WEBHOOK_URL:
+                bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=ALLOWED_UPDATES)
+                logger.info(f"Webhook установлен: {WEBHOOK_URL}")
+            server.serve_forever()
+            return
+        offset = None
+        logger.info(f"Супервизор запущен, обработчиков: {len(supervisor.workers)}")
+        while True:
+            try:
+                for update in bot.get_updates(
+                    offset=offset, timeout=POLLING_TIMEOUT_SECONDS,
+                    allowed_updates=ALLOWED_UPDATES, long_polling_timeout=POLLING_TIMEOUT_SECONDS
+                ):
+                    supervisor.forward(update)
+                    offset = update.update_id + 1
+            except Exception as e:
+                logger.error(f"Ошибка получения обновлений: {e}")
+                time.sleep(5)
+    finally:
+        supervisor.stop()
+
+
+def connect_worker():
+    """Подключает процесс-обработчик к супервизору; возвращает соединение и номер обработчика."""
+    index = int(os.environ['WORKER_INDEX'])
+    conn = Client(
+        os.environ['SUPERVISOR_SOCKET'], family='AF_UNIX',
+        authkey=bytes.fromhex(os.environ['SUPERVISOR_AUTHKEY'])
+    )
+    conn.send(index)
+    return conn, index
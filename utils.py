@@ -1,32 +1,54 @@
 from telebot import types
 import logging
 from config import BOT_INVITE_URL, MESSAGE_LIFETIME_SECONDS
-from model.predict import predict_toxicity
-from threading import Timer
+from model.predict import predict_toxicity, predict_toxicity_batch
+from deletion_queue import get_deletion_queue
+from member_cache import member_cache
 
 logger = logging.getLogger(__name__)
 
-def delete_message_after_delay(bot, chat_id, message_id, db):
-    """Удаляет сообщение через заданное время, если чат не является группой для репортов."""
+def delete_message_after_delay(bot, chat_id, message_id, db, delay=MESSAGE_LIFETIME_SECONDS):
+    """Удаляет сообщение через заданное время, если чат не является группой для репортов.
+
+    Удаление сохраняется в базе и выполняется пачкой вместе с остальными
+    удалениями этого чата, даже если бот за это время перезапустится.
+    """
     try:
-        db.cursor.execute("SELECT chat_id FROM report_chats WHERE log_chat_id = ?", (chat_id,))
-        if db.cursor.fetchone():
+        if db.is_report_chat(chat_id):
             logger.info(f"Сообщение {message_id} в чате {chat_id} не удаляется, так как это группа для репортов")
             return
-        def delete():
-            try:
-                bot.delete_message(chat_id, message_id)
-                logger.info(f"Сообщение {message_id} удалено в чате {chat_id}")
-            except Exception as e:
-                logger.error(f"Ошибка удаления сообщения {message_id} в чате {chat_id}: {e}")
-        Timer(MESSAGE_LIFETIME_SECONDS, delete).start()
+        get_deletion_queue(bot, db).add(chat_id, message_id, delay)
     except Exception as e:
         logger.error(f"Ошибка в планировании удаления сообщения {message_id} в чате {chat_id}: {e}")
 
-def get_username(bot, chat_id, user_id):
-    """Возвращает username или упоминание пользователя"""
+def send_notice(bot, db, chat_id, text, **kwargs):
+    """Отправляет косметическое уведомление с автоудалением.
+
+    Через RateLimitedBot уведомление уходит в низкую полосу и может быть
+    отброшено при перегрузке; обработчик не ждёт его отправки.
+    """
+    def schedule(message):
+        delete_message_after_delay(bot, chat_id, message.message_id, db)
+
+    if hasattr(bot, 'notify'):
+        bot.notify(chat_id, text, callback=schedule, **kwargs)
+    else:
+        schedule(bot.send_message(chat_id, text, **kwargs))
+
+def get_username(bot, chat_id, user_id, user=None):
+    """Возвращает username или упоминание пользователя.
+
+    Пользователь берётся из аргумента user или из кэша участников; к Bot API
+    обращаемся только при промахе.
+    """
     try:
-        user = bot.get_chat_member(chat_id, user_id).user
+        if user is not None:
+            member_cache.remember(user)
+        else:
+            user = member_cache.get(user_id)
+        if user is None:
+            user = bot.get_chat_member(chat_id, user_id).user
+            member_cache.remember(user)
         if user.username:
             return f"@{user.username}"
         return f'<a href="tg://user?id={user_id}">{user.first_name}</a>'
@@ -84,6 +106,14 @@ def check_message(text):
         logger.error(f"Ошибка в predict_toxicity для текста '{text}': {e}")
         return {"is_toxic": False, "label": 0}
 
+def check_messages(texts, batch_size=32):
+    """Проверяет список сообщений на токсичность пачками. Возвращает список флагов is_toxic."""
+    try:
+        return [result == 1 for result in predict_toxicity_batch(texts, batch_size)]
+    except Exception as e:
+        logger.error(f"Ошибка в predict_toxicity_batch для {len(texts)} текстов: {e}")
+        return [False] * len(texts)
+
 def unrestrict_user(bot, chat_id: int, user_id: int):
     """Восстанавливает права конкретному пользователю"""
     try:
@@ -0,0 +1,99 @@
+import hmac
+import logging
+import sys
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot import types
+from config import (
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBHOOK_ENQUEUE_TIMEOUT_SECONDS, WEBHOOK_MAX_BODY_BYTES
+)
+from dispatch import ShardedDispatcher
+
+logger = logging.getLogger(__name__)
+
+
+def make_request_handler(updates, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET):
+    class WebhookRequestHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != path:
+                self.send_response(404)
+                self.end_headers()
+                return
+            token = self.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+            if not hmac.compare_digest(token, secret):
+                logger.warning(f"Webhook: неверный secret token от {self.client_address[0]}")
+                self.send_response(403)
+                self.end_headers()
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            if length <= 0 or length > WEBHOOK_MAX_BODY_BYTES:
+                self.send_response(413 if length else 400)
+                self.end_headers()
+                return
+            try:
+                update = types.Update.de_json(self.rfile.read(length).decode('utf-8'))
+            except (ValueError, KeyError) as e:
+                logger.error(f"Webhook: некорректное обновление: {e}")
+                self.send_response(400)
+                self.end_headers()
+                return
+            # Если очередь чата занята дольше таймаута, Telegram повторит доставку после 503
+            self.send_response(200 if updates.put(update, WEBHOOK_ENQUEUE_TIMEOUT_SECONDS) else 503)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            logger.debug(f"Webhook {self.client_address[0]}: {format % args}")
+
+    return WebhookRequestHandler
+
+
+class WebhookServer:
+    """Встроенный HTTP-сервер, принимающий обновления Telegram в очереди чатов.
+
+    Без WEBHOOK_SECRET сервер не запускается: иначе любой, кто знает адрес,
+    может прислать поддельные обновления (например, callback от имени админа).
+    """
+
+    def __init__(self, process, host=WEBHOOK_HOST, port=WEBHOOK_PORT, secret=WEBHOOK_SECRET):
+        if not secret:
+            raise ValueError("WEBHOOK_SECRET не задан: webhook-сервер не может проверить, что обновления пришли от Telegram")
+        self.updates = ShardedDispatcher(process)
+        self.httpd = ThreadingHTTPServer((host, port), make_request_handler(self.updates, secret=secret))
+
+    def serve_forever(self):
+        self.updates.start()
+        logger.info(f"Webhook-сервер слушает {self.httpd.server_address[0]}:{self.httpd.server_address[1]}{WEBHOOK_PATH}")
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            self.updates.stop()
+            logger.info(f"Webhook-сервер остановлен: {self.updates.metrics()}")
+
+    def shutdown(self):
+        self.httpd.shutdown()
+
+
+def replay_updates(path, url=None, secret=WEBHOOK_SECRET):
+    """Отправляет записанные обновления (JSON по одному на строку) на локальный webhook."""
+    url = url or f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}"
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            request = urllib.request.Request(
+                url, data=line.strip().encode('utf-8'), method='POST',
+                headers={'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': secret or ''}
+            )
+            try:
+                with urllib.request.urlopen(request) as response:
+                    print(response.status)
+            except urllib.error.HTTPError as e:
+                print(e.code)
+
+
+if __name__ == '__main__':
+    # python webhook.py updates.jsonl [url]
+    replay_updates(*sys.argv[1:3])